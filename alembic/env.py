@@ -13,6 +13,7 @@ from sqlalchemy import engine_from_config, pool
 
 from alembic import context
 from db.db import metadata
+from use_cases_calc.shared_cache import metadata as results_metadata
 
 load_dotenv()
 
@@ -35,7 +36,7 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 
 
-target_metadata = metadata
+target_metadata = [metadata, results_metadata]
 
 # target_metadata = None
 
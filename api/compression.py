@@ -0,0 +1,356 @@
+"""
+Compression module for the responses of the API.
+
+This module contains the following classes:
+    * StreamCompressor: compressor of a response, chunk by chunk
+    * CompressionStats: bytes saved and cpu time spent by the compression
+    * CompressionMiddleware: middleware that compresses the responses
+"""
+
+import os
+import threading
+import time
+import zlib
+
+import anyio
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+load_dotenv()
+
+# default compression level of each encoding
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+# media types that are already compressed
+COMPRESSED_TYPES = (
+    "application/vnd.apache.parquet",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "image/",
+    "video/",
+    "audio/",
+)
+
+
+def available_encodings():
+    """
+    available_encodings: encodings that can be used, by the installed packages
+
+    Returns:
+        list: the encodings, in order of preference
+    """
+    installed = {"zstd": zstandard is not None, "br": brotli is not None, "gzip": True}
+    return [encoding for encoding in DEFAULT_LEVELS if installed[encoding]]
+
+
+class StreamCompressor:
+    """
+    StreamCompressor class for compress a response chunk by chunk. Each chunk is
+    flushed, so streamed responses are not delayed by the compression.
+
+    This class has the following methods:
+        * compress: compress a chunk of the response
+    """
+
+    def __init__(self, encoding: str, level: int):
+        """
+        StreamCompressor class constructor
+
+        Args:
+            encoding (str): zstd, br or gzip
+            level (int): compression level
+        """
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(
+                level, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, final: bool):
+        """
+        compress: compress a chunk of the response
+
+        Args:
+            data (bytes): the chunk
+            final (bool): if it is the last chunk of the response
+
+        Returns:
+            bytes: the compressed chunk
+        """
+        if self.encoding == "gzip":
+            mode = zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+            return self._compressor.compress(data) + self._compressor.flush(mode)
+        if self.encoding == "br":
+            compressed = self._compressor.process(data)
+            end = self._compressor.finish() if final else self._compressor.flush()
+            return compressed + end
+        mode = (
+            zstandard.COMPRESSOBJ_FLUSH_FINISH
+            if final
+            else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+        return self._compressor.compress(data) + self._compressor.flush(mode)
+
+
+class CompressionStats:
+    """
+    CompressionStats class for keep the bytes saved and the cpu time spent by the
+    compression of each encoding, so the levels can be chosen by real traffic
+
+    This class has the following methods:
+        * add: add a compressed chunk to the statistics
+        * skip: count a response that was not compressed
+        * stats: statistics of each encoding
+    """
+
+    def __init__(self):
+        """
+        CompressionStats class constructor
+        """
+        self._lock = threading.Lock()
+        self._encodings = {}
+        self._skipped = 0
+
+    def add(self, encoding: str, size: int, compressed_size: int, cpu_time: float):
+        """
+        add: add a compressed chunk to the statistics
+
+        Args:
+            encoding (str): encoding of the chunk
+            size (int): size of the chunk, in bytes
+            compressed_size (int): size of the compressed chunk, in bytes
+            cpu_time (float): cpu time of the compression, in seconds
+        """
+        with self._lock:
+            stats = self._encodings.setdefault(
+                encoding, {"chunks": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0}
+            )
+            stats["chunks"] += 1
+            stats["bytes_in"] += size
+            stats["bytes_out"] += compressed_size
+            stats["cpu_seconds"] += cpu_time
+
+    def skip(self):
+        """
+        skip: count a response that was not compressed
+        """
+        with self._lock:
+            self._skipped += 1
+
+    def stats(self):
+        """
+        stats: statistics of each encoding
+
+        Returns:
+            dict: bytes in and out, bytes saved, ratio and cpu time of each encoding
+        """
+        with self._lock:
+            encodings = {}
+            for encoding, stats in self._encodings.items():
+                saved = stats["bytes_in"] - stats["bytes_out"]
+                encodings[encoding] = dict(
+                    stats,
+                    bytes_saved=saved,
+                    ratio=stats["bytes_out"] / stats["bytes_in"]
+                    if stats["bytes_in"]
+                    else 1.0,
+                    mb_saved_per_cpu_second=saved / 1e6 / stats["cpu_seconds"]
+                    if stats["cpu_seconds"]
+                    else None,
+                )
+            return {"encodings": encodings, "skipped": self._skipped}
+
+
+compression_stats = CompressionStats()
+
+
+class CompressionMiddleware:
+    """
+    CompressionMiddleware class for compress the responses with zstd, brotli or
+    gzip, by the Accept-Encoding header of the request. Small responses, responses
+    that already have an encoding and already compressed formats are not
+    compressed. Large bodies are compressed on a worker thread, so the event loop
+    is not blocked. The strong ETag of a compressed response is sent as weak, as
+    its bytes are not the bytes of the response. The options can be set by the ENV variables:
+    - COMPRESSION_MIN_SIZE: minimum size of the responses to compress (1024)
+    - COMPRESSION_ENCODINGS: encodings, in order of preference (zstd,br,gzip).
+      An empty value disables the compression. zstd and br are only used if the
+      packages zstandard and brotli are installed.
+    - COMPRESSION_LEVELS: levels of the encodings, like zstd:3,br:4,gzip:6
+    - COMPRESSION_THREAD_SIZE: minimum size of the bodies compressed on a worker
+      thread (262144)
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = None,
+        encodings: list = None,
+        levels: dict = None,
+        thread_size: int = None,
+        stats: CompressionStats = None,
+    ):
+        """
+        CompressionMiddleware class constructor
+
+        Args:
+            app (ASGIApp): the application
+            minimum_size (int, optional): minimum size of the responses to
+                compress. Defaults to None.
+            encodings (list, optional): encodings, in order of preference.
+                Defaults to None.
+            levels (dict, optional): level of each encoding. Defaults to None.
+            thread_size (int, optional): minimum size of the bodies compressed on
+                a worker thread. Defaults to None.
+            stats (CompressionStats, optional): statistics of the compression.
+                Defaults to None.
+        """
+        self.app = app
+        if minimum_size is None:
+            minimum_size = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+        if encodings is None:
+            encodings = os.environ.get("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+            encodings = [item.strip() for item in encodings.split(",") if item.strip()]
+        if levels is None:
+            levels = dict(
+                (name.strip(), int(level))
+                for name, level in (
+                    item.split(":")
+                    for item in os.environ.get("COMPRESSION_LEVELS", "").split(",")
+                    if item.strip()
+                )
+            )
+        if thread_size is None:
+            thread_size = int(os.environ.get("COMPRESSION_THREAD_SIZE", 262144))
+        self.minimum_size = minimum_size
+        self.encodings = [item for item in encodings if item in available_encodings()]
+        self.levels = dict(DEFAULT_LEVELS, **levels)
+        self.thread_size = thread_size
+        self.stats = stats or compression_stats
+
+    def choose_encoding(self, accept_encoding: str):
+        """
+        choose_encoding: encoding of the response, by the Accept-Encoding header
+
+        Args:
+            accept_encoding (str): the Accept-Encoding header of the request
+
+        Returns:
+            str: the encoding, or None if the response should not be compressed
+        """
+        accepted = {}
+        for item in accept_encoding.split(","):
+            name, _, params = item.strip().partition(";")
+            quality = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[name.strip().lower()] = quality
+        for encoding in self.encodings:
+            if accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        encoding = self.choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self._start = None
+        self._compressor = None
+        self._passthrough = False
+
+    def _compress(self, data: bytes, final: bool):
+        start = time.thread_time()
+        compressed = self._compressor.compress(data, final)
+        self.middleware.stats.add(
+            self.encoding, len(data), len(compressed), time.thread_time() - start
+        )
+        return compressed
+
+    async def compress(self, data: bytes, final: bool):
+        if len(data) >= self.middleware.thread_size:
+            return await anyio.to_thread.run_sync(self._compress, data, final)
+        return self._compress(data, final)
+
+    def should_compress(self, body: bytes, more_body: bool):
+        headers = Headers(raw=self._start["headers"])
+        media_type = headers.get("content-type", "")
+        if (
+            self._start["status"] in (204, 206, 304)
+            or "content-encoding" in headers
+            or media_type.startswith(COMPRESSED_TYPES)
+        ):
+            return False
+        return more_body or len(body) >= self.middleware.minimum_size
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self._start = message
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self._compressor is None:
+            if not self.should_compress(body, more_body):
+                self._passthrough = True
+                self.middleware.stats.skip()
+                await self._send(self._start)
+                await self._send(message)
+                return
+            self._compressor = StreamCompressor(
+                self.encoding, self.middleware.levels[self.encoding]
+            )
+            body = await self.compress(body, not more_body)
+            headers = MutableHeaders(raw=self._start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await self._send(self._start)
+            await self._send(
+                {"type": "http.response.body", "body": body, "more_body": more_body}
+            )
+            return
+
+        body = await self.compress(body, not more_body)
+        await self._send(
+            {"type": "http.response.body", "body": body, "more_body": more_body}
+        )
@@ -1,3 +1,4 @@
+# pylint: disable=redefined-builtin
 """
 FastAPI module that represent the root of the API
 
@@ -6,12 +7,34 @@ This module imports the following routes and endpoints:
 This module contains the following functions:
     * docs: Open the documentation of the API
     * test: A simple test that the API is working.
+    * compression: statistics of the compression of the responses
+    * metrics: metrics of the API in the Prometheus text format
+    * get_profile: report of a profiled request
 """
 
-from fastapi import FastAPI
+from typing import Annotated, Optional
+
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
 
+from api.compression import CompressionMiddleware, compression_stats
+from api.metrics import MetricsMiddleware
+from api.profiling import ProfilingMiddleware, authorized, profiles
 from api.v1 import calc, data, user
+from use_cases_calc.admission import admission
+from use_cases_calc.dataset_store import datasets
+from use_cases_calc.get_bucket import fetch_flights, file_cache
+from use_cases_calc.metrics import (
+    add_admission_collectors,
+    add_cache_collectors,
+    add_flight_collectors,
+    add_tier_collectors,
+    registry,
+)
+from use_cases_calc.tracing import configure_logging
+
+configure_logging()
 
 # app = FastAPI(title="Haig Fras Digital Twin API", docs_url=None)
 app = FastAPI(title="Haig Fras Digital Twin API")
@@ -22,6 +45,20 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
     allow_credentials=True,
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing", "X-Profile-Id"],
+)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+caches = {"calc": calc.calc_cache, "page": data.page_cache, "dataset": datasets}
+if calc.shared_cache.url:
+    caches["shared"] = calc.shared_cache
+add_cache_collectors(caches)
+add_tier_collectors({"file": file_cache})
+add_admission_collectors(admission)
+add_flight_collectors(
+    {"calc": calc.calc_flights, "frame": data.frame_flights, "fetch": fetch_flights}
 )
 
 
@@ -48,9 +85,88 @@ def test():
     return {"API": "I'm alive"}
 
 
+@app.get("/compression")
+def compression():
+    """
+    compression: statistics of the compression of the responses
+
+    Returns:
+        dict: bytes in and out, bytes saved, ratio and cpu time of each encoding,
+            and the number of responses that were not compressed
+    """
+
+    return compression_stats.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    metrics: metrics of the API in the Prometheus text format. They have the
+    latency of the requests by route and by calc type, the time spent on each
+    stage (fetch, parse, merge, clip, calc and serialize), the hit ratio of the
+    caches, the bytes downloaded from the object store and the memory of the
+    process.
+
+    Returns:
+        PlainTextResponse: the metrics
+    """
+
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 #######################
 # V1
 #######################
 app.include_router(user.router, prefix="/v1/user", tags=["user"])
 app.include_router(data.router, prefix="/v1/data", tags=["data"])
 app.include_router(calc.router, prefix="/v1/calc", tags=["calc"])
+
+
+@app.get("/profiles/{profile_id}")
+def get_profile(
+    profile_id: str,
+    format: Optional[str] = "json",
+    x_profile_token: Annotated[Optional[str], Header()] = None,
+):
+    """
+    get_profile: report of a profiled request. The requests are profiled with
+    the query parameter profile=true (or the header X-Profile: true) and the
+    header X-Profile-Token, and the id of the report is returned on the header
+    X-Profile-Id.
+
+    Args:
+        profile_id (str): id of the report
+        format (Optional(str)): json (the functions with the largest cumulative
+            time, the peak memory and the largest allocations), text (the call
+            tree written by pstats) or pstats (the profile, for tools like
+            snakeviz or flameprof). Default is json.
+        x_profile_token (Optional(str)): the value of the ENV variable
+            PROFILE_TOKEN
+
+    Raises:
+        HTTPException: 403 if the token is not valid, 404 if the report does
+            not exist or it expired and 400 if the format is not valid
+
+    Returns:
+        json_data: the report on the chosen format
+    """
+    if not authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="Profiling not allowed")
+    profile = profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "json":
+        return profile.report()
+    if format == "text":
+        return PlainTextResponse(profile.text())
+    if format == "pstats":
+        return Response(
+            profile.dump(),
+            media_type="application/octet-stream",
+            headers={
+                "Content-Disposition": f'attachment; filename="{profile_id}.pstats"'
+            },
+        )
+    raise HTTPException(status_code=400, detail="format should be json, text or pstats")
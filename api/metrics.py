@@ -0,0 +1,91 @@
+"""
+Metrics module for the requests of the API.
+
+This module contains the following classes and functions:
+    * MetricsMiddleware: middleware that records the latency of the requests
+    * method_label: label of the method of a request
+    * route_path: path of the route that matched a request
+"""
+
+import time
+
+from use_cases_calc.metrics import metrics_enabled, request_latency
+
+# methods of the requests with their own label in the metrics
+METHODS = ("GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS")
+
+
+class MetricsMiddleware:
+    """
+    MetricsMiddleware class for record the latency of the requests by method,
+    route and status. The route is the path of the matched route, like
+    /v1/calc/jobs/{job_id}, and the unknown methods are labeled as other, so the
+    number of labels is limited. Streamed
+    responses are measured until their last chunk.
+    """
+
+    def __init__(self, app, enabled: bool = None):
+        """
+        MetricsMiddleware class constructor
+
+        Args:
+            app (ASGIApp): the application
+            enabled (bool, optional): record the latency of the requests. Defaults
+                to the ENV variable METRICS.
+        """
+        self.app = app
+        self.enabled = metrics_enabled() if enabled is None else enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            request_latency.observe(
+                time.perf_counter() - start,
+                (method_label(scope["method"]), route_path(scope), str(status[0])),
+            )
+
+
+def method_label(method: str):
+    """
+    method_label: label of the method of a request in the metrics. The methods
+    that are not known are labeled as other, so the requests can not create new
+    series of the metrics.
+
+    Args:
+        method (str): the method of the request
+
+    Returns:
+        str: the method, or 'other'
+    """
+    return method if method in METHODS else "other"
+
+
+def route_path(scope: dict):
+    """
+    route_path: path of the route that matched a request, with the prefix of its
+    router, like /v1/calc/jobs/{job_id}
+
+    Args:
+        scope (dict): the scope of the request
+
+    Returns:
+        str: the path, or 'unmatched' if no route matched the request
+    """
+    # the routes of the included routers do not have the prefix on newer FastAPI
+    route = scope.get("fastapi", {}).get("effective_route_context")
+    if route is None:
+        route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
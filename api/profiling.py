@@ -0,0 +1,125 @@
+"""
+Profiling module for the requests of the API.
+
+This module contains the following classes and functions:
+    * ProfilingMiddleware: middleware that profiles the requests that ask for it
+    * authorized: check the profiling token of a request
+    * requested: if a request asks to be profiled
+"""
+
+import hmac
+import os
+import threading
+from urllib.parse import parse_qs
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+
+from use_cases_calc.profiling import RequestProfile, current_profile
+from use_cases_calc.result_cache import ResultCache
+
+load_dotenv()
+
+# reports of the profiled requests, by profile id
+profiles = ResultCache(
+    max_entries=int(os.environ.get("PROFILE_KEEP", 16)),
+    ttl=float(os.environ.get("PROFILE_TTL", 3600)),
+)
+
+
+def authorized(token: str):
+    """
+    authorized: check the profiling token of a request. The profiling is
+    disabled if the ENV variable PROFILE_TOKEN is not set.
+
+    Args:
+        token (str): the X-Profile-Token header of the request
+
+    Returns:
+        bool: True if the token is the PROFILE_TOKEN
+    """
+    expected = os.environ.get("PROFILE_TOKEN")
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token.encode(), expected.encode())
+
+
+class ProfilingMiddleware:
+    """
+    ProfilingMiddleware class for profile the requests with the query parameter
+    profile=true or the header X-Profile: true, and the header X-Profile-Token
+    with the value of the ENV variable PROFILE_TOKEN. The endpoints of the data
+    and calc routers run under cProfile and tracemalloc, and the response has
+    the header X-Profile-Id of the report, that can be downloaded from
+    /profiles/{profile_id}. Only one request is profiled at a time. If
+    PROFILE_TOKEN is not set, the requests are not checked.
+    """
+
+    def __init__(self, app):
+        """
+        ProfilingMiddleware class constructor
+
+        Args:
+            app (ASGIApp): the application
+        """
+        self.app = app
+        self._lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not os.environ.get("PROFILE_TOKEN")
+            or not requested(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        if not authorized(headers.get("x-profile-token")):
+            response = JSONResponse(
+                {"detail": "Profiling not allowed"}, status_code=403
+            )
+            await response(scope, receive, send)
+            return
+        if not self._lock.acquire(blocking=False):
+            response = JSONResponse(
+                {"detail": "Another request is being profiled"},
+                status_code=409,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+
+        async def send_profile(message):
+            if message["type"] == "http.response.start" and profile.seconds is not None:
+                profiles.set(profile.id, profile)
+                MutableHeaders(scope=message)["X-Profile-Id"] = profile.id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profile)
+        finally:
+            current_profile.reset(token)
+            self._lock.release()
+
+
+def requested(scope: dict):
+    """
+    requested: if a request asks to be profiled, by the query parameter profile
+    or the header X-Profile
+
+    Args:
+        scope (dict): the scope of the request
+
+    Returns:
+        bool: True if the request asks to be profiled
+    """
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get(
+        "profile", []
+    )
+    values.append(Headers(scope=scope).get("x-profile", ""))
+    return any(value.lower() in ("1", "true", "yes") for value in values)
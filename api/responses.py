@@ -0,0 +1,234 @@
+"""
+Responses module for the routers of the API.
+
+This module contains the following classes and functions:
+    * FastJSONResponse: json response serialized by orjson
+    * FastJSONRoute: route that returns the results of the endpoints as FastJSONResponse
+    * new_trace: trace of a request, if it is traced or its stages are recorded
+    * to_response: convert the result of an endpoint to FastJSONResponse
+    * set_headers: headers to add to the response of the current request
+    * cache_headers: ETag and Cache-Control headers of a response
+    * not_modified: 304 response, if the ETag matches the If-None-Match header
+    * admitted: run a request inside the memory budget of the admission control
+"""
+
+import functools
+import inspect
+import os
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+
+from use_cases_calc.admission import AdmissionRejected, admission
+from use_cases_calc.metrics import metrics_enabled, stage_latency
+from use_cases_calc.profiling import current_profile
+from use_cases_calc.serializers import dumps
+from use_cases_calc.tracing import (
+    NULL_SPAN,
+    Trace,
+    current_trace,
+    logger,
+    span,
+    tracing_enabled,
+)
+
+load_dotenv()
+
+# headers added by the endpoints to the response of the current request
+response_headers = ContextVar("response_headers", default=None)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    FastJSONResponse: json response serialized by orjson, with numpy values,
+    NaN (as null) and timestamps
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+class FastJSONRoute(APIRoute):
+    """
+    FastJSONRoute: route that returns the results of the endpoints as
+    FastJSONResponse. FastAPI would walk every value of the results with
+    jsonable_encoder before serializing them, which is slower than the
+    serialization itself for large frames. The endpoints are not changed, so they
+    still return python objects when they are called directly. The headers set by
+    the endpoints with set_headers are added to the responses. If the ENV
+    variable TRACING is true, the stages of the requests are returned on the
+    Server-Timing header (streamed bodies are serialized after it). The time of
+    the stages is recorded on the metrics if the ENV variable METRICS is true.
+    The endpoint and the serialization run under the profile of the request, if
+    the request is profiled (see ProfilingMiddleware).
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+
+            @functools.wraps(endpoint)
+            async def fast_endpoint(*args, **params):
+                token = response_headers.set({})
+                trace_token = current_trace.set(new_trace())
+                try:
+                    with current_profile.get() or NULL_SPAN:
+                        return self.finish(await endpoint(*args, **params))
+                finally:
+                    current_trace.reset(trace_token)
+                    response_headers.reset(token)
+
+        else:
+
+            @functools.wraps(endpoint)
+            def fast_endpoint(*args, **params):
+                token = response_headers.set({})
+                trace_token = current_trace.set(new_trace())
+                try:
+                    with current_profile.get() or NULL_SPAN:
+                        return self.finish(endpoint(*args, **params))
+                finally:
+                    current_trace.reset(trace_token)
+                    response_headers.reset(token)
+
+        kwargs.setdefault("response_class", FastJSONResponse)
+        super().__init__(path, fast_endpoint, **kwargs)
+
+    def finish(self, content):
+        """
+        finish: convert the result of the endpoint to a response, with the
+        headers set by the endpoint and the Server-Timing of the trace
+
+        Args:
+            content (object): the result of the endpoint
+
+        Returns:
+            Response: the response
+        """
+        with span("serialize"):
+            response = to_response(content, self.status_code)
+        response.headers.update(response_headers.get())
+        trace = current_trace.get()
+        if trace is not None:
+            for name, (_, seconds) in trace.stages.items():
+                stage_latency.observe(seconds, (name,))
+            if tracing_enabled():
+                response.headers["Server-Timing"] = trace.server_timing()
+                logger.info("%s %s", self.path, trace.timings())
+        return response
+
+
+def new_trace():
+    """
+    new_trace: trace of a request, if the request is traced (ENV variable
+    TRACING) or the time of its stages is recorded on the metrics (METRICS)
+
+    Returns:
+        Trace: the trace, or None
+    """
+    if tracing_enabled() or metrics_enabled():
+        return Trace()
+    return None
+
+
+def to_response(content, status_code: int = None):
+    """
+    to_response: convert the result of an endpoint to FastJSONResponse
+
+    Args:
+        content (object): the result of the endpoint
+        status_code (int, optional): status code of the route. Defaults to None.
+
+    Returns:
+        Response: the response
+    """
+    if isinstance(content, Response):
+        return content
+    return FastJSONResponse(content, status_code=status_code or 200)
+
+
+def set_headers(headers: dict):
+    """
+    set_headers: headers to add to the response of the current request. It does
+    nothing if the endpoint is called directly or outside of a request.
+
+    Args:
+        headers (dict): the headers
+    """
+    current = response_headers.get()
+    if current is not None:
+        current.update(headers)
+
+
+def cache_headers(etag: str, vary: str = None):
+    """
+    cache_headers: ETag and Cache-Control headers of a response. The time that
+    the clients can keep the response without validating it can be set by the
+    ENV variable CACHE_MAX_AGE, in seconds (60).
+
+    Args:
+        etag (str): the strong ETag of the response, with quotes
+        vary (str, optional): request headers that choose the response, like
+            Accept, so the shared caches keep a response for each of them.
+            Defaults to None.
+
+    Returns:
+        dict: the headers
+    """
+    max_age = int(os.environ.get("CACHE_MAX_AGE", 60))
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def not_modified(if_none_match: str, etag: str, vary: str = None):
+    """
+    not_modified: 304 response, if the ETag matches the If-None-Match header
+
+    Args:
+        if_none_match (str): If-None-Match header of the request
+        etag (str): the strong ETag of the response, with quotes
+        vary (str, optional): request headers that choose the response.
+            Defaults to None.
+
+    Returns:
+        Response: the 304 response, or None if the ETag does not match
+    """
+    if not if_none_match or not etag:
+        return None
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in tags or etag in tags or f"W/{etag}" in tags:
+        return Response(status_code=304, headers=cache_headers(etag, vary))
+    return None
+
+
+def admitted(cost: int, function, *args, **kwargs):
+    """
+    admitted: run the heavy work of a request inside the memory budget of the
+    admission control, waiting for the budget if the request is heavy
+
+    Args:
+        cost (int): the cost of the request, estimated by admission.estimate
+        function (callable): the work of the request
+        *args: arguments of the function
+        **kwargs: keyword arguments of the function
+
+    Raises:
+        HTTPException: 503, with a Retry-After header, if the request could not
+        be admitted before its deadline
+
+    Returns:
+        the result of the function
+    """
+    try:
+        with admission.admit(cost):
+            return function(*args, **kwargs)
+    except AdmissionRejected as error:
+        raise HTTPException(
+            status_code=503,
+            detail=str(error),
+            headers={"Retry-After": str(error.retry_after)},
+        ) from error
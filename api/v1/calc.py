@@ -4,15 +4,338 @@ Router module for calc entrypoints.
 
 This router contains the following functions:
     * calc_results: function for open and merge files and applied some calculation
+    * calc_batch: function for open and merge files once and applied several calculations
+    * calc_label: label of the calc types of a request in the metrics
+    * cache_stats: hits, misses and size of the cache of calc results
+    * pool_stats: processes and calculations running on the pool of calculations
+    * admission_stats: memory and requests of the admission control
+    * create_job: start a calculation on the background and return its job
+    * jobs_stats: number of jobs of the background calculations by status
+    * get_job: status and progress of a job
+    * get_job_result: result of a finished job
 """
 
-from typing import Optional
+import os
+import time
+from typing import Annotated, Optional
 
-from fastapi import APIRouter
+from dotenv import load_dotenv
+from fastapi import APIRouter, Header, HTTPException
 
+from api.responses import (
+    FastJSONRoute,
+    admitted,
+    cache_headers,
+    not_modified,
+    set_headers,
+)
+from schemas.schemas import CalcBatch, CalcSpec
+from use_cases_calc.admission import admission
+from use_cases_calc.aggregates import MaterializedAggregates
+from use_cases_calc.calc_planner import STEP_REQUIRES
+from use_cases_calc.calc_pool import CalcPool, PoolBusy
 from use_cases_calc.get_bucket import GetBucket
+from use_cases_calc.job_store import JobStore, JobStoreFull
+from use_cases_calc.metrics import calc_latency
+from use_cases_calc.request_key import normalize_params, request_hash
+from use_cases_calc.result_cache import ResultCache
+from use_cases_calc.shared_cache import SharedResultCache
+from use_cases_calc.single_flight import SingleFlight
 
-router = APIRouter()
+load_dotenv()
+
+router = APIRouter(route_class=FastJSONRoute)
+
+calc_cache = ResultCache()
+# results shared by the instances of the API, on the database
+shared_cache = SharedResultCache()
+aggregates = MaterializedAggregates()
+calc_pool = CalcPool()
+calc_jobs = JobStore()
+# calculations running, shared by the concurrent requests of the same key
+calc_flights = SingleFlight()
+
+# maximum number of calculations of a batch
+BATCH_SIZE = int(os.environ.get("CALC_BATCH_SIZE", 20))
+
+# parameters that define the data of a calculation, before it is clipped
+DATASET_PARAMS = ("filenames", "extension", "columns", "drop_columns")
+
+
+def calculate(
+    spec: dict, progress=lambda fraction, stage: None, if_none_match: str = None
+):
+    """
+    calculate: open the files of a calc spec and apply the calculations. The
+    results come from the cache, the aggregate tables or the pool of calculations.
+    If the versions of the files are known, the response has a strong ETag of
+    the request and the versions.
+
+    Args:
+      spec (dict): the parameters of calc_results
+      progress (callable, optional): function called with the fraction of the
+        calculation that is done (from 0 to 1) and the current stage.
+        Defaults to a function that does nothing.
+      if_none_match (str, optional): If-None-Match header of the request. If it
+        matches the ETag, a 304 response is returned without any calculation.
+        Defaults to None.
+
+    Raises:
+      HTTPException: 503 if the pool of calculations is full, or if there is no
+        memory for the calculation before the deadline
+
+    Returns:
+      json_data: a json structure with the calculation results
+    """
+    start = time.perf_counter()
+    try:
+        return _calculate(spec, progress, if_none_match)
+    finally:
+        calc_latency.observe(time.perf_counter() - start, (calc_label(spec["calc"]),))
+
+
+def calc_label(calc: str):
+    """
+    calc_label: label of the calc types of a request in the metrics. The types
+    that are not known are labeled as other, so the requests can not create new
+    series of the metrics.
+
+    Args:
+      calc (str): types of calculation, separated by comma
+
+    Returns:
+      str: the sorted calc types, separated by comma
+    """
+    calc_types = {
+        calc_type if calc_type in STEP_REQUIRES else "other"
+        for calc_type in calc.split(",")
+    }
+    return ",".join(sorted(calc_types))
+
+
+def _calculate(spec: dict, progress, if_none_match: str):
+    data = GetBucket()
+    calc_columns = spec["calc_columns"].split(",")
+
+    params = normalize_params(**spec)
+    progress(0.05, "checking versions")
+    versions = data.get_versions(
+        [f"{file}.{spec['extension']}" for file in params["filenames"]]
+    )
+    key = None
+    dataset = version = None
+    if all(version["version"] for version in versions.values()):
+        key = request_hash(params, versions)
+        response = not_modified(if_none_match, f'"{key}"')
+        if response is not None:
+            return response
+        set_headers(cache_headers(f'"{key}"'))
+        version = request_hash(None, versions)
+        result = _cached(key, params, version)
+        if result is not None:
+            return result
+        if not params["bbox"]:
+            dataset = request_hash({name: params[name] for name in DATASET_PARAMS})
+            result = aggregates.answer(
+                dataset, version, spec["calc"], calc_columns, spec["agg_columns"]
+            )
+            if result is not None:
+                _store(key, params, version, result)
+                return result
+
+    compute_args = (data, spec, calc_columns, dataset, version, key, progress)
+    cost = admission.estimate(versions)
+    if key:
+        # the concurrent requests of the same calculation share one run
+        return calc_flights.do(key, admitted, cost, _compute, *compute_args)
+    return admitted(cost, _compute, *compute_args)
+
+
+def _compute(
+    data: GetBucket,
+    spec: dict,
+    calc_columns: list,
+    dataset: str,
+    version: str,
+    key: str,
+    progress,
+):
+    progress(0.1, "loading files")
+    df = _load(data, spec, calc_columns, dataset, version)
+
+    progress(0.5, "calculating")
+    result = _run(
+        df,
+        [
+            {
+                "calc": spec["calc"],
+                "calc_columns": calc_columns,
+                "agg_columns": spec["agg_columns"],
+                "all_columns": spec["all_columns"],
+            }
+        ],
+    )[0]
+
+    if key:
+        _store(key, normalize_params(**spec), version, result)
+    return result
+
+
+def _cached(key: str, params: dict, version: str):
+    # the results of this instance, and then the results shared on the database
+    result = calc_cache.get(key)
+    if result is None:
+        result = shared_cache.get(request_hash(params), version)
+        if result is not None:
+            calc_cache.set(key, result)
+    return result
+
+
+def _store(key: str, params: dict, version: str, result):
+    calc_cache.set(key, result)
+    shared_cache.set(request_hash(params), version, result)
+
+
+def _load(data: GetBucket, spec: dict, calc_columns: list, dataset: str, version: str):
+    data.get(
+        filenames=spec["filenames"],
+        extension=spec["extension"],
+        columns=spec["columns"],
+        drop_columns=spec["drop_columns"].split(","),
+        bbox=spec["bbox"],
+        crs=spec["crs"],
+        lat_lon_columns=spec["lat_lon_columns"].split(","),
+    )
+    if dataset:
+        aggregates.refresh(dataset, version, data.df, calc_columns)
+    return data.df
+
+
+def _run(df, specs: list):
+    try:
+        return calc_pool.run_many(df, specs)
+    except PoolBusy as error:
+        raise HTTPException(
+            status_code=503, detail=str(error), headers={"Retry-After": "1"}
+        ) from error
+
+
+def calculate_batch(batch: dict, if_none_match: str = None):
+    """
+    calculate_batch: run a batch of calculations on the same files. The files
+    are loaded and clipped once, and the calculations that are not cached run
+    on the same frame.
+
+    Args:
+      batch (dict): the parameters of the files and the calculations, like
+        CalcBatch
+      if_none_match (str, optional): If-None-Match header of the request
+
+    Raises:
+      HTTPException: 400 if the number of calculations is not valid or the names
+        are repeated, and 503 if the pool of calculations is full or if there
+        is no memory for the calculations before the deadline
+
+    Returns:
+      dict: the results of the calculations by name, or a 304 response
+    """
+    batch = dict(batch)
+    calcs = [dict(item) for item in batch.pop("calcs")]
+    if not 0 < len(calcs) <= BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"A batch should have between 1 and {BATCH_SIZE} calculations",
+        )
+    names = [item.pop("name") or str(index) for index, item in enumerate(calcs)]
+    if len(set(names)) != len(names):
+        raise HTTPException(status_code=400, detail="The names should be unique")
+    specs = {name: {**batch, **item} for name, item in zip(names, calcs)}
+
+    data = GetBucket()
+    params = normalize_params(**batch)
+    versions = data.get_versions(
+        [f"{file}.{batch['extension']}" for file in params["filenames"]]
+    )
+    results = {}
+    keys = {}
+    dataset = version = None
+    if all(version["version"] for version in versions.values()):
+        spec_params = {name: normalize_params(**spec) for name, spec in specs.items()}
+        keys = {name: request_hash(spec_params[name], versions) for name in names}
+        etag = request_hash({"calcs": [[name, keys[name]] for name in names]})
+        response = not_modified(if_none_match, f'"{etag}"')
+        if response is not None:
+            return response
+        set_headers(cache_headers(f'"{etag}"'))
+        version = request_hash(None, versions)
+        if not params["bbox"]:
+            dataset = request_hash({name: params[name] for name in DATASET_PARAMS})
+        for name, spec in specs.items():
+            result = _cached(keys[name], spec_params[name], version)
+            if result is None and dataset:
+                result = aggregates.answer(
+                    dataset,
+                    version,
+                    spec["calc"],
+                    spec["calc_columns"].split(","),
+                    spec["agg_columns"],
+                )
+                if result is not None:
+                    _store(keys[name], spec_params[name], version, result)
+            if result is not None:
+                results[name] = result
+
+    pending = [name for name in names if name not in results]
+    if pending:
+        pending_keys = [keys.get(name) for name in pending]
+        compute_args = (
+            data,
+            batch,
+            [specs[name] for name in pending],
+            dataset,
+            version,
+            pending_keys,
+        )
+        cost = admission.estimate(versions)
+        if keys:
+            # the concurrent batches with the same calculations share one run
+            computed = calc_flights.do(
+                tuple(pending_keys), admitted, cost, _compute_batch, *compute_args
+            )
+        else:
+            computed = admitted(cost, _compute_batch, *compute_args)
+        results.update(zip(pending, computed))
+    return {name: results[name] for name in names}
+
+
+def _compute_batch(
+    data: GetBucket, batch: dict, specs: list, dataset: str, version: str, keys: list
+):
+    calc_columns = sorted(
+        {
+            column
+            for spec in specs
+            for column in spec["calc_columns"].split(",")
+            if column
+        }
+    )
+    df = _load(data, batch, calc_columns, dataset, version)
+    results = _run(
+        df,
+        [
+            {
+                "calc": spec["calc"],
+                "calc_columns": spec["calc_columns"].split(","),
+                "agg_columns": spec["agg_columns"],
+                "all_columns": spec["all_columns"],
+            }
+            for spec in specs
+        ],
+    )
+    for key, spec, result in zip(keys, specs, results):
+        if key:
+            _store(key, normalize_params(**spec), version, result)
+    return results
 
 
 @router.get("/")
@@ -29,6 +352,7 @@ def calc_results(
     agg_columns: Optional[str] = None,
     exclude_index: Optional[bool] = False,
     all_columns: Optional[bool] = False,
+    if_none_match: Annotated[Optional[str], Header()] = None,
 ):
     """
     calc_results: function for open and merge files and applied some calculation
@@ -78,27 +402,196 @@ def calc_results(
 
     all_columns (Optional(bool)): return all columns from the file
 
+    if_none_match (Optional(str)): If-None-Match header of the request
+
+    The results are cached by the normalized parameters and the versions of the
+    files on the object store, so a repeated request does not load the files.
+    When the ENV variable RESULTS_CACHE_URL is set, the results are saved on
+    that database too, and they are shared by all the instances of the API.
+    Requests without bbox of agg, organism, biodiversity1 and biodiversity2
+    calculations are answered by the aggregate tables of the files, when they exist.
+    The other calculations run on the pool of calculations. The responses have a
+    strong ETag, and a request with a matching If-None-Match header is answered
+    with 304 before loading the files. The calculations that load large files
+    wait for the memory budget of the admission control (see /v1/calc/admission).
+
+    Raises:
+      HTTPException: 503 if the pool of calculations is full, or if there is no
+        memory for the calculation before the deadline (with a Retry-After header)
+
     Returns:
       json_data: a json structure with the calculation results
     """
 
-    data = GetBucket()
-    data.get(
-        filenames=filenames,
-        extension=extension,
-        columns=columns,
-        drop_columns=drop_columns.split(","),
-        bbox=bbox,
-        crs=crs,
-        lat_lon_columns=lat_lon_columns.split(","),
+    return calculate(
+        {
+            "filenames": filenames,
+            "extension": extension,
+            "calc": calc,
+            "calc_columns": calc_columns,
+            "columns": columns,
+            "drop_columns": drop_columns,
+            "bbox": bbox,
+            "crs": crs,
+            "lat_lon_columns": lat_lon_columns,
+            "agg_columns": agg_columns,
+            "exclude_index": exclude_index,
+            "all_columns": all_columns,
+        },
+        if_none_match=if_none_match,
     )
 
-    data.do_calc(
-        calc=calc,
-        calc_columns=calc_columns.split(","),
-        agg_columns=agg_columns,
-        exclude_index=exclude_index,
-        all_columns=all_columns,
-    )
 
-    return data.result
+@router.post("/batch")
+def calc_batch(
+    batch: CalcBatch,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+):
+    """
+    calc_batch: function for open and merge files once and applied several
+    calculations on them
+
+    Args:
+      batch (CalcBatch): the parameters of the files, like the parameters of
+        calc_results, and the list of calculations (calcs). Each calculation has
+        the calc, calc_columns, agg_columns, exclude_index and all_columns
+        parameters of calc_results, and a name, that is the key of its result
+        (default: its position in the list). The number of calculations can be
+        set by the ENV variable CALC_BATCH_SIZE (20).
+
+      if_none_match (Optional(str)): If-None-Match header of the request
+
+    The results are cached like the results of calc_results, so a batch and
+    the single requests of the same calculations share the cache. The response
+    has a strong ETag of the results of the batch.
+
+    Raises:
+      HTTPException: 400 if the number of calculations is not valid or the names
+        are repeated, and 503 if the pool of calculations is full or if there
+        is no memory for the calculations before the deadline
+
+    Returns:
+      json_data: the results of the calculations, by name
+    """
+    return calculate_batch(batch, if_none_match=if_none_match)
+
+
+@router.get("/cache")
+def cache_stats():
+    """
+    cache_stats: hits, misses and size of the cache of calc results, and of the
+    results shared on the database (shared)
+
+    Returns:
+      json_data: the statistics of the cache
+    """
+    return {**calc_cache.stats(), "shared": shared_cache.stats()}
+
+
+@router.get("/pool")
+def pool_stats():
+    """
+    pool_stats: processes and calculations running on the pool of calculations
+
+    Returns:
+      json_data: the statistics of the pool
+    """
+    return calc_pool.stats()
+
+
+@router.get("/admission")
+def admission_stats():
+    """
+    admission_stats: memory budget and memory in use of the admission control,
+    and the heavy requests running, waiting and rejected
+
+    Returns:
+      json_data: the statistics of the admission control
+    """
+    return admission.stats()
+
+
+@router.post("/jobs", status_code=202)
+def create_job(spec: CalcSpec):
+    """
+    create_job: start a calculation on the background and return its job. If an
+    identical calculation is queued or running, its job is returned.
+
+    Args:
+      spec (CalcSpec): the parameters of the calculation, like the parameters
+        of calc_results
+
+    Raises:
+      HTTPException: 503 if there are too many jobs queued or running
+
+    Returns:
+      json_data: the id, status and progress of the job
+    """
+    spec = dict(spec)
+    key = request_hash(normalize_params(**spec))
+    try:
+        job = calc_jobs.submit(key, calculate, spec)
+    except JobStoreFull as error:
+        raise HTTPException(
+            status_code=503, detail=str(error), headers={"Retry-After": "10"}
+        ) from error
+    return job.info()
+
+
+@router.get("/jobs")
+def jobs_stats():
+    """
+    jobs_stats: number of jobs of the background calculations by status
+
+    Returns:
+      json_data: the statistics of the jobs
+    """
+    return calc_jobs.stats()
+
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str, wait: Optional[float] = 0):
+    """
+    get_job: status and progress of a job
+
+    Args:
+      job_id (str): id of the job
+      wait (Optional(float)): maximum time, in seconds, to wait for the job to
+        finish before answering (long polling). It is limited to 30 seconds.
+        Default is 0.
+
+    Raises:
+      HTTPException: 404 if the job does not exist or it expired
+
+    Returns:
+      json_data: the id, status and progress of the job
+    """
+    job = calc_jobs.wait(job_id, min(max(wait, 0), 30))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.info()
+
+
+@router.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    """
+    get_job_result: result of a finished job
+
+    Args:
+      job_id (str): id of the job
+
+    Raises:
+      HTTPException: 404 if the job does not exist or it expired, 409 if the job
+        is not finished and 500 if the job failed
+
+    Returns:
+      json_data: a json structure with the calculation results
+    """
+    job = calc_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job.result
@@ -1,22 +1,127 @@
 # pylint: disable=too-many-arguments
+# pylint: disable=redefined-builtin
+# pylint: disable=too-many-locals
+# pylint: disable=too-many-branches
 """
 Router module for data entrypoints.
 
 This router contains the following functions:
     * open_csv: function for open and merge csv files on the object store
+    * frame_dataset: dataset and version of the frame of an open_csv request
+    * load_frame: open, merge and clip the csv files of an open_csv request
+    * datasets_stats: hits, misses, loads and size of the store of the loaded datasets
+    * files_stats: statistics of the tiers of the cache of the files of the object store
     * open_stac: function for open stac catalog and create a single json
     * open_parquet: function for open parquet data on the object store
     * open_geojson: function for open geojson data on the object store
 """
 
 import json
-from typing import Optional
+import os
+from typing import Annotated, Optional
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+
+from api.responses import (
+    FastJSONRoute,
+    admitted,
+    cache_headers,
+    not_modified,
+    set_headers,
+)
+from use_cases_calc.admission import admission
+from use_cases_calc.dataset_store import datasets
+from use_cases_calc.get_bucket import GetBucket, file_cache
+from use_cases_calc.request_key import (
+    decode_cursor,
+    encode_cursor,
+    normalize_params,
+    request_hash,
+)
+from use_cases_calc.result_cache import ResultCache
+from use_cases_calc.serializers import (
+    FRAME_MEDIA_TYPES,
+    STREAM_MEDIA_TYPES,
+    frame_bytes,
+    frame_format,
+    iter_json,
+)
+from use_cases_calc.single_flight import SingleFlight
+
+load_dotenv()
+
+router = APIRouter(route_class=FastJSONRoute)
+
+# merged frames of the paginated requests
+page_cache = ResultCache(
+    max_entries=int(os.environ.get("PAGE_CACHE_SIZE", 8)),
+    ttl=float(os.environ.get("PAGE_CACHE_TTL", 600)),
+)
+
+
+# frames being loaded, shared by the concurrent requests of the same frame
+frame_flights = SingleFlight()
+
+
+def frame_dataset(data: GetBucket, **params):
+    """
+    frame_dataset: dataset and version of the frame of an open_csv request, used
+    by the ETags, the cursors and the cache of the pages
+
+    Args:
+        data (GetBucket): the bucket of the files
+        **params: the parameters of open_csv that define the frame
 
-from fastapi import APIRouter
+    Returns:
+        tuple: hash of the parameters and hash of the versions of the files, or
+            None if the versions of the files are not known
+    """
+    normalized = normalize_params(**params)
+    # the order of the files is the order of the rows
+    normalized["filenames"] = params["filenames"].split(",")
+    versions = data.get_versions([f"{file}.csv" for file in normalized["filenames"]])
+    version = None
+    if all(version["version"] for version in versions.values()):
+        version = request_hash(None, versions)
+    return request_hash(normalized), version
+
+
+def load_frame(
+    data: GetBucket,
+    filenames: str,
+    columns: str,
+    drop_columns: str,
+    bbox: str,
+    crs: str,
+    lat_lon_columns: str,
+    skip_lines: int,
+    convert_geom: bool,
+):
+    """
+    load_frame: open, merge and clip the csv files of an open_csv request
 
-from use_cases_calc.get_bucket import GetBucket
+    Args:
+        data (GetBucket): the bucket of the files, with the versions of the files
+        the other parameters of open_csv that define the frame
 
-router = APIRouter()
+    Returns:
+        pd.DataFrame: the frame
+    """
+    data.get_csv(
+        filenames=[f"{file}.csv" for file in filenames.split(",")],
+        columns=columns,
+        drop_columns=drop_columns.split(","),
+        convert_geom=convert_geom,
+    )
+    if bbox:
+        data.clip_data(bbox, crs, lat_lon_columns.split(","))
+    if skip_lines < 0:
+        data.df = data.df.iloc[:skip_lines]
+    if skip_lines > 0:
+        data.df = data.df.iloc[skip_lines:]
+    return data.df
 
 
 @router.get("/csv")
@@ -30,6 +135,12 @@ def open_csv(
     orient: Optional[str] = "records",
     skip_lines: Optional[int] = 0,
     convert_geom: Optional[bool] = False,
+    stream: Optional[str] = None,
+    format: Optional[str] = None,
+    accept: Annotated[Optional[str], Header()] = None,
+    limit: Annotated[Optional[int], Query(ge=1)] = None,
+    cursor: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
 ):
     """
      open_csv: function for open and merge csv files on the object store
@@ -69,33 +180,196 @@ def open_csv(
     convert_geom (Optional(bool)): A flag that indicates if latitude and longitude will
         be converted to geometry
 
+    stream (Optional(str)): stream the records in batches of rows, instead of
+        building the whole response. It should be 'ndjson' (one record by line) or
+        'json' (a json array of records). It can not be used with convert_geom or
+        an orient different of records. Default is None.
+
+    format (Optional(str)): format of the response. It should be json, arrow (Arrow
+        IPC stream), parquet or csv. If it is not defined, the format is chosen by
+        the Accept header (application/vnd.apache.arrow.stream,
+        application/vnd.apache.parquet or text/csv), and json is the default.
+        The binary formats can not be used with convert_geom.
+
+    accept (Optional(str)): Accept header of the request.
+
+    limit (Optional(int)): maximum number of rows of the response. If it is defined, the
+        json response is {"data": the rows, "next_cursor": cursor of the next page},
+        and the other formats have the header X-Next-Cursor. The merged frame is
+        cached, so the next pages are not loaded again. Default is None.
+
+    cursor (Optional(str)): cursor of the page, returned by the previous page. The other
+        parameters should be the same of the previous page. Default is None.
+
+    if_none_match (Optional(str)): If-None-Match header of the request. If the versions
+        of the files are known, the responses have a strong ETag of the parameters
+        and the versions, and a request with a matching If-None-Match header is
+        answered with 304 before loading the files.
+
+    The requests that load large files wait for the memory budget of the
+    admission control (see /v1/calc/admission), and the small files are loaded
+    at once.
+
+    Raises:
+        HTTPException: 400 if the stream, format or cursor options are not valid,
+        410 if the files changed after the cursor was created, and 503 if there
+        is no memory to load the files before the deadline
+
     Returns:
-        json_data: a json structure with the data
+        json_data: a json structure with the data, or the data on the chosen format
     """
-
-    file_names = []
-    for file in filenames.split(","):
-        file_names.append(f"{file}.csv")
+    try:
+        file_format = frame_format(format, None if stream or convert_geom else accept)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+    if file_format and (stream or convert_geom):
+        raise HTTPException(
+            status_code=400,
+            detail=f"format {file_format} can not be used with stream or convert_geom",
+        )
+    if stream and (
+        stream not in STREAM_MEDIA_TYPES or convert_geom or orient != "records"
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail=f"stream should be one of {list(STREAM_MEDIA_TYPES)}, "
+            "without convert_geom and with orient records",
+        )
+
+    # the format chosen by the Accept header is in the ETag, and the shared
+    # caches keep a response for each Accept header
+    vary = "Accept" if not (format or stream or convert_geom) else None
 
     data = GetBucket()
 
-    data.get_csv(
-        filenames=file_names,
+    dataset, version = frame_dataset(
+        data,
+        filenames=filenames,
         columns=columns,
-        drop_columns=drop_columns.split(","),
+        drop_columns=drop_columns,
+        bbox=bbox,
+        crs=crs,
+        lat_lon_columns=lat_lon_columns,
+        skip_lines=skip_lines,
         convert_geom=convert_geom,
     )
+    if version:
+        etag = request_hash(
+            {
+                "dataset": dataset,
+                "version": version,
+                "orient": orient,
+                "stream": stream,
+                "format": file_format,
+                "limit": limit,
+                "cursor": cursor,
+            }
+        )
+        response = not_modified(if_none_match, f'"{etag}"', vary)
+        if response is not None:
+            return response
+        set_headers(cache_headers(f'"{etag}"', vary))
+    elif vary:
+        set_headers({"Vary": vary})
+
+    paginate = limit is not None or cursor is not None
+    offset = 0
+    frame = None
+    if paginate:
+        if cursor is not None:
+            try:
+                cursor_dataset, cursor_version, offset = decode_cursor(cursor)
+            except ValueError as error:
+                raise HTTPException(status_code=400, detail=str(error)) from error
+            if cursor_dataset != dataset:
+                raise HTTPException(
+                    status_code=400, detail="The cursor is of another request"
+                )
+            if cursor_version != version:
+                raise HTTPException(
+                    status_code=410, detail="The files changed, start again"
+                )
+        if version:
+            frame = page_cache.get((dataset, version))
+
+    if frame is None:
+        load_args = (
+            data,
+            filenames,
+            columns,
+            drop_columns,
+            bbox,
+            crs,
+            lat_lon_columns,
+            skip_lines,
+            convert_geom,
+        )
+        # the requests that load large files wait for the memory budget
+        cost = admission.estimate(data.versions)
+        if version:
+            # the concurrent requests of the same frame share one load
+            frame = frame_flights.do(
+                (dataset, version), admitted, cost, load_frame, *load_args
+            )
+        else:
+            frame = admitted(cost, load_frame, *load_args)
+        if paginate and version:
+            page_cache.set((dataset, version), frame)
+    data.df = frame
+
+    next_cursor = None
+    if paginate:
+        stop = len(data.df) if limit is None else offset + limit
+        if stop < len(data.df):
+            next_cursor = encode_cursor(dataset, version, stop)
+        data.df = data.df.iloc[offset:stop]
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    if file_format:
+        return Response(
+            frame_bytes(data.df, file_format),
+            media_type=FRAME_MEDIA_TYPES[file_format],
+            headers=headers,
+        )
+    if stream:
+        return StreamingResponse(
+            iter_json(data.df, stream),
+            media_type=STREAM_MEDIA_TYPES[stream],
+            headers=headers,
+        )
+    if convert_geom and "geometry" in data.df.columns:
+        result = data.df.to_geo_dict(na="null", show_bbox=False)
+    elif convert_geom:
+        result = json.loads(data.df.to_json())
+    else:
+        result = data.df.to_dict(orient=orient)
+    if paginate:
+        return {"data": result, "next_cursor": next_cursor}
+    return result
+
+
+@router.get("/datasets")
+def datasets_stats():
+    """
+    datasets_stats: hits, misses, loads and size of the store of the loaded
+    datasets, shared by the requests of the same files
 
-    if bbox:
-        data.clip_data(bbox, crs, lat_lon_columns.split(","))
-    if skip_lines < 0:
-        data.df = data.df.iloc[:skip_lines]
-    if skip_lines > 0:
-        data.df = data.df.iloc[skip_lines:]
+    Returns:
+      json_data: the statistics of the store
+    """
+    return datasets.stats()
 
-    if convert_geom:
-        return json.loads(data.df.to_json())
-    return data.df.to_dict(orient=orient)
+
+@router.get("/files")
+def files_stats():
+    """
+    files_stats: hits, misses, evictions and size of the memory and disk tiers
+    of the cache of the files of the object store, and the files downloaded
+
+    Returns:
+      json_data: the statistics of each tier
+    """
+    return file_cache.stats()
 
 
 # @router.get("/stac")
@@ -0,0 +1,186 @@
+"""
+  Load test of a running API, that replays a log of requests at a target
+  concurrency and reports the throughput and the p50/p95/p99 latency of each
+  route. The log is a jsonl file, with one request by line, like:
+  {"method": "GET", "path": "/v1/calc/", "params": {"filenames": "..."}}
+  {"method": "POST", "path": "/v1/calc/jobs", "json": {"filenames": "..."}}
+  Run with:
+  python -m benchmarks.load_test requests.jsonl [--base-url http://127.0.0.1:8000]
+      [--concurrency 8] [--requests 200] [--output results.json]
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+
+def read_log(path: str):
+    """
+    read_log: read the requests of a log
+
+    Args:
+        path (str): the jsonl file of the log
+
+    Returns:
+        list: the requests, with method, path, params, json and headers
+    """
+    log = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                request = json.loads(line)
+                request.setdefault("method", "GET")
+                log.append(request)
+    return log
+
+
+def route_of(request: dict):
+    """
+    route_of: route of a request of the log, used to group the results
+
+    Args:
+        request (dict): the request
+
+    Returns:
+        str: the route, like 'GET /v1/calc/'
+    """
+    return request.get("route") or f"{request['method']} {request['path']}"
+
+
+def replay(
+    base_url: str,
+    log: list,
+    concurrency: int = 8,
+    total: int = None,
+    timeout: float = 120,
+):
+    """
+    replay: replay the requests of a log against the API. The log is repeated
+    until the total number of requests is sent.
+
+    Args:
+        base_url (str): url of the API
+        log (list): the requests
+        concurrency (int, optional): number of requests at the same time.
+            Defaults to 8.
+        total (int, optional): number of requests. Defaults to the size of the log.
+        timeout (float, optional): timeout of each request, in seconds.
+            Defaults to 120.
+
+    Returns:
+        dict: the report of the load test
+    """
+    total = total or len(log)
+    requests_iter = itertools.islice(itertools.cycle(log), total)
+    lock = threading.Lock()
+    results = {}
+    local = threading.local()
+
+    def send(request: dict):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            response = local.session.request(
+                request["method"],
+                base_url.rstrip("/") + request["path"],
+                params=request.get("params"),
+                json=request.get("json"),
+                headers=request.get("headers"),
+                timeout=timeout,
+            )
+            error = response.status_code >= 400
+            size = len(response.content)
+        except requests.RequestException:
+            error, size = True, 0
+        elapsed = time.perf_counter() - start
+        with lock:
+            result = results.setdefault(
+                route_of(request), {"latencies": [], "errors": 0, "bytes": 0}
+            )
+            result["latencies"].append(elapsed)
+            result["errors"] += error
+            result["bytes"] += size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, requests_iter))
+    duration = time.perf_counter() - start
+    return report(results, duration, concurrency)
+
+
+def report(results: dict, duration: float, concurrency: int):
+    """
+    report: throughput and latency percentiles of each route
+
+    Args:
+        results (dict): latencies, errors and bytes of each route
+        duration (float): duration of the load test, in seconds
+        concurrency (int): number of requests at the same time
+
+    Returns:
+        dict: the report
+    """
+    routes = {}
+    for route, result in sorted(results.items()):
+        latencies = np.array(result["latencies"]) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        routes[route] = {
+            "requests": len(latencies),
+            "errors": result["errors"],
+            "throughput_rps": len(latencies) / duration,
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+            "max_ms": latencies.max(),
+            "mb_received": result["bytes"] / 1e6,
+        }
+    count = sum(route["requests"] for route in routes.values())
+    return {
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "requests": count,
+        "throughput_rps": count / duration if duration else 0.0,
+        "routes": routes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("log", help="jsonl file of the requests")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, help="number of requests")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="json file of the report")
+    args = parser.parse_args()
+
+    result = replay(
+        args.base_url,
+        read_log(args.log),
+        args.concurrency,
+        args.requests,
+        args.timeout,
+    )
+    print(
+        f"{result['requests']} requests in {result['duration_s']:.1f} s, "
+        f"{result['throughput_rps']:.1f} requests/s at concurrency {args.concurrency}"
+    )
+    for route, stats in result["routes"].items():
+        print(
+            f"    {route}: {stats['requests']} requests, {stats['errors']} errors, "
+            f"{stats['throughput_rps']:.1f}/s, p50 {stats['p50_ms']:.1f} ms, "
+            f"p95 {stats['p95_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+  Local stand-in of the object store, that serves the files of a folder like
+  the JASMIN object store: plain GET and HEAD requests of GetBucket, and the
+  presigned urls of GetUser.signed_url (path or virtual host style, the
+  signature is not checked). Run with:
+  python -m benchmarks.object_store [--root benchmarks/data] [--port 9000]
+      [--rows 10000] [--latency 0]
+  and set JASMIN_API_URL to the printed url.
+"""
+import argparse
+import email.utils
+import mimetypes
+import os
+import posixpath
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+from benchmarks.pipeline import write_survey
+from tests.synthetic import synthetic_files
+
+# files of the object store used by the API, created by write_fixtures
+FIXTURES = (
+    ("layers:seabed_images:hf2012:HF2012_alltile_otherdata", "otherdata"),
+    ("layers:seabed_images:hf2012:HF2012_alltile_counts", "counts"),
+)
+
+
+def write_fixtures(root: str, rows: int, bucket: str = "haig-fras"):
+    """
+    write_fixtures: write synthetic files with the names of the files of the
+    object store used by the API, and a synthetic survey for the benchmarks
+
+    Args:
+        root (str): folder of the buckets
+        rows (int): number of images of the files
+        bucket (str, optional): bucket name. Defaults to 'haig-fras'.
+    """
+    files = synthetic_files(rows)
+    for filename, kind in FIXTURES:
+        path = os.path.join(root, bucket, *filename.split(":")) + ".csv"
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            files[kind].to_csv(path, index=False)
+    write_survey(root, rows)
+
+
+class ObjectStoreHandler(BaseHTTPRequestHandler):
+    """
+    ObjectStoreHandler class for answer the GET and HEAD requests of the
+    objects, with ETag, Last-Modified and Content-Length headers. The requests
+    with a matching If-None-Match header are answered with 304.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def object_path(self):
+        """
+        object_path: path of the object of the request, by the path (path style)
+        or by the host (virtual host style)
+
+        Returns:
+            str: the path of the file, or None if it does not exist
+        """
+        key = posixpath.normpath(unquote(urlsplit(self.path).path)).lstrip("/")
+        host_bucket = self.headers.get("Host", "").split(":")[0].split(".")[0]
+        candidates = [key]
+        if host_bucket:
+            candidates.append(f"{host_bucket}/{key}")
+        for candidate in candidates:
+            if candidate.startswith(".."):
+                continue
+            path = os.path.join(self.server.root, *candidate.split("/"))
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def answer(self, body: bool):
+        """
+        answer: answer a GET or HEAD request
+
+        Args:
+            body (bool): send the content of the object
+        """
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        path = self.object_path()
+        if path is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        stat = os.stat(path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header(
+            "Last-Modified", email.utils.formatdate(stat.st_mtime, usegmt=True)
+        )
+        self.send_header(
+            "Content-Type", mimetypes.guess_type(path)[0] or "application/octet-stream"
+        )
+        self.send_header("Content-Length", str(stat.st_size))
+        self.end_headers()
+        if body:
+            with open(path, "rb") as file:
+                while chunk := file.read(1 << 20):
+                    self.wfile.write(chunk)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self.answer(body=True)
+
+    def do_HEAD(self):  # pylint: disable=invalid-name
+        self.answer(body=False)
+
+
+class LocalObjectStore:
+    """
+    LocalObjectStore class for serve the files of a folder like the object store,
+    on a thread
+
+    This class has the following methods:
+        * start: start the server
+        * stop: stop the server
+    """
+
+    def __init__(
+        self,
+        root: str,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0,
+        verbose: bool = False,
+    ):
+        """
+        LocalObjectStore class constructor
+
+        Args:
+            root (str): folder of the buckets, like root/haig-fras/layers/...
+            host (str, optional): host of the server. Defaults to '127.0.0.1'.
+            port (int, optional): port of the server, 0 for a free port.
+                Defaults to 0.
+            latency (float, optional): time, in seconds, added to each request.
+                Defaults to 0.
+            verbose (bool, optional): log the requests. Defaults to False.
+        """
+        self.server = ThreadingHTTPServer((host, port), ObjectStoreHandler)
+        self.server.daemon_threads = True
+        self.server.root = root
+        self.server.latency = latency
+        self.server.verbose = verbose
+        self.url = f"http://{host}:{self.server.server_address[1]}/"
+        self._thread = None
+
+    def start(self):
+        """
+        start: start the server
+
+        Returns:
+            str: the url of the server, for JASMIN_API_URL
+        """
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """
+        stop: stop the server
+        """
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--root", default=os.path.join("benchmarks", "data"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--latency", type=float, default=0, help="in milliseconds")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    write_fixtures(args.root, args.rows)
+    store = LocalObjectStore(
+        args.root, args.host, args.port, args.latency / 1000, args.verbose
+    )
+    print(f"serving {args.root} on JASMIN_API_URL={store.url}")
+    try:
+        store.server.serve_forever()
+    except KeyboardInterrupt:
+        store.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+  Benchmark of the dense and sparse organism matrix. Run with:
+  python -m benchmarks.organism_matrix [--csv survey.csv] [--rows 100000]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from use_cases_calc.organism_matrix import OrganismMatrix
+from use_cases_calc.organisms import all_organisms
+from use_cases_calc.taxonomy import taxonomy
+
+
+def synthetic_block(rows: int, density: float, seed: int = 0):
+    """
+    synthetic_block: organism columns with a fraction of nonzero counts
+
+    Args:
+        rows (int): number of rows
+        density (float): fraction of nonzero counts
+        seed (int, optional): seed of the random generator. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: the organism columns
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            organism: (rng.random(rows) < density) * rng.integers(1, 20, rows)
+            for organism in all_organisms
+        }
+    )
+
+
+def best_time(function, repeat: int = 5):
+    """
+    best_time: best time, in milliseconds, of some runs of a function
+
+    Args:
+        function (callable): function without arguments
+        repeat (int, optional): number of runs. Defaults to 5.
+
+    Returns:
+        float: the best time
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+def benchmark(block: pd.DataFrame):
+    """
+    benchmark: memory and time of the dense and sparse matrices of a block
+
+    Args:
+        block (pd.DataFrame): the organism columns
+
+    Returns:
+        dict: the report of each representation
+    """
+    codes = np.arange(len(block)) % 10
+    report = {}
+    for mode in ("dense", "sparse"):
+        matrix = OrganismMatrix.from_frame(block, mode=mode)
+
+        def diversity():
+            totals = matrix.row_sums()
+            matrix.row_positive()
+            matrix.row_shannon(totals)
+            matrix.row_simpson(totals)
+
+        report[mode] = dict(
+            matrix.memory_report(),
+            build_ms=best_time(lambda: OrganismMatrix.from_frame(block, mode=mode)),
+            diversity_ms=best_time(diversity),
+            group_sums_ms=best_time(lambda: matrix.group_sums(codes, 10)),
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--csv", help="survey to use instead of synthetic data")
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    if args.csv:
+        df = pd.read_csv(args.csv)
+        blocks = {args.csv: df.iloc[:, taxonomy.resolve(df.columns).positions]}
+    else:
+        blocks = {
+            f"density {density}": synthetic_block(args.rows, density)
+            for density in (0.01, 0.05, 0.1, 0.25, 0.5)
+        }
+
+    for name, block in blocks.items():
+        report = benchmark(block)
+        dense, sparse = report["dense"], report["sparse"]
+        print(
+            f"{name}: {dense['rows']} x {dense['columns']}, "
+            f"nonzero {dense['density']:.3f}, "
+            f"memory {dense['bytes'] / 1e6:.1f} MB -> {sparse['bytes'] / 1e6:.1f} MB"
+        )
+        for key in ("build_ms", "diversity_ms", "group_sums_ms"):
+            print(
+                f"    {key}: dense {dense[key]:.1f}, sparse {sparse[key]:.1f}, "
+                f"speedup {dense[key] / sparse[key]:.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+  Benchmark suite of the GetBucket pipeline (get_csv, merge, clip_data, every
+  calc type and the serialization) on synthetic surveys, in milliseconds. The
+  results are written in a json file, that can be compared with the results of
+  another run. Run with:
+  python -m benchmarks.pipeline [--rows 10000,1000000,10000000] [--repeat 3]
+      [--data-dir benchmarks/data] [--output results.json] [--compare old.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+
+import pandas as pd
+
+from benchmarks.organism_matrix import best_time
+from tests.synthetic import synthetic_files
+from use_cases_calc.calc_planner import CalcPlanner
+from use_cases_calc.get_bucket import GetBucket
+from use_cases_calc.serializers import dumps, frame_bytes, iter_json
+from use_cases_calc.tracing import Trace, current_trace
+
+# name, calc, calc columns and agg columns of each calculation
+CALCS = (
+    ("count", "count", ["habitat"], None),
+    ("unique", "unique", ["habitat"], None),
+    ("agg", "agg", ["habitat"], "first:habitatImage"),
+    ("agg_density", "agg", ["habitat"], "density:,count:area_seabed_m2"),
+    (
+        "organism",
+        "organism",
+        ["pentapora_foliacea"],
+        "first:filename,first:fileformat,sum:pentapora_foliacea,density:area_seabed_m2",
+    ),
+    ("biodiversity1", "biodiversity1", ["substratum"], None),
+    ("biodiversity2", "biodiversity2", ["substratum"], None),
+    ("biodiversity3", "biodiversity3", ["substratum"], None),
+    ("biodiversity4", "biodiversity4", ["substratum"], None),
+    ("biodiversity5", "biodiversity5", ["substratum"], None),
+)
+
+# a quarter of the area of the synthetic surveys
+BBOX = "-6.5,50.3,-6.45,50.35"
+
+
+def write_survey(base_dir: str, rows: int, chunk_rows: int = 250_000):
+    """
+    write_survey: write the files of a synthetic survey in a local folder with
+    the layout of the object store, by chunks, if they do not exist
+
+    Args:
+        base_dir (str): local folder that replaces the object store
+        rows (int): number of images of the survey
+        chunk_rows (int, optional): number of rows of each chunk.
+            Defaults to 250_000.
+
+    Returns:
+        list: the names of the files, for get_csv
+    """
+    filenames = []
+    for kind in ("otherdata", "counts"):
+        filename = f"layers:benchmark:survey_{rows}_{kind}"
+        path = os.path.join(base_dir, "haig-fras", *filename.split(":")) + ".csv"
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            for start in range(0, rows, chunk_rows):
+                chunk = synthetic_files(
+                    min(chunk_rows, rows - start), seed=start, start=start
+                )[kind]
+                chunk.to_csv(path, index=False, mode="a", header=start == 0)
+        filenames.append(f"{filename}.csv")
+    os.environ["JASMIN_API_URL"] = base_dir.rstrip("/") + "/"
+    return filenames
+
+
+def run_suite(filenames: list, repeat: int):
+    """
+    run_suite: time each stage of the pipeline on the files of a survey
+
+    Args:
+        filenames (list): the names of the files, for get_csv
+        repeat (int): number of runs of each stage. The best time is kept.
+
+    Returns:
+        dict: the time of each stage, in milliseconds
+    """
+    timings = {}
+    data = GetBucket()
+    # load_csv, so the files are loaded on every run instead of by the dataset store
+    timings["get_csv"] = best_time(lambda: data.load_csv(filenames=filenames), repeat)
+
+    # stages of get_csv, from the trace of one more run
+    trace = Trace()
+    token = current_trace.set(trace)
+    try:
+        data.df = data.load_csv(filenames=filenames)
+    finally:
+        current_trace.reset(token)
+    for name, stage in trace.timings().items():
+        timings[f"get_csv.{name}"] = stage["ms"]
+
+    frames = [
+        pd.read_csv(os.path.join(data.base_url, *filename.split(":")))
+        for filename in filenames
+    ]
+    timings["merge"] = best_time(
+        lambda: frames[0].merge(frames[1], how="outer", on=["filename"]), repeat
+    )
+
+    merged = data.df
+
+    def clip():
+        clipped = GetBucket(base_url=data.base_url)
+        clipped.df = merged
+        clipped.clip_data(BBOX, "EPSG:4326", ["latitude", "longitude"])
+
+    timings["clip_data"] = best_time(clip, repeat)
+
+    for name, calc, calc_columns, agg_columns in CALCS:
+
+        def calculate():
+            planner = CalcPlanner(merged)
+            steps = planner.plan(calc, calc_columns, agg_columns)
+            planner.run(steps, agg_columns=agg_columns)
+
+        timings[f"calc.{name}"] = best_time(calculate, repeat)
+
+    timings["serialize.json"] = best_time(
+        lambda: dumps(merged.to_dict(orient="records")), repeat
+    )
+    timings["serialize.ndjson"] = best_time(
+        lambda: b"".join(iter_json(merged, "ndjson")), repeat
+    )
+    for file_format in ("arrow", "parquet"):
+        timings[f"serialize.{file_format}"] = best_time(
+            lambda: frame_bytes(merged, file_format), repeat
+        )
+    return timings
+
+
+def metadata():
+    """
+    metadata: commit, python and machine of the run, to compare the results
+
+    Returns:
+        dict: the metadata
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results: dict, previous: dict):
+    """
+    compare: print the time of each stage against the results of another run
+
+    Args:
+        results (dict): the results of this run
+        previous (dict): the results of the other run
+    """
+    print(
+        f"compared with {previous['meta'].get('commit')} of {previous['meta']['date']}"
+    )
+    for rows, timings in results["results"].items():
+        old_timings = previous["results"].get(rows, {})
+        print(f"{rows} rows")
+        for name, milliseconds in timings.items():
+            old = old_timings.get(name)
+            if old:
+                print(
+                    f"    {name}: {old:.1f} -> {milliseconds:.1f} ms, "
+                    f"{milliseconds / old:.2f}x"
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", default="10000", help="sizes, separated by comma")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", help="folder to keep the synthetic files")
+    parser.add_argument("--output", help="json file of the results")
+    parser.add_argument("--compare", help="json file of the results of another run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        base_dir = args.data_dir or temporary_dir
+        results = {"meta": metadata(), "results": {}}
+        for rows in [int(rows) for rows in args.rows.split(",")]:
+            filenames = write_survey(base_dir, rows)
+            timings = run_suite(filenames, args.repeat)
+            results["results"][str(rows)] = timings
+            print(f"{rows} rows")
+            for name, milliseconds in timings.items():
+                print(f"    {name}: {milliseconds:.1f} ms")
+
+    output = args.output or os.path.join(
+        "benchmarks",
+        "results",
+        f"pipeline-{results['meta']['date'].replace(':', '')}.json",
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+    print(f"results written on {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
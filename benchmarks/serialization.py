@@ -0,0 +1,57 @@
+"""
+  Benchmark of the serialization of the data responses, in seconds per 100k
+  rows. Run with:
+  python -m benchmarks.serialization [--csv survey.csv] [--rows 100000]
+"""
+import argparse
+import json
+
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.organism_matrix import best_time
+from tests.synthetic import synthetic_survey
+from use_cases_calc.serializers import dumps, iter_json
+
+
+def fastapi_json(df: pd.DataFrame):
+    """
+    fastapi_json: serialization of the records by FastAPI, without FastJSONRoute
+    """
+    content = jsonable_encoder(df.to_dict(orient="records"))
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def fast_json(df: pd.DataFrame):
+    """
+    fast_json: serialization of the records by FastJSONRoute
+    """
+    return dumps(df.to_dict(orient="records"))
+
+
+def stream_json(df: pd.DataFrame):
+    """
+    stream_json: serialization of the records by the stream option
+    """
+    return b"".join(iter_json(df, "ndjson"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--csv", help="survey to use instead of synthetic data")
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv) if args.csv else synthetic_survey(rows=args.rows)
+    per_100k = 100_000 / len(df)
+    print(f"{len(df)} rows x {len(df.columns)} columns")
+    for function in (fastapi_json, fast_json, stream_json):
+        seconds = best_time(lambda: function(df), repeat=3) / 1000
+        print(
+            f"    {function.__name__}: {seconds * per_100k:.2f} s per 100k rows, "
+            f"{len(function(df)) / 1e6:.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@
 """
     Schema for user creation, migration and select
 """
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 
@@ -24,3 +26,62 @@ class User(BaseModel):
         """
 
         orm_mode = True
+
+
+class CalcSpec(BaseModel):
+    """
+    CalcSpec: parameters of a calculation, with the same names and defaults
+    of the /v1/calc endpoint
+
+    Args:
+        BaseModel (BaseModel): Calc Spec Base Model
+    """
+
+    filenames: str
+    extension: str = "csv"
+    calc: str = "count"
+    calc_columns: str = ""
+    columns: Optional[str] = None
+    drop_columns: str = "Unnamed: 0"
+    bbox: str = ""
+    crs: Optional[str] = None
+    lat_lon_columns: str = "latitude,longitude"
+    agg_columns: Optional[str] = None
+    exclude_index: Optional[bool] = False
+    all_columns: Optional[bool] = False
+
+
+class BatchCalc(BaseModel):
+    """
+    BatchCalc: parameters of one calculation of a batch, with the same names
+    and defaults of the /v1/calc endpoint
+
+    Args:
+        BaseModel (BaseModel): Batch Calc Base Model
+    """
+
+    name: Optional[str] = None
+    calc: str = "count"
+    calc_columns: str = ""
+    agg_columns: Optional[str] = None
+    exclude_index: Optional[bool] = False
+    all_columns: Optional[bool] = False
+
+
+class CalcBatch(BaseModel):
+    """
+    CalcBatch: files of a batch of calculations, with the same names and
+    defaults of the /v1/calc endpoint, and the calculations
+
+    Args:
+        BaseModel (BaseModel): Calc Batch Base Model
+    """
+
+    filenames: str
+    extension: str = "csv"
+    columns: Optional[str] = None
+    drop_columns: str = "Unnamed: 0"
+    bbox: str = ""
+    crs: Optional[str] = None
+    lat_lon_columns: str = "latitude,longitude"
+    calcs: List[BatchCalc]
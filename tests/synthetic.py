@@ -0,0 +1,98 @@
+"""
+Synthetic survey data for the tests that should not access the object store
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from use_cases_calc.organisms import all_organisms
+
+
+def synthetic_survey(rows: int = 200, seed: int = 0):
+    """
+    synthetic_survey: create a survey frame with the organism columns
+
+    Args:
+        rows (int): number of rows. Defaults to 200.
+        seed (int): seed of the random generator. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: the survey frame
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            organism: (rng.random(rows) < 0.1) * rng.integers(1, 6, rows)
+            for organism in all_organisms
+        }
+    )
+    df["substratum"] = rng.choice(["sand", "rock", "mud"], rows)
+    df["habitat"] = rng.choice(["A", "B", "C"], rows)
+    df["filename"] = [f"image_{i}.jpg" for i in range(rows)]
+    df["Area_m2"] = rng.random(rows) * 5 + 1
+    df["latitude"] = 50.3 + rng.random(rows) * 0.1
+    df["longitude"] = -6.5 + rng.random(rows) * 0.1
+    return df
+
+
+def write_bucket(base_dir: str, files: dict, bucket: str = "haig-fras"):
+    """
+    write_bucket: write csv files in a local folder with the layout of the
+    object store, and point JASMIN_API_URL to it
+
+    Args:
+        base_dir (str): local folder that replaces the object store
+        files (dict): frames by filename, like {"layers:test": df}
+        bucket (str): bucket name. Defaults to 'haig-fras'.
+    """
+    for filename, df in files.items():
+        path = os.path.join(base_dir, bucket, *filename.split(":")) + ".csv"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_csv(path, index=False)
+    os.environ["JASMIN_API_URL"] = base_dir.rstrip("/") + "/"
+
+
+def synthetic_files(rows: int = 200, seed: int = 0, start: int = 0):
+    """
+    synthetic_files: create the two files of a survey, like the files of the
+    object store: the image data (survey, habitat, substratum, area and
+    position of each image) and the organism counts of each image. They are
+    merged by the filename column.
+
+    Args:
+        rows (int): number of images. Defaults to 200.
+        seed (int): seed of the random generator. Defaults to 0.
+        start (int): number of the first image, to create a large survey by
+            chunks. Defaults to 0.
+
+    Returns:
+        dict: the frames of the image data ('otherdata') and of the counts
+        ('counts')
+    """
+    rng = np.random.default_rng(seed)
+    filenames = [f"image_{i}.jpg" for i in range(start, start + rows)]
+    area = rng.random(rows) * 5 + 1
+    otherdata = pd.DataFrame(
+        {
+            "filename": filenames,
+            "fileformat": "jpg",
+            "survey": rng.choice(["HF2012", "CEND1012", "CEND0813"], rows),
+            "habitat": rng.choice(["A", "B", "C", "D"], rows),
+            "habitatImage": rng.choice(["A4.13", "A5.15", "A5.27"], rows),
+            "substratum": rng.choice(["sand", "rock", "mud", "gravel"], rows),
+            "Area_m2": area,
+            "area_seabed_m2": area,
+            "latitude": 50.3 + rng.random(rows) * 0.1,
+            "longitude": -6.5 + rng.random(rows) * 0.1,
+        }
+    )
+    counts = pd.DataFrame(
+        {
+            organism: (rng.random(rows) < 0.1) * rng.integers(1, 6, rows)
+            for organism in all_organisms
+        }
+    )
+    counts.insert(0, "filename", filenames)
+    return {"otherdata": otherdata, "counts": counts}
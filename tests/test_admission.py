@@ -0,0 +1,110 @@
+"""
+Pytest codes for the admission control of the heavy requests, using a local
+folder instead of the object store. To run the tests, you need to run make test
+"""
+
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+from fastapi import HTTPException
+
+from api.v1 import calc, data
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc.admission import AdmissionControl, AdmissionRejected, admission
+from use_cases_calc.result_cache import ResultCache
+
+
+def wait_for(condition):
+    """
+    wait_for: wait until a condition is true
+    """
+    deadline = time.monotonic() + 10
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_budget: the heavy requests wait in order for the budget, the
+            cheap requests do not wait, and the requests are rejected when the
+            queue is full or the deadline passed
+            - test_requests: the calc and csv requests of large files are
+            answered with 503 and Retry-After when there is no memory, and the
+            requests of small files are answered
+    """
+
+    def test_budget(self):
+        """
+        test_budget: the heavy requests wait in order for the budget, the cheap
+        requests do not wait, and the requests are rejected when the queue is
+        full or the deadline passed
+        """
+        control = AdmissionControl(
+            budget=100, cheap_bytes=10, timeout=0.01, queue_size=1
+        )
+        assert control.estimate({"a": {"size": 10}, "b": {"size": None}}) == 40
+        first = control.acquire(60)
+        assert control.acquire(5) == 0
+        with self.assertRaises(AdmissionRejected):
+            control.acquire(60)
+
+        control.timeout = 10
+        waiter = threading.Thread(target=control.acquire, args=(60,))
+        waiter.start()
+        wait_for(lambda: control.stats()["waiting"] == 1)
+        with self.assertRaises(AdmissionRejected) as rejected:
+            control.acquire(20)
+        assert rejected.exception.retry_after == 10
+        control.release(first)
+        waiter.join()
+        stats = control.stats()
+        assert (stats["in_use"], stats["running"], stats["waiting"]) == (60, 1, 0)
+        control.release(60)
+
+        # a request larger than the budget runs alone
+        assert control.acquire(500) == 500
+        stats = control.stats()
+        assert (stats["admitted"], stats["cheap"], stats["rejected"]) == (3, 1, 2)
+
+    def test_requests(self):
+        """
+        test_requests: the calc and csv requests of large files are answered with
+        503 and Retry-After when there is no memory, and the requests of small
+        files are answered
+        """
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.multiple(
+            admission, budget=50_000, cheap_bytes=50_000, timeout=0.01
+        ), mock.patch.object(calc, "calc_cache", ResultCache(max_entries=0)):
+            write_bucket(
+                base_dir,
+                {
+                    "layers:small": synthetic_survey(rows=3),
+                    "layers:large": synthetic_survey(rows=300),
+                },
+            )
+            taken = admission.acquire(50_000)
+            try:
+                for request in (
+                    lambda: calc.calc_results(
+                        filenames="layers:large", calc="count", calc_columns="habitat"
+                    ),
+                    lambda: data.open_csv(filenames="layers:large"),
+                ):
+                    with self.assertRaises(HTTPException) as error:
+                        request()
+                    assert error.exception.status_code == 503
+                    assert error.exception.headers == {"Retry-After": "1"}
+
+                value = calc.calc_results(
+                    filenames="layers:small", calc="count", calc_columns="habitat"
+                )
+                assert list(value) == ["habitat"]
+                assert len(data.open_csv(filenames="layers:small")) == 3
+            finally:
+                admission.release(taken)
+            assert len(data.open_csv(filenames="layers:large")) == 300
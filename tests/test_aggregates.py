@@ -0,0 +1,127 @@
+"""
+Pytest codes for the aggregate tables of the datasets, using a synthetic
+survey. To run the tests, you need to run make test
+"""
+
+import tempfile
+from unittest import TestCase, mock
+
+from api.v1.calc import calc_cache, calc_results
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc.aggregates import AggregateTable, MaterializedAggregates
+from use_cases_calc.calc_planner import CalcPlanner
+from use_cases_calc.get_bucket import GetBucket
+
+REQUESTS = [
+    ("agg", "density:,count:filename,mean:Area_m2"),
+    ("organism", "sum:antedon,density:Area_m2"),
+    ("organism", "count:antedon"),
+    ("biodiversity1", None),
+    ("biodiversity2", None),
+]
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_same_results: the tables give the same results as the planner
+            - test_fold: appended rows are folded into the tables, and rows
+            changed in place create the tables again
+            - test_not_answered: calculations that need the rows are not answered
+            - test_calc_aggregates: the calc endpoint uses the tables without
+            loading the files
+    """
+
+    def test_same_results(self):
+        """
+        test_same_results: the tables give the same results as the planner
+        """
+        df = synthetic_survey()
+        tables = MaterializedAggregates()
+        tables.refresh("survey", "v1", df)
+        for calc, agg_columns in REQUESTS:
+            calc_column = "antedon" if calc == "organism" else "substratum"
+            planner = CalcPlanner(df)
+            expected = planner.run(
+                planner.plan(calc, [calc_column], agg_columns), agg_columns
+            )
+            value = tables.answer("survey", "v1", calc, [calc_column], agg_columns)
+            assert value == expected, calc
+
+    def test_fold(self):
+        """
+        test_fold: appended rows are folded into the tables, and rows changed
+        in place create the tables again
+        """
+        df = synthetic_survey(rows=300)
+        tables = MaterializedAggregates()
+        tables.refresh("survey", "v1", df.iloc[:200])
+        with mock.patch.object(
+            AggregateTable,
+            "summarize",
+            autospec=True,
+            side_effect=AggregateTable.summarize,
+        ) as summarize_mock:
+            tables.refresh("survey", "v2", df)
+            assert all(
+                len(call.args[1]) == 100 for call in summarize_mock.call_args_list
+            )
+
+        rebuilt = MaterializedAggregates()
+        rebuilt.refresh("survey", "v2", df)
+        for calc, agg_columns in REQUESTS:
+            calc_column = "antedon" if calc == "organism" else "substratum"
+            assert tables.answer(
+                "survey", "v2", calc, [calc_column], agg_columns
+            ) == rebuilt.answer("survey", "v2", calc, [calc_column], agg_columns)
+
+        changed = df.copy()
+        changed.loc[changed.index[123], "antedon"] += 1000
+        tables.refresh("survey", "v3", changed)
+        planner = CalcPlanner(changed)
+        agg_columns = "sum:antedon"
+        expected = planner.run(
+            planner.plan("organism", ["antedon"], agg_columns), agg_columns
+        )
+        value = tables.answer("survey", "v3", "organism", ["antedon"], agg_columns)
+        assert value == expected
+        assert isinstance(value["antedon"]["Information"][0]["Number"], int)
+
+    def test_not_answered(self):
+        """
+        test_not_answered: calculations that need the rows are not answered
+        """
+        tables = MaterializedAggregates()
+        tables.refresh("survey", "v1", synthetic_survey())
+
+        assert tables.answer("survey", "v2", "biodiversity2", ["habitat"]) is None
+        assert tables.answer("survey", "v1", "biodiversity3", ["habitat"]) is None
+        assert (
+            tables.answer("survey", "v1", "agg", ["habitat"], "first:filename") is None
+        )
+
+    def test_calc_aggregates(self):
+        """
+        test_calc_aggregates: the calc endpoint uses the tables without
+        loading the files
+        """
+        calc_cache.clear()
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {"layers:aggregates": synthetic_survey()})
+            with mock.patch.object(
+                GetBucket, "get_csv", autospec=True, side_effect=GetBucket.get_csv
+            ) as get_csv:
+                calc_results(
+                    filenames="layers:aggregates",
+                    calc="biodiversity1",
+                    calc_columns="substratum",
+                )
+                value = calc_results(
+                    filenames="layers:aggregates",
+                    calc="biodiversity2",
+                    calc_columns="substratum",
+                )
+                assert get_csv.call_count == 1
+                assert isinstance(value["substratum"]["Number of morphotypes"][0], int)
@@ -0,0 +1,49 @@
+"""
+Pytest codes for the benchmark suite, on a small synthetic survey. To run the
+tests, you need to run make test
+"""
+
+import tempfile
+from unittest import TestCase
+
+from benchmarks.pipeline import CALCS, run_suite, write_survey
+from tests.synthetic import synthetic_files
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_synthetic_files: the synthetic files have the columns of the
+            surveys, and the chunks continue the images
+            - test_run_suite: the suite times every stage of the pipeline
+    """
+
+    def test_synthetic_files(self):
+        """
+        test_synthetic_files: the synthetic files have the columns of the
+        surveys, and the chunks continue the images
+        """
+        files = synthetic_files(rows=10, start=10)
+        otherdata, counts = files["otherdata"], files["counts"]
+
+        for column in ("Area_m2", "latitude", "longitude", "substratum", "survey"):
+            assert column in otherdata.columns
+        assert "pentapora_foliacea" in counts.columns
+        assert list(otherdata["filename"]) == list(counts["filename"])
+        assert otherdata["filename"].iloc[0] == "image_10.jpg"
+
+    def test_run_suite(self):
+        """
+        test_run_suite: the suite times every stage of the pipeline
+        """
+        with tempfile.TemporaryDirectory() as base_dir:
+            filenames = write_survey(base_dir, rows=300, chunk_rows=100)
+            timings = run_suite(filenames, repeat=1)
+
+        for name in ("get_csv", "get_csv.parse", "merge", "clip_data"):
+            assert timings[name] > 0
+        for name, *_ in CALCS:
+            assert f"calc.{name}" in timings
+        assert "serialize.parquet" in timings
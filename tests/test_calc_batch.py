@@ -0,0 +1,129 @@
+"""
+Pytest codes for the batches of calculations, using a local folder instead of
+the object store. To run the tests, you need to run make test
+"""
+
+import tempfile
+from unittest import TestCase, mock
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from api.fast import app
+from api.v1 import calc
+from schemas.schemas import CalcBatch
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc.calc_pool import CalcPool
+from use_cases_calc.get_bucket import GetBucket
+from use_cases_calc.result_cache import ResultCache
+
+CALCS = [
+    {"name": "habitats", "calc": "count", "calc_columns": "habitat"},
+    {"calc": "biodiversity3", "calc_columns": "substratum"},
+    {
+        "name": "areas",
+        "calc": "agg",
+        "calc_columns": "habitat",
+        "agg_columns": "sum:Area_m2",
+    },
+]
+
+FILES = {
+    "filenames": "layers:survey",
+    "bbox": "-6.5,50.3,-6.45,50.35",
+    "crs": "EPSG:4326,EPSG:4326",
+}
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_batch: a batch loads the files once and gives the same
+            results as the single requests, that are answered by the cache
+            - test_batch_requests: the batch endpoint validates the calculations,
+            rejects null columns and answers 304 to a matching If-None-Match
+            header
+    """
+
+    def test_batch(self):
+        """
+        test_batch: a batch loads the files once and gives the same results as
+        the single requests, that are answered by the cache
+        """
+        cache = ResultCache()
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.object(
+            calc, "calc_cache", cache
+        ), mock.patch.object(calc, "calc_pool", CalcPool(processes=0)):
+            write_bucket(base_dir, {"layers:survey": synthetic_survey()})
+            with mock.patch.object(
+                GetBucket, "get_csv", autospec=True, side_effect=GetBucket.get_csv
+            ) as get_csv:
+                results = calc.calc_batch(CalcBatch(**FILES, calcs=CALCS))
+                assert get_csv.call_count == 1
+                assert list(results) == ["habitats", "1", "areas"]
+
+                singles = [
+                    calc.calc_results(
+                        **FILES,
+                        calc=item["calc"],
+                        calc_columns=item["calc_columns"],
+                        agg_columns=item.get("agg_columns"),
+                    )
+                    for item in CALCS
+                ]
+                assert get_csv.call_count == 1
+            assert singles == list(results.values())
+            assert cache.stats()["hits"] == 3
+
+            # a new calculation runs alone, the others are cached
+            with mock.patch.object(
+                calc.calc_pool, "run_many", wraps=calc.calc_pool.run_many
+            ) as run_many:
+                results = calc.calc_batch(
+                    CalcBatch(
+                        **FILES,
+                        calcs=CALCS + [{"calc": "count", "calc_columns": "substratum"}],
+                    )
+                )
+                assert len(run_many.call_args.args[1]) == 1
+                assert results["3"] == calc.calc_results(
+                    **FILES, calc="count", calc_columns="substratum"
+                )
+
+    def test_batch_requests(self):
+        """
+        test_batch_requests: the batch endpoint validates the calculations,
+        rejects null columns and answers 304 to a matching If-None-Match header
+        """
+        for calcs in ([], CALCS + [{"name": "areas"}]):
+            with self.assertRaises(HTTPException) as context:
+                calc.calc_batch(CalcBatch(**FILES, calcs=calcs))
+            assert context.exception.status_code == 400
+
+        client = TestClient(app)
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.object(
+            calc, "calc_pool", CalcPool(processes=0)
+        ):
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=50)})
+            response = client.post("/v1/calc/batch", json={**FILES, "calcs": CALCS})
+            assert response.status_code == 200
+            assert list(response.json()) == ["habitats", "1", "areas"]
+
+            nulls = ("bbox", "extension", "drop_columns", "lat_lon_columns")
+            for body in [{**FILES, field: None, "calcs": CALCS} for field in nulls] + [
+                {**FILES, "calcs": [{"calc": "count", "calc_columns": None}]},
+            ]:
+                rejected = client.post("/v1/calc/batch", json=body)
+                assert rejected.status_code == 422
+            for field in nulls + ("calc_columns",):
+                rejected = client.post("/v1/calc/jobs", json={**FILES, field: None})
+                assert rejected.status_code == 422
+
+            response = client.post(
+                "/v1/calc/batch",
+                json={**FILES, "calcs": CALCS},
+                headers={"If-None-Match": response.headers["ETag"]},
+            )
+            assert response.status_code == 304
@@ -0,0 +1,101 @@
+"""
+Pytest codes for the jobs of background calculations, using a local folder
+instead of the object store. To run the tests, you need to run make test
+"""
+
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from fastapi import HTTPException
+
+from api.v1.calc import create_job, get_job, get_job_result
+from schemas.schemas import CalcSpec
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc.calc_pool import CalcPool
+from use_cases_calc.job_store import JobStore, JobStoreFull
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_job_result: a job gives the same result as the calculations
+            - test_job_dedup: identical jobs that are running are not run again
+            - test_job_expiry: finished jobs expire and the store is bounded
+    """
+
+    def test_job_result(self):
+        """
+        test_job_result: a job gives the same result as the calculations
+        """
+        df = synthetic_survey()
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {"layers:survey": df})
+            spec = CalcSpec(
+                filenames="layers:survey", calc="biodiversity4", calc_columns="habitat"
+            )
+            job = create_job(spec)
+            assert job["status"] in ("queued", "running", "done")
+
+            job = get_job(job["id"], wait=30)
+            assert job["status"] == "done"
+            assert job["progress"] == 1.0
+            assert get_job_result(job["id"]) == CalcPool(processes=0).run(
+                df, "biodiversity4", ["habitat"]
+            )
+
+        with self.assertRaises(HTTPException) as error:
+            get_job("unknown")
+        assert error.exception.status_code == 404
+
+    def test_job_dedup(self):
+        """
+        test_job_dedup: identical jobs that are running are not run again
+        """
+        store = JobStore(max_workers=1, max_jobs=4, ttl=60)
+        release = threading.Event()
+        calls = []
+
+        def slow_job(value, progress):
+            calls.append(value)
+            progress(0.5, "waiting")
+            release.wait(10)
+            return value
+
+        first = store.submit("a", slow_job, 1)
+        second = store.submit("a", slow_job, 1)
+        assert first is second
+        release.set()
+        assert store.wait(first.id, 10).result == 1
+
+        third = store.submit("a", slow_job, 1)
+        assert third is not first
+        assert store.wait(third.id, 10).status == "done"
+        assert calls == [1, 1]
+        store.shutdown()
+
+    def test_job_expiry(self):
+        """
+        test_job_expiry: finished jobs expire and the store is bounded
+        """
+        store = JobStore(max_workers=1, max_jobs=1, ttl=0.05)
+        release = threading.Event()
+
+        def slow_job(progress):
+            release.wait(10)
+            raise ValueError("failed job")
+
+        job = store.submit("a", slow_job)
+        with self.assertRaises(JobStoreFull):
+            store.submit("b", slow_job)
+        release.set()
+        job = store.wait(job.id, 10)
+        assert job.status == "failed" and job.error == "failed job"
+
+        time.sleep(0.1)
+        assert store.get(job.id) is None
+        assert store.stats()["jobs"] == 0
+        store.shutdown()
@@ -0,0 +1,98 @@
+"""
+Pytest codes for the CalcPlanner, using a synthetic survey in memory.
+To run the tests, you need to run make test
+"""
+
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from tests.synthetic import synthetic_survey
+from use_cases_calc.calc_planner import CalcPlanner
+from use_cases_calc.get_bucket import GetBucket
+from use_cases_calc.organisms import all_organisms
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_plan_shares_intermediates: the intermediates are computed once
+            - test_base_frame_unchanged: the calculations do not change the frame
+            - test_combined_calcs: combined calculations give the same results
+            as the calculations done one by one
+            - test_biodiversity4_loop: the shannon index is the same as the loop
+    """
+
+    def test_plan_shares_intermediates(self):
+        """
+        test_plan_shares_intermediates: the intermediates are computed once
+        """
+        planner = CalcPlanner(synthetic_survey())
+        steps = planner.plan(
+            "biodiversity3,biodiversity4,biodiversity5", ["substratum"]
+        )
+        intermediates = planner.intermediates(steps)
+
+        assert len(steps) == 3
+        assert intermediates.count(("organism_matrix", None)) == 1
+        assert intermediates.count(("row_totals", None)) == 1
+        assert intermediates.count(("group_keys", "substratum")) == 1
+        assert intermediates.index(("organism_matrix", None)) < intermediates.index(
+            ("row_shannon", None)
+        )
+
+    def test_base_frame_unchanged(self):
+        """
+        test_base_frame_unchanged: the calculations do not change the frame
+        """
+        df = synthetic_survey()
+        expected = df.copy()
+        data = GetBucket(base_url="")
+        data.df = df
+        data.do_calc(
+            calc="biodiversity1,biodiversity2,organism",
+            calc_columns=["substratum"],
+            agg_columns="sum:substratum",
+            exclude_index=False,
+            all_columns=False,
+        )
+        pd.testing.assert_frame_equal(data.df, expected)
+
+    def test_combined_calcs(self):
+        """
+        test_combined_calcs: combined calculations give the same results
+        as the calculations done one by one
+        """
+        calcs = ["count", "biodiversity1", "biodiversity2", "biodiversity3"]
+        separated = {}
+        for calc in calcs:
+            data = GetBucket(base_url="")
+            data.df = synthetic_survey()
+            data.do_calc(calc, ["substratum"], None, False, False)
+            separated.update(data.result["substratum"])
+
+        data = GetBucket(base_url="")
+        data.df = synthetic_survey()
+        data.do_calc(",".join(calcs), ["substratum", "habitat"], None, False, False)
+
+        assert data.result["substratum"] == separated
+        assert list(data.result.keys()) == ["substratum", "habitat"]
+
+    def test_biodiversity4_loop(self):
+        """
+        test_biodiversity4_loop: the shannon index is the same as the loop
+        """
+        df = synthetic_survey()
+        result = CalcPlanner(df).biodiversity4("habitat")
+
+        for types in result["Types"]:
+            values = df[df["habitat"] == types["habitat"]][all_organisms].values
+            shannon = []
+            for row in values:
+                proportion = row[row > 0] / row.sum()
+                shannon.append(np.exp(-np.sum(proportion * np.log(proportion))))
+            mean = str(np.mean(shannon).round(2))
+            assert types["Result"].startswith(mean + " +/- st dev ")
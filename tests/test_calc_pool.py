@@ -0,0 +1,110 @@
+"""
+Pytest codes for the pool of calculations. To run the tests,
+you need to run make test
+"""
+
+import threading
+from unittest import TestCase, mock
+
+import pandas as pd
+
+from tests.synthetic import synthetic_files, synthetic_survey
+from use_cases_calc import calc_pool
+from use_cases_calc.calc_pool import CalcPool, PoolBusy
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_pool_results: the pool gives the same results as the
+            calculations on the thread of the request
+            - test_pool_pickle: merged frames with gaps are shared as Arrow,
+            and frames that can not be converted to Arrow are also calculated
+            - test_pool_busy: new calculations are refused when the pool is full
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = CalcPool(processes=1, queue_depth=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def test_pool_results(self):
+        """
+        test_pool_results: the pool gives the same results as the
+        calculations on the thread of the request
+        """
+        df = synthetic_survey()
+        inline = CalcPool(processes=0)
+        for calc, agg_columns in (
+            ("count,unique", None),
+            ("agg", "first:filename,density:"),
+            ("biodiversity1,biodiversity4,biodiversity5", None),
+        ):
+            value = self.pool.run(df, calc, ["substratum"], agg_columns)
+            assert value == inline.run(df, calc, ["substratum"], agg_columns)
+
+    def test_pool_pickle(self):
+        """
+        test_pool_pickle: merged frames with gaps are shared as Arrow, and
+        frames that can not be converted to Arrow are also calculated
+        """
+        files = synthetic_files(rows=50)
+        merged = (
+            files["otherdata"]
+            .merge(files["counts"].iloc[:30], how="outer", on=["filename"])
+            .fillna("")
+        )
+        shm, kind, size = calc_pool.share_frame(merged)
+        try:
+            assert kind == "arrow"
+            pd.testing.assert_frame_equal(
+                calc_pool.load_frame(shm.name, kind, size), merged
+            )
+        finally:
+            shm.close()
+            shm.unlink()
+        inline = CalcPool(processes=0)
+        for calc in ("count,unique", "biodiversity1,biodiversity4"):
+            value = self.pool.run(merged, calc, ["substratum"])
+            assert value == inline.run(merged, calc, ["substratum"])
+
+        df = synthetic_survey(rows=20)
+        df["habitat"] = df["habitat"].astype(object)
+        df.loc[0, "habitat"] = 1
+        shm, kind, _ = calc_pool.share_frame(df)
+        shm.close()
+        shm.unlink()
+
+        assert kind == "pickle"
+        assert self.pool.run(df, "count", ["habitat"]) == {"habitat": {"Number": [4]}}
+
+    def test_pool_busy(self):
+        """
+        test_pool_busy: new calculations are refused when the pool is full
+        """
+        df = synthetic_survey(rows=20)
+        started, release = threading.Event(), threading.Event()
+        share_frame = calc_pool.share_frame
+
+        def blocked_share_frame(frame):
+            started.set()
+            release.wait(10)
+            return share_frame(frame)
+
+        with mock.patch.object(calc_pool, "share_frame", blocked_share_frame):
+            thread = threading.Thread(
+                target=self.pool.run, args=(df, "count", ["habitat"])
+            )
+            thread.start()
+            started.wait(10)
+            with self.assertRaises(PoolBusy):
+                self.pool.run(df, "count", ["habitat"])
+            assert self.pool.stats()["in_use"] == 1
+            release.set()
+            thread.join(30)
+        assert self.pool.stats()["in_use"] == 0
@@ -0,0 +1,157 @@
+"""
+Pytest codes for the compression of the responses. To run the tests, you need to
+run make test
+"""
+
+import zlib
+from unittest import TestCase
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+from api.compression import CompressionMiddleware, CompressionStats
+
+BODY = b'{"value": 1234567890}' * 500
+
+
+def compressed_app(
+    stats: CompressionStats, thread_size: int = 262144, encoding: str = "gzip"
+):
+    """
+    compressed_app: application with a small, a large, a parquet and a streamed
+    response, behind CompressionMiddleware with gzip or another encoding
+    """
+    app = FastAPI()
+
+    @app.get("/small")
+    def small():
+        return Response(b"{}", media_type="application/json")
+
+    @app.get("/large")
+    def large():
+        return Response(
+            BODY, media_type="application/json", headers={"ETag": '"large"'}
+        )
+
+    @app.get("/parquet")
+    def parquet():
+        return Response(BODY, media_type="application/vnd.apache.parquet")
+
+    @app.get("/stream")
+    def stream():
+        chunks = [BODY[start:][:1000] for start in range(0, len(BODY), 1000)]
+        return StreamingResponse(
+            iter(chunks),
+            media_type="application/x-ndjson",
+        )
+
+    app.add_middleware(
+        CompressionMiddleware,
+        encodings=[encoding],
+        thread_size=thread_size,
+        stats=stats,
+    )
+    return app
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_gzip: large responses are compressed by the Accept-Encoding
+            header, and the bytes saved are counted
+            - test_skip: small responses, already compressed formats and requests
+            without Accept-Encoding are not compressed
+            - test_stream: streamed responses are compressed chunk by chunk
+            - test_optional_encodings: large and streamed responses are
+            compressed with br and zstd, if brotli and zstandard are installed
+    """
+
+    def test_gzip(self):
+        """
+        Test that large responses are compressed by the Accept-Encoding header,
+        also on a worker thread, and the bytes saved are counted
+        """
+        for thread_size in (262144, 0):
+            stats = CompressionStats()
+            client = TestClient(compressed_app(stats, thread_size))
+            response = client.get(
+                "/large", headers={"Accept-Encoding": "br;q=1, gzip;q=0.5"}
+            )
+            self.assertEqual(response.headers["content-encoding"], "gzip")
+            self.assertEqual(response.headers["vary"], "Accept-Encoding")
+            self.assertEqual(response.headers["etag"], 'W/"large"')
+            self.assertEqual(response.content, BODY)
+
+            gzip_stats = stats.stats()["encodings"]["gzip"]
+            self.assertEqual(gzip_stats["bytes_in"], len(BODY))
+            self.assertLess(gzip_stats["bytes_out"], len(BODY) / 10)
+            self.assertEqual(
+                int(response.headers["content-length"]), gzip_stats["bytes_out"]
+            )
+
+    def test_skip(self):
+        """
+        Test that small responses, already compressed formats and requests
+        without Accept-Encoding are not compressed
+        """
+        stats = CompressionStats()
+        client = TestClient(compressed_app(stats))
+        for path, encoding in (
+            ("/small", "gzip"),
+            ("/parquet", "gzip"),
+            ("/large", "identity"),
+            ("/large", "gzip;q=0"),
+        ):
+            response = client.get(path, headers={"Accept-Encoding": encoding})
+            self.assertNotIn("content-encoding", response.headers)
+            if path == "/large":
+                self.assertEqual(response.headers["etag"], '"large"')
+        self.assertEqual(stats.stats(), {"encodings": {}, "skipped": 2})
+
+    def test_stream(self):
+        """
+        Test that streamed responses are compressed chunk by chunk
+        """
+        stats = CompressionStats()
+        client = TestClient(compressed_app(stats))
+        with client.stream(
+            "GET", "/stream", headers={"Accept-Encoding": "gzip"}
+        ) as response:
+            raw = b"".join(response.iter_raw())
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertNotIn("content-length", response.headers)
+        self.assertEqual(zlib.decompress(raw, 16 + zlib.MAX_WBITS), BODY)
+        self.assertGreater(stats.stats()["encodings"]["gzip"]["chunks"], 1)
+
+    def test_optional_encodings(self):
+        """
+        Test that large and streamed responses are compressed with br and zstd,
+        if brotli and zstandard are installed
+        """
+        brotli = pytest.importorskip("brotli")
+        zstandard = pytest.importorskip("zstandard")
+        for encoding, decompress in (
+            ("br", brotli.decompress),
+            (
+                "zstd",
+                lambda raw: zstandard.ZstdDecompressor()
+                .decompressobj()
+                .decompress(raw),
+            ),
+        ):
+            stats = CompressionStats()
+            client = TestClient(compressed_app(stats, encoding=encoding))
+            for path in ("/large", "/stream"):
+                with client.stream(
+                    "GET", path, headers={"Accept-Encoding": encoding}
+                ) as response:
+                    raw = b"".join(response.iter_raw())
+                self.assertEqual(response.headers["content-encoding"], encoding)
+                self.assertEqual(decompress(raw), BODY)
+            self.assertLess(
+                stats.stats()["encodings"][encoding]["bytes_out"], len(BODY) / 5
+            )
@@ -0,0 +1,83 @@
+"""
+Pytest codes for the store of the loaded datasets, using a local folder instead
+of the object store. To run the tests, you need to run make test
+"""
+
+import tempfile
+from unittest import TestCase, mock
+
+import pandas as pd
+
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc import get_bucket
+from use_cases_calc.dataset_store import DatasetStore
+from use_cases_calc.get_bucket import GetBucket
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_store: the datasets are loaded once by version, the views do
+            not change the stored frames and the store is bounded
+            - test_requests: the requests of the same files share the loaded
+            files until the files change
+    """
+
+    def test_store(self):
+        """
+        test_store: the datasets are loaded once by version, the views do not
+        change the stored frames and the store is bounded
+        """
+        store = DatasetStore(max_entries=2)
+        loads = []
+
+        def loader(name):
+            loads.append(name)
+            return pd.DataFrame({"value": [1, 2, 3]})
+
+        view = store.load("a", "v1", loader, "a")
+        view["extra"] = 0
+        view.drop(columns="value", inplace=True)
+        assert list(store.load("a", "v1", loader, "a").columns) == ["value"]
+        assert loads == ["a"]
+
+        store.load("a", "v2", loader, "a2")
+        assert store.get("a", "v1") is None
+        store.load("b", "v1", loader, "b")
+        store.load("c", "v1", loader, "c")
+        store.load("d", None, loader, "d")
+        assert loads == ["a", "a2", "b", "c", "d"]
+        assert store.get("a", "v2") is None
+        assert store.get("b", "v1") is not None
+        stats = store.stats()
+        assert (stats["entries"], stats["loads"], stats["evictions"]) == (2, 4, 1)
+
+    def test_requests(self):
+        """
+        test_requests: the requests of the same files share the loaded files
+        until the files change
+        """
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.object(
+            get_bucket, "datasets", DatasetStore()
+        ), mock.patch.object(
+            get_bucket, "read_url", wraps=get_bucket.read_url
+        ) as read_url:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=30)})
+            first = GetBucket()
+            first.get_csv(filenames=["layers:survey.csv"])
+            first.clip_data(
+                "-6.5,50.3,-6.45,50.35", "EPSG:4326", ["latitude", "longitude"]
+            )
+            second = GetBucket()
+            second.get_csv(filenames=["layers:survey.csv"])
+            assert read_url.call_count == 1
+            assert len(second.df) == 30
+            assert "geometry" not in second.df.columns
+
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=40)})
+            third = GetBucket()
+            third.get_csv(filenames=["layers:survey.csv"])
+            assert read_url.call_count == 2
+            assert len(third.df) == 40
@@ -0,0 +1,132 @@
+"""
+Pytest codes for the metrics of the API, using a local folder instead of the
+object store. To run the tests, you need to run make test
+"""
+
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from fastapi.testclient import TestClient
+
+from api.fast import app
+from api.v1 import calc
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc.calc_pool import CalcPool
+from use_cases_calc.metrics import MetricsRegistry
+
+
+def sample(metrics: str, name: str):
+    """
+    sample: value of a sample of the metrics, or 0 if it does not exist
+    """
+    for line in metrics.splitlines():
+        if line.startswith(f"{name} "):
+            return float(line.split(" ")[-1])
+    return 0.0
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_format: counters, histograms and gauges are written in the
+            Prometheus text format
+            - test_local_run: the metrics of a local run have the latency of the
+            routes, of the known methods and calc types, the stages, the bytes fetched,
+            the caches, the memory and the cpu time
+    """
+
+    def test_format(self):
+        """
+        test_format: counters, histograms and gauges are written in the
+        Prometheus text format
+        """
+        registry = MetricsRegistry()
+        counter = registry.counter("fetched_total", "Bytes", ("file",))
+        histogram = registry.histogram("latency", "Latency", ("route",), (0.1, 1.0))
+        registry.add_collector("size", "Size", (), lambda: {(): 3})
+        registry.add_collector("cpu_total", "Cpu", (), lambda: {(): 1.5}, "counter")
+        counter.inc(10, ('a"b',))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value, ("/",))
+
+        assert registry.render().splitlines() == [
+            "# HELP fetched_total Bytes",
+            "# TYPE fetched_total counter",
+            'fetched_total{file="a\\"b"} 10',
+            "# HELP latency Latency",
+            "# TYPE latency histogram",
+            'latency_bucket{route="/",le="0.1"} 2',
+            'latency_bucket{route="/",le="1.0"} 3',
+            'latency_bucket{route="/",le="+Inf"} 4',
+            'latency_count{route="/"} 4',
+            'latency_sum{route="/"} 2.65',
+            "# HELP size Size",
+            "# TYPE size gauge",
+            "size 3",
+            "# HELP cpu_total Cpu",
+            "# TYPE cpu_total counter",
+            "cpu_total 1.5",
+        ]
+
+    def test_local_run(self):
+        """
+        test_local_run: the metrics of a local run have the latency of the
+        routes, of the known methods and calc types, the stages, the bytes fetched, the
+        caches, the memory and the cpu time
+        """
+        client = TestClient(app)
+        names = [
+            'http_request_duration_seconds_count{method="GET",route="/v1/calc/",status="200"}',
+            'calc_request_duration_seconds_count{calc="biodiversity3,count"}',
+            'request_stage_duration_seconds_count{stage="fetch"}',
+            'request_stage_duration_seconds_count{stage="calc.biodiversity3"}',
+            'request_stage_duration_seconds_count{stage="serialize"}',
+            "object_store_fetched_bytes_total",
+            'cache_misses{cache="calc"}',
+        ]
+        before = client.get("/metrics").text
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.object(
+            calc, "calc_pool", CalcPool(processes=0)
+        ):
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=30)})
+            size = os.path.getsize(
+                os.path.join(base_dir, "haig-fras", "layers", "survey.csv")
+            )
+            response = client.get(
+                "/v1/calc/",
+                params={
+                    "filenames": "layers:survey",
+                    "calc": "count,biodiversity3",
+                    "calc_columns": "habitat",
+                },
+            )
+            assert response.status_code == 200
+            response = client.get("/metrics")
+            assert response.headers["content-type"].startswith("text/plain")
+            # the calc types of the clients do not create new series
+            for calc_types in ("count,made_up", "count,other_made_up"):
+                client.get(
+                    "/v1/calc/",
+                    params={
+                        "filenames": "layers:survey",
+                        "calc": calc_types,
+                        "calc_columns": "habitat",
+                    },
+                )
+            # nor the methods of the clients
+            client.request("MADEUP", "/v1/calc/")
+            after = client.get("/metrics").text
+
+        deltas = [sample(response.text, name) - sample(before, name) for name in names]
+        assert deltas == [1, 1, 1, 1, 1, size, 1]
+        name = 'calc_request_duration_seconds_count{calc="count,other"}'
+        assert sample(after, name) - sample(response.text, name) == 2
+        assert "made_up" not in after
+        name = 'http_request_duration_seconds_count{method="other",route="/v1/calc/",status="405"}'
+        assert sample(after, name) - sample(response.text, name) == 1
+        assert "MADEUP" not in after
+        assert sample(after, "process_cpu_seconds_total") > 0
+        assert sample(response.text, 'process_memory_bytes{kind="peak"}') > 0
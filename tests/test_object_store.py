@@ -0,0 +1,104 @@
+"""
+Pytest codes for the local stand-in of the object store and the load test. To
+run the tests, you need to run make test
+"""
+
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import requests
+from cryptography.fernet import Fernet
+
+from benchmarks.load_test import replay
+from benchmarks.object_store import LocalObjectStore, write_fixtures
+from use_cases_calc.get_bucket import GetBucket
+from use_cases_calc.get_user import GetUser
+
+OTHERDATA = "layers:seabed_images:hf2012:HF2012_alltile_otherdata"
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_get_bucket: GetBucket opens the files and their versions
+            from the stand-in
+            - test_signed_url: the presigned urls of GetUser can be downloaded
+            from the stand-in
+            - test_replay: the load test reports the latency of each route
+    """
+
+    def test_get_bucket(self):
+        """
+        test_get_bucket: GetBucket opens the files and their versions from the
+        stand-in
+        """
+        with tempfile.TemporaryDirectory() as root:
+            write_fixtures(root, rows=50)
+            with LocalObjectStore(root) as store:
+                data = GetBucket(base_url=store.url)
+                versions = data.get_versions([f"{OTHERDATA}.csv"])
+                data.get_csv(filenames=[f"{OTHERDATA}.csv"])
+
+                url = f"{data.base_url}{OTHERDATA.replace(':', '/')}.csv"
+                etag = versions[f"{OTHERDATA}.csv"]["version"]
+                response = requests.get(
+                    url, headers={"If-None-Match": etag}, timeout=10
+                )
+
+        assert len(data.df) == 50
+        assert versions[f"{OTHERDATA}.csv"]["size"] > 0
+        assert response.status_code == 304
+
+    def test_signed_url(self):
+        """
+        test_signed_url: the presigned urls of GetUser can be downloaded from
+        the stand-in
+        """
+        key = Fernet.generate_key()
+        with tempfile.TemporaryDirectory() as root:
+            path = os.path.join(root, "haig-fras-private", "private", "data.csv")
+            os.makedirs(os.path.dirname(path))
+            with open(path, "w", encoding="utf-8") as file:
+                file.write("a,b\n1,2\n")
+
+            with LocalObjectStore(root) as store, mock.patch.dict(
+                os.environ,
+                {
+                    "JASMIN_API_URL": store.url,
+                    "JASMIN_TOKEN": "token",
+                    "JASMIN_SECRET": "secret",
+                    "HASH_TOKEN": key.decode(),
+                },
+            ):
+                assets = GetUser(bucket="haig-fras-private").signed_url(
+                    '{"layers": {"data": {"url": "private/data.csv"}}}'
+                )
+                signed_url = Fernet(key).decrypt(
+                    assets["layers"]["data"]["signed_url"].encode()
+                )
+                response = requests.get(signed_url.decode(), timeout=10)
+
+        assert response.status_code == 200
+        assert response.text == "a,b\n1,2\n"
+
+    def test_replay(self):
+        """
+        test_replay: the load test reports the latency of each route
+        """
+        log = [
+            {"method": "GET", "path": f"/haig-fras/{OTHERDATA.replace(':', '/')}.csv"},
+            {"method": "GET", "path": "/haig-fras/missing.csv", "route": "missing"},
+        ]
+        with tempfile.TemporaryDirectory() as root:
+            write_fixtures(root, rows=20)
+            with LocalObjectStore(root) as store:
+                result = replay(store.url, log, concurrency=4, total=20)
+
+        assert result["requests"] == 20
+        assert result["routes"]["missing"]["errors"] == 10
+        stats = result["routes"][f"GET {log[0]['path']}"]
+        assert stats["errors"] == 0
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"]
@@ -0,0 +1,84 @@
+"""
+Pytest codes for the dense and sparse organism matrix. To run the tests,
+you need to run make test
+"""
+
+from unittest import TestCase, mock
+
+import numpy as np
+
+from tests.synthetic import synthetic_survey
+from use_cases_calc.calc_planner import CalcPlanner
+from use_cases_calc.organism_matrix import OrganismMatrix
+from use_cases_calc.organisms import all_organisms
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_sparse_operations: the sparse matrix gives the same results
+            as the dense matrix
+            - test_memory_report: the sparse matrix uses less memory on
+            sparse surveys
+            - test_sparse_calculations: the calculations give the same results
+            with both matrices
+    """
+
+    def test_sparse_operations(self):
+        """
+        test_sparse_operations: the sparse matrix gives the same results
+        as the dense matrix
+        """
+        block = synthetic_survey()[all_organisms]
+        dense = OrganismMatrix.from_frame(block, mode="dense")
+        sparse = OrganismMatrix.from_frame(block, mode="sparse")
+        assert sparse.is_sparse and not dense.is_sparse
+
+        totals = dense.row_sums()
+        np.testing.assert_array_equal(sparse.to_dense(), dense.to_dense())
+        np.testing.assert_array_equal(sparse.row_sums(), totals)
+        np.testing.assert_array_equal(sparse.column_sums(), dense.column_sums())
+        np.testing.assert_array_equal(sparse.row_positive(), dense.row_positive())
+        np.testing.assert_allclose(
+            sparse.row_shannon(totals), dense.row_shannon(totals)
+        )
+        np.testing.assert_allclose(
+            sparse.row_simpson(totals), dense.row_simpson(totals)
+        )
+        codes = np.arange(len(block)) % 3 - 1
+        np.testing.assert_array_equal(
+            sparse.group_sums(codes, 2), dense.group_sums(codes, 2)
+        )
+
+    def test_memory_report(self):
+        """
+        test_memory_report: the sparse matrix uses less memory on
+        sparse surveys
+        """
+        block = synthetic_survey(rows=1000)[all_organisms]
+        matrix = OrganismMatrix.from_frame(block, mode="auto")
+        report = matrix.memory_report()
+
+        assert report["representation"] == "sparse"
+        assert report["density"] < 0.25
+        assert report["bytes"] < report["dense_bytes"]
+        assert report["saved_bytes"] == report["dense_bytes"] - report["bytes"]
+
+    def test_sparse_calculations(self):
+        """
+        test_sparse_calculations: the calculations give the same results
+        with both matrices
+        """
+        df = synthetic_survey()
+        results = []
+        for mode in ("dense", "sparse"):
+            with mock.patch.dict("os.environ", {"ORGANISM_MATRIX": mode}):
+                planner = CalcPlanner(df)
+                steps = planner.plan(
+                    "biodiversity4,biodiversity5,agg", ["substratum"], "density:"
+                )
+                results.append(planner.run(steps, agg_columns="density:"))
+                assert planner.get("organism_matrix").is_sparse == (mode == "sparse")
+        assert results[0] == results[1]
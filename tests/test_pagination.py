@@ -0,0 +1,70 @@
+"""
+Pytest codes for the pagination of the data endpoints, using a local folder
+instead of the object store. To run the tests, you need to run make test
+"""
+
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from fastapi import HTTPException
+
+from api.v1.data import open_csv, page_cache
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc.get_bucket import GetBucket
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_pages: the pages have all the rows, and the files are loaded
+            only once
+            - test_stale_cursor: cursors of files that changed and cursors of
+            other requests are refused
+    """
+
+    def test_pages(self):
+        """
+        test_pages: the pages have all the rows, and the files are loaded
+        only once
+        """
+        page_cache.clear()
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=25)})
+            records = open_csv(filenames="layers:survey")
+            with mock.patch.object(
+                GetBucket, "get_csv", autospec=True, side_effect=GetBucket.get_csv
+            ) as get_csv:
+                rows, cursor = [], None
+                while True:
+                    page = open_csv(filenames="layers:survey", limit=10, cursor=cursor)
+                    rows += page["data"]
+                    cursor = page["next_cursor"]
+                    if cursor is None:
+                        break
+                assert get_csv.call_count == 1
+        assert rows == records
+
+    def test_stale_cursor(self):
+        """
+        test_stale_cursor: cursors of files that changed and cursors of
+        other requests are refused
+        """
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=25)})
+            cursor = open_csv(filenames="layers:survey", limit=10)["next_cursor"]
+
+            with self.assertRaises(HTTPException) as error:
+                open_csv(filenames="layers:survey", columns="a:1", cursor=cursor)
+            assert error.exception.status_code == 400
+            with self.assertRaises(HTTPException) as error:
+                open_csv(filenames="layers:survey", cursor="not a cursor")
+            assert error.exception.status_code == 400
+
+            time.sleep(0.01)
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=30)})
+            with self.assertRaises(HTTPException) as error:
+                open_csv(filenames="layers:survey", limit=10, cursor=cursor)
+            assert error.exception.status_code == 410
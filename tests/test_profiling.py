@@ -0,0 +1,88 @@
+"""
+Pytest codes for the profiling of the requests, using a local folder instead of
+the object store. To run the tests, you need to run make test
+"""
+
+import marshal
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from fastapi.testclient import TestClient
+
+from api.fast import app
+from api.v1 import calc
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc.result_cache import ResultCache
+
+PARAMS = {
+    "filenames": "layers:survey",
+    "calc": "biodiversity4",
+    "calc_columns": "habitat",
+    "profile": "true",
+}
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_gated: the requests are only profiled with the profiling token
+            - test_report: the report of a profiled request has the calculations,
+            the memory and the profile for download
+    """
+
+    def test_gated(self):
+        """
+        test_gated: the requests are only profiled with the profiling token
+        """
+        client = TestClient(app)
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=20)})
+            response = client.get("/v1/calc/", params=PARAMS)
+            assert response.status_code == 200
+            assert "x-profile-id" not in response.headers
+
+            with mock.patch.dict(os.environ, {"PROFILE_TOKEN": "secret"}):
+                response = client.get(
+                    "/v1/calc/", params=PARAMS, headers={"X-Profile-Token": "wrong"}
+                )
+                assert response.status_code == 403
+                response = client.get(
+                    "/profiles/abc", headers={"X-Profile-Token": "wrong"}
+                )
+                assert response.status_code == 403
+
+    def test_report(self):
+        """
+        test_report: the report of a profiled request has the calculations,
+        the memory and the profile for download
+        """
+        client = TestClient(app)
+        headers = {"X-Profile-Token": "secret"}
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.object(
+            calc, "calc_cache", ResultCache(max_entries=0)
+        ), mock.patch.dict(os.environ, {"PROFILE_TOKEN": "secret"}):
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=20)})
+            response = client.get("/v1/calc/", params=PARAMS, headers=headers)
+            assert response.status_code == 200
+            profile_id = response.headers["x-profile-id"]
+
+            report = client.get(f"/profiles/{profile_id}", headers=headers).json()
+            text = client.get(
+                f"/profiles/{profile_id}", params={"format": "text"}, headers=headers
+            ).text
+            dump = client.get(
+                f"/profiles/{profile_id}", params={"format": "pstats"}, headers=headers
+            ).content
+
+        assert report["functions"][0]["cumulative_ms"] > 0
+        assert report["memory"]["peak_bytes"] > 0
+        assert report["memory"]["top_allocations"]
+        assert "cumulative" in text
+        functions = marshal.loads(dump)
+        assert any(
+            function[0].endswith("calc_planner.py") and function[2] == "biodiversity4"
+            for function in functions
+        )
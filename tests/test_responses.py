@@ -0,0 +1,111 @@
+"""
+Pytest codes for the json serialization of the responses, using a local folder
+instead of the object store. To run the tests, you need to run make test
+"""
+
+import json
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+
+from api.responses import FastJSONResponse
+from api.v1 import calc, data
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc.get_bucket import GetBucket
+from use_cases_calc.result_cache import ResultCache
+from use_cases_calc.serializers import dumps
+
+
+def get_route(router, path: str):
+    """
+    get_route: route of a router by path
+    """
+    return next(route for route in router.routes if route.path == path)
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_dumps: numpy values, missing values and timestamps are
+            serialized without jsonable_encoder
+            - test_route_response: the data endpoint returns a FastJSONResponse,
+            with the same records of the endpoint function
+            - test_etag: the data and calc responses have ETags, and requests
+            with a matching If-None-Match are answered with 304 without loading
+            the files
+    """
+
+    def test_dumps(self):
+        """
+        test_dumps: numpy values, missing values and timestamps are
+        serialized without jsonable_encoder
+        """
+        value = {
+            "int": np.int64(3),
+            "float": np.float32(1.5),
+            "nan": np.nan,
+            "array": np.array([1.0, np.nan]),
+            "objects": np.array(["a", None], dtype=object),
+            "time": pd.Timestamp("2020-01-01 10:00"),
+            "missing": [pd.NaT, pd.NA],
+        }
+        assert json.loads(dumps(value)) == {
+            "int": 3,
+            "float": 1.5,
+            "nan": None,
+            "array": [1.0, None],
+            "objects": ["a", None],
+            "time": "2020-01-01T10:00:00",
+            "missing": [None, None],
+        }
+        assert json.loads(dumps({np.int64(1): "a"})) == {"1": "a"}
+
+    def test_route_response(self):
+        """
+        test_route_response: the data endpoint returns a FastJSONResponse,
+        with the same records of the endpoint function
+        """
+        route = get_route(data.router, "/csv")
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=20)})
+            response = route.endpoint(filenames="layers:survey")
+            records = route.endpoint.__wrapped__(filenames="layers:survey")
+
+        assert isinstance(response, FastJSONResponse)
+        assert isinstance(records, list)
+        assert json.loads(response.body) == records
+
+    def test_etag(self):
+        """
+        test_etag: the data and calc responses have ETags, and requests
+        with a matching If-None-Match are answered with 304 without loading
+        the files
+        """
+        routes = [
+            (get_route(data.router, "/csv"), {"filenames": "layers:survey"}),
+            (
+                get_route(calc.router, "/"),
+                {"filenames": "layers:survey", "calc_columns": "habitat"},
+            ),
+        ]
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.object(
+            calc, "calc_cache", ResultCache(max_entries=0)
+        ):
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=20)})
+            for route, params in routes:
+                response = route.endpoint(**params)
+                etag = response.headers["ETag"]
+                assert response.status_code == 200
+                assert "max-age" in response.headers["Cache-Control"]
+
+                with mock.patch.object(GetBucket, "get_csv") as get_csv:
+                    response = route.endpoint(**params, if_none_match=etag)
+                    assert response.status_code == 304
+                    assert response.headers["ETag"] == etag
+                    assert get_csv.call_count == 0
+                response = route.endpoint(**params, if_none_match='"other"')
+                assert response.status_code == 200
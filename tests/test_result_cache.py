@@ -0,0 +1,96 @@
+"""
+Pytest codes for the cache of calc results, using a local folder
+instead of the object store. To run the tests, you need to run make test
+"""
+
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from api.v1.calc import calc_cache, calc_results
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc.get_bucket import GetBucket
+from use_cases_calc.request_key import normalize_params, request_hash
+from use_cases_calc.result_cache import ResultCache
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_lru: the least recently used entry is removed
+            - test_ttl: the entries expire after the ttl
+            - test_normalize_params: equivalent requests have the same key
+            - test_calc_cache: a repeated calc request does not load the files,
+            and a new version of the files is calculated again
+    """
+
+    def test_lru(self):
+        """
+        test_lru: the least recently used entry is removed
+        """
+        cache = ResultCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["hits"] == 3
+        assert cache.stats()["misses"] == 1
+
+    def test_ttl(self):
+        """
+        test_ttl: the entries expire after the ttl
+        """
+        cache = ResultCache(max_entries=2, ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        assert cache.get("a") is None
+        assert cache.stats()["entries"] == 0
+
+    def test_normalize_params(self):
+        """
+        test_normalize_params: equivalent requests have the same key
+        """
+        first = normalize_params(filenames="b,a", bbox="-10,50.36,5,50.37", crs="")
+        second = normalize_params(
+            filenames="a,b", bbox="-10.0, 50.360, 5.0, 50.37", crs=None
+        )
+        third = normalize_params(filenames="a,b", bbox="-10,50.36,5,50.38", crs="")
+
+        assert first == second
+        assert request_hash(first) == request_hash(second)
+        assert request_hash(first) != request_hash(third)
+
+    def test_calc_cache(self):
+        """
+        test_calc_cache: a repeated calc request does not load the files,
+        and a new version of the files is calculated again
+        """
+        calc_cache.clear()
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey()})
+            with mock.patch.object(
+                GetBucket, "get_csv", autospec=True, side_effect=GetBucket.get_csv
+            ) as get_csv:
+                value = calc_results(
+                    filenames="layers:survey", calc="count", calc_columns="habitat"
+                )
+                value_cached = calc_results(
+                    filenames="layers:survey", calc="count", calc_columns="habitat"
+                )
+                assert get_csv.call_count == 1
+                assert value_cached == value == {"habitat": {"Number": [3]}}
+
+                time.sleep(0.01)
+                write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=5)})
+                calc_results(
+                    filenames="layers:survey", calc="count", calc_columns="habitat"
+                )
+                assert get_csv.call_count == 2
+        assert calc_cache.stats()["hits"] == 1
@@ -0,0 +1,86 @@
+"""
+Pytest codes for the stale-while-revalidate of the dataset store, using the
+local stand-in of the object store. To run the tests, you need to run make test
+"""
+
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from benchmarks.object_store import LocalObjectStore
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc import get_bucket
+from use_cases_calc.dataset_store import DatasetStore
+from use_cases_calc.get_bucket import GetBucket
+
+
+def rows(name: str):
+    """
+    rows: number of rows of a file, opened by a new request
+    """
+    data = GetBucket()
+    data.get_csv(filenames=[f"{name}.csv"])
+    return len(data.df)
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_stale_while_revalidate: a changed file is served stale while
+            one revalidation loads it on the background, and then swapped
+            - test_refresh_hot: the files of the hot datasets are revalidated
+            by the refresh, and the other datasets are not
+    """
+
+    def test_stale_while_revalidate(self):
+        """
+        test_stale_while_revalidate: a changed file is served stale while one
+        revalidation loads it on the background, and then swapped
+        """
+        store = DatasetStore(fresh_ttl=0, stale_ttl=3600, refresh_interval=0)
+        with tempfile.TemporaryDirectory() as base_dir, LocalObjectStore(
+            base_dir
+        ) as server, mock.patch.object(get_bucket, "datasets", store):
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=30)})
+            with mock.patch.dict(os.environ, {"JASMIN_API_URL": server.url}):
+                assert rows("layers:survey") == 30
+                write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=40)})
+                os.environ["JASMIN_API_URL"] = server.url
+
+                assert rows("layers:survey") == 30
+                deadline = time.monotonic() + 10
+                while store.stats()["swaps"] == 0 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                assert rows("layers:survey") == 40
+                # the new version was loaded by the revalidation, not by a request
+                stats = store.stats()
+                assert (stats["loads"], stats["swaps"]) == (1, 1)
+
+    def test_refresh_hot(self):
+        """
+        test_refresh_hot: the files of the hot datasets are revalidated by the
+        refresh, and the other datasets are not
+        """
+        store = DatasetStore(fresh_ttl=3600, refresh_interval=0)
+        with tempfile.TemporaryDirectory() as base_dir, LocalObjectStore(
+            base_dir
+        ) as server, mock.patch.object(get_bucket, "datasets", store):
+            files = {"layers:hot": synthetic_survey(rows=30)}
+            files["layers:cold"] = files["layers:hot"]
+            write_bucket(base_dir, files)
+            with mock.patch.dict(os.environ, {"JASMIN_API_URL": server.url}):
+                assert rows("layers:hot") == rows("layers:cold") == 30
+                assert store.refresh_hot() == []
+
+                assert rows("layers:hot") == 30
+                files = {name: synthetic_survey(rows=40) for name in files}
+                write_bucket(base_dir, files)
+                os.environ["JASMIN_API_URL"] = server.url
+                assert store.refresh_hot() == [f"{server.url}haig-fras/layers/hot.csv"]
+
+                assert rows("layers:hot") == 40
+                assert rows("layers:cold") == 30
+        assert store.stats()["loads"] == 2
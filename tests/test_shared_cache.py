@@ -0,0 +1,116 @@
+"""
+Pytest codes for the results of calc shared on a database, using SQLite
+instead of Postgres and a local folder instead of the object store. To run the
+tests, you need to run make test
+"""
+
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from alembic import command
+from alembic.config import Config
+from api.v1 import calc
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc import shared_cache
+from use_cases_calc.get_bucket import GetBucket
+from use_cases_calc.result_cache import ResultCache
+from use_cases_calc.shared_cache import SharedResultCache
+
+
+def upgrade(url: str):
+    """
+    upgrade: run the alembic migrations on a database
+    """
+    config = Config()
+    config.set_main_option("script_location", "alembic")
+    with mock.patch.dict(os.environ, {"DATABASE_URL": url}):
+        command.upgrade(config, "head")
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_migration: the table created by the migrations keeps the last
+            version of each request, and the expired results are purged
+            - test_instances: a result calculated by an instance of the API is
+            used by the other instances of a database without migrations, and
+            the requests do not fail when the database fails
+    """
+
+    def test_migration(self):
+        """
+        test_migration: the table created by the migrations keeps the last
+        version of each request, and the expired results are purged
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            url = f"sqlite:///{os.path.join(directory, 'api.db')}"
+            upgrade(url)
+            cache = SharedResultCache(url, ttl=60)
+            cache.set("a", "v1", {"habitat": {"Number": [3]}})
+            cache.set("a", "v2", {"habitat": {"Number": [5]}})
+            assert cache.get("a", "v1") is None
+            assert cache.get("a", "v2") == {"habitat": {"Number": [5]}}
+
+            expired = SharedResultCache(url, ttl=0.01)
+            expired.set("b", "v1", [1, 2])
+            expired.set("c", "v1", [3])
+            time.sleep(0.02)
+            assert cache.get("b", "v1") is None
+            assert cache.purge() == 2
+            assert cache.purge(expired_only=False) == 1
+            stats = cache.stats()
+            assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 0)
+            cache._engine.dispose()  # pylint: disable=protected-access
+
+    def test_instances(self):
+        """
+        test_instances: a result calculated by an instance of the API is used by
+        the other instances of a database without migrations, and the requests
+        do not fail when the database fails
+        """
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.object(
+            GetBucket, "get_csv", autospec=True, side_effect=GetBucket.get_csv
+        ) as get_csv:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey()})
+            # the table is created when the cache connects
+            shared = SharedResultCache(f"sqlite:///{os.path.join(base_dir, 'api.db')}")
+            values = []
+            # each instance has its own cache of results in memory
+            for _ in range(2):
+                with mock.patch.object(
+                    calc, "calc_cache", ResultCache()
+                ), mock.patch.object(calc, "shared_cache", shared):
+                    values.append(
+                        calc.calc_results(
+                            filenames="layers:survey",
+                            calc="count",
+                            calc_columns="habitat",
+                        )
+                    )
+            assert get_csv.call_count == 1
+            assert values[0] == values[1] == {"habitat": {"Number": [3]}}
+            stats = shared.stats()
+            assert (stats["hits"], stats["writes"], stats["entries"]) == (1, 1, 1)
+            # the number of results is counted again only after ENTRIES_TTL
+            shared.set("other", "v1", [1])
+            assert shared.stats()["entries"] == 1
+            with mock.patch.object(shared_cache, "ENTRIES_TTL", 0):
+                assert shared.stats()["entries"] == 2
+            shared._engine.dispose()  # pylint: disable=protected-access
+
+            failing = SharedResultCache(
+                f"sqlite:///{os.path.join(base_dir, 'missing', 'api.db')}"
+            )
+            with mock.patch.object(
+                calc, "calc_cache", ResultCache()
+            ), mock.patch.object(calc, "shared_cache", failing):
+                value = calc.calc_results(
+                    filenames="layers:survey", calc="count", calc_columns="habitat"
+                )
+            assert value == values[0]
+            assert failing.stats()["errors"] == 1
+            assert not failing.enabled
@@ -0,0 +1,151 @@
+"""
+Pytest codes for the coalescing of the concurrent requests, using a local
+folder instead of the object store. To run the tests, you need to run make test
+"""
+
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+
+from api.v1 import calc, data
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc import get_bucket
+from use_cases_calc.calc_pool import CalcPool
+from use_cases_calc.dataset_store import DatasetStore
+from use_cases_calc.result_cache import ResultCache
+from use_cases_calc.single_flight import SingleFlight
+
+
+def concurrently(function, calls: int):
+    """
+    concurrently: call a function from threads started at the same time
+    """
+    barrier = threading.Barrier(calls)
+
+    def call(index):
+        barrier.wait()
+        return function(index)
+
+    with ThreadPoolExecutor(max_workers=calls) as executor:
+        return list(executor.map(call, range(calls)))
+
+
+def slow_read(url):
+    """
+    slow_read: read_url that takes long enough for the calls to overlap
+    """
+    time.sleep(0.3)
+    return READ_URL(url)
+
+
+READ_URL = get_bucket.read_url
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_single_flight: the concurrent calls of a key run the function
+            once and share its result or its exception
+            - test_calc: the concurrent identical calc requests share one
+            download and one calculation
+            - test_open_csv: the concurrent identical csv requests share one load,
+            and different requests of the same file share its download
+    """
+
+    def test_single_flight(self):
+        """
+        test_single_flight: the concurrent calls of a key run the function once
+        and share its result or its exception
+        """
+        flight = SingleFlight()
+        runs = []
+
+        def compute(value):
+            runs.append(value)
+            time.sleep(0.2)
+            return {"value": value}
+
+        results = concurrently(lambda index: flight.do("key", compute, 1), 6)
+        assert runs == [1]
+        assert all(result is results[0] for result in results)
+        assert flight.stats() == {"leaders": 1, "shared": 5, "in_flight": 0}
+
+        def fail():
+            time.sleep(0.2)
+            raise ValueError("no data")
+
+        def call(index):
+            try:
+                flight.do("key", fail)
+            except ValueError as error:
+                return str(error)
+            return None
+
+        assert concurrently(call, 4) == ["no data"] * 4
+        assert flight.do("key", compute, 2) == {"value": 2}
+        assert flight.stats()["leaders"] == 3
+
+    def test_calc(self):
+        """
+        test_calc: the concurrent identical calc requests share one download and
+        one calculation
+        """
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.object(
+            calc, "calc_cache", ResultCache(max_entries=0)
+        ), mock.patch.object(
+            calc, "calc_pool", CalcPool(processes=0)
+        ), mock.patch.object(
+            calc, "_compute", wraps=calc._compute
+        ) as compute, mock.patch.object(
+            get_bucket, "read_url", side_effect=slow_read
+        ) as read_url:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=40)})
+            results = concurrently(
+                lambda index: calc.calc_results(
+                    filenames="layers:survey",
+                    calc="count",
+                    calc_columns="habitat",
+                    bbox="-7,50,-6,51",
+                    crs="EPSG:4326,EPSG:4326",
+                ),
+                6,
+            )
+        assert compute.call_count == 1
+        assert read_url.call_count == 1
+        assert all(result == results[0] for result in results)
+
+    def test_open_csv(self):
+        """
+        test_open_csv: the concurrent identical csv requests share one load, and
+        different requests of the same file share its download
+        """
+        data.page_cache.clear()
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.object(
+            data, "load_frame", wraps=data.load_frame
+        ) as load_frame, mock.patch.object(
+            get_bucket, "read_url", side_effect=slow_read
+        ) as read_url, mock.patch.object(
+            get_bucket, "datasets", DatasetStore()
+        ):
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=30)})
+            results = concurrently(
+                lambda index: data.open_csv(filenames="layers:survey"), 5
+            )
+            assert load_frame.call_count == 1
+            assert read_url.call_count == 1
+            assert all(result == results[0] for result in results)
+
+            # other datasets of the same file
+            results = concurrently(
+                lambda index: data.open_csv(
+                    filenames="layers:survey", columns=f"panel:{index}"
+                ),
+                3,
+            )
+            assert load_frame.call_count == 4
+            assert read_url.call_count == 2
+            assert [result[0]["panel"] for result in results] == ["0", "1", "2"]
@@ -0,0 +1,148 @@
+"""
+Pytest codes for the streaming and the formats of the data endpoints, using a local folder
+instead of the object store. To run the tests, you need to run make test
+"""
+
+import io
+import json
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from api.fast import app
+from api.v1.data import open_csv
+from tests.synthetic import synthetic_files, synthetic_survey, write_bucket
+from use_cases_calc.serializers import iter_json
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_iter_json: the streamed records are the records of the frame,
+            with null for missing values
+            - test_open_csv_stream: the data endpoint returns a streaming response
+            - test_open_csv_formats: the data endpoint returns Arrow, Parquet and csv,
+            by the format parameter or the Accept header, with the gaps of the
+            numeric columns as nulls
+            - test_vary_accept: the responses of the formats chosen by the Accept
+            header have different ETags and vary by Accept
+    """
+
+    def test_iter_json(self):
+        """
+        test_iter_json: the streamed records are the records of the frame,
+        with null for missing values
+        """
+        df = synthetic_survey(rows=25)
+        df.loc[3, "habitat"] = None
+        records = df.to_dict(orient="records")
+
+        array = json.loads(b"".join(iter_json(df, "json", batch_rows=7)))
+        lines = b"".join(iter_json(df, "ndjson", batch_rows=7)).splitlines()
+        assert len(lines) == len(array) == 25
+        assert [json.loads(line) for line in lines] == array
+        assert array[3]["habitat"] is None
+        assert array[0]["filename"] == records[0]["filename"]
+        assert np.isclose(array[24]["Area_m2"], records[24]["Area_m2"], rtol=1e-14)
+        assert json.loads(b"".join(iter_json(df.iloc[:0], "json"))) == []
+
+    def test_open_csv_stream(self):
+        """
+        test_open_csv_stream: the data endpoint returns a streaming response
+        """
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey()})
+            value = open_csv(filenames="layers:survey", stream="ndjson")
+            assert isinstance(value, StreamingResponse)
+            assert value.media_type == "application/x-ndjson"
+
+            with self.assertRaises(HTTPException) as error:
+                open_csv(filenames="layers:survey", stream="ndjson", orient="list")
+            assert error.exception.status_code == 400
+
+    def test_open_csv_formats(self):
+        """
+        test_open_csv_formats: the data endpoint returns Arrow, Parquet and csv,
+        by the format parameter or the Accept header, with the gaps of the
+        numeric columns as nulls
+        """
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey()})
+            records = pd.DataFrame(open_csv(filenames="layers:survey"))
+            arrow = open_csv(filenames="layers:survey", format="arrow")
+            parquet = open_csv(
+                filenames="layers:survey", accept="application/vnd.apache.parquet"
+            )
+            csv = open_csv(filenames="layers:survey", format="csv")
+
+            with self.assertRaises(HTTPException) as error:
+                open_csv(filenames="layers:survey", format="xlsx")
+            assert error.exception.status_code == 400
+
+        assert arrow.media_type == "application/vnd.apache.arrow.stream"
+        assert parquet.media_type == "application/vnd.apache.parquet"
+        frames = [
+            pa.ipc.open_stream(arrow.body).read_all().to_pandas(),
+            pd.read_parquet(io.BytesIO(parquet.body)),
+            pd.read_csv(io.BytesIO(csv.body)),
+        ]
+        for frame in frames:
+            pd.testing.assert_frame_equal(frame, records, check_dtype=False)
+
+        # the gaps of the numeric columns of merged files are Arrow nulls
+        files = synthetic_files(rows=50)
+        files["counts"] = files["counts"].iloc[:30]
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {f"layers:{name}": df for name, df in files.items()})
+            filenames = "layers:otherdata,layers:counts"
+            arrow = open_csv(filenames=filenames, format="arrow")
+            parquet = open_csv(filenames=filenames, format="parquet")
+        for table in (
+            pa.ipc.open_stream(arrow.body).read_all(),
+            pq.read_table(io.BytesIO(parquet.body)),
+        ):
+            for column in ("antedon", "Area_m2"):
+                assert pa.types.is_floating(table.schema.field(column).type)
+            assert table.column("antedon").null_count == 20
+
+    def test_vary_accept(self):
+        """
+        test_vary_accept: the responses of the formats chosen by the Accept
+        header have different ETags and vary by Accept
+        """
+        client = TestClient(app)
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey()})
+            responses = [
+                client.get(
+                    "/v1/data/csv",
+                    params={"filenames": "layers:survey"},
+                    headers={"Accept": accept},
+                )
+                for accept in (
+                    "application/json",
+                    "application/vnd.apache.arrow.stream",
+                )
+            ]
+            chosen = client.get(
+                "/v1/data/csv", params={"filenames": "layers:survey", "format": "arrow"}
+            )
+            not_modified = client.get(
+                "/v1/data/csv",
+                params={"filenames": "layers:survey"},
+                headers={"If-None-Match": responses[1].headers["ETag"]},
+            )
+
+        assert responses[0].headers["ETag"] != responses[1].headers["ETag"]
+        for response in responses + [not_modified]:
+            assert "Accept" in response.headers["Vary"].split(", ")
+        assert "Accept" not in chosen.headers.get("Vary", "").split(", ")
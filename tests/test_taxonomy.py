@@ -0,0 +1,76 @@
+"""
+Pytest codes for the taxonomy registry. To run the tests, you need to run make test
+"""
+
+from unittest import TestCase, mock
+
+import pandas as pd
+
+from use_cases_calc.calc_planner import CalcPlanner
+from use_cases_calc.organisms import all_organisms, all_organisms2
+from use_cases_calc.taxonomy import TaxonomyRegistry, taxonomy
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_resolve: the organism columns and positions of a schema
+            - test_cache: the schema is detected only once
+            - test_new_taxa: a new list of taxa is used by the calculations
+            - test_unknown: a schema without organisms raises KeyError
+    """
+
+    def test_resolve(self):
+        """
+        test_resolve: the organism columns and positions of a schema
+        """
+        columns = ["filename"] + all_organisms2[::-1] + ["Area_m2"]
+        schema = taxonomy.resolve(columns)
+
+        assert schema.name == "all_organisms2"
+        assert schema.columns == all_organisms2
+        assert [columns[i] for i in schema.positions] == all_organisms2
+
+        lower_columns = [column.lower() for column in all_organisms2]
+        schema = taxonomy.resolve(lower_columns)
+        assert schema.columns == lower_columns
+
+    def test_cache(self):
+        """
+        test_cache: the schema is detected only once
+        """
+        registry = TaxonomyRegistry({"all_organisms": all_organisms})
+        columns = pd.Index(["id"] + all_organisms)
+
+        assert registry.resolve(columns) is registry.resolve(list(columns))
+
+    def test_new_taxa(self):
+        """
+        test_new_taxa: a new list of taxa is used by the calculations
+        """
+        df = pd.DataFrame(
+            {
+                "station": ["a", "a", "b"],
+                "Gadus_morhua": [1, 0, 2],
+                "Pollachius": [1, 3, 0],
+            }
+        )
+        registry = TaxonomyRegistry({"all_organisms": all_organisms})
+        with self.assertRaises(KeyError):
+            registry.resolve(df.columns)
+
+        registry.register("trawl", ["Gadus_morhua", "Pollachius"])
+        with mock.patch("use_cases_calc.calc_planner.taxonomy", registry):
+            planner = CalcPlanner(df)
+            result = planner.run(planner.plan("biodiversity3", ["station"]))
+        assert result["station"]["Types"][0]["Number"] == "1.5 +/- st dev 0.5"
+
+    def test_unknown(self):
+        """
+        test_unknown: a schema without organisms raises KeyError
+        """
+        registry = TaxonomyRegistry({"all_organisms": all_organisms})
+        with self.assertRaises(KeyError):
+            registry.resolve(["id", "latitude"])
@@ -0,0 +1,181 @@
+"""
+Pytest codes for the tiered cache of the files of the object store, using the
+local stand-in of the object store. To run the tests, you need to run make test
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from benchmarks.object_store import LocalObjectStore
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc import get_bucket, tiered_cache
+from use_cases_calc.dataset_store import DatasetStore
+from use_cases_calc.get_bucket import GetBucket
+from use_cases_calc.tiered_cache import TieredCache
+
+ENTRIES = {f"file{index}": bytes([65 + index]) * 400 for index in range(3)}
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_tiers: the entries evicted from memory are demoted to the disk,
+            compressed, and promoted back when they are used
+            - test_disk_restart: the disk tier finds its entries again, and the
+            damaged entries are removed
+            - test_shared_folder: the processes that share the folder use the
+            entries of the others, keep one budget and do not remove the
+            temporary files that are being written
+            - test_inclusive_tiers: the entries promoted to memory by a process
+            are kept on the shared folder for the others, and they are not
+            written again when they are evicted from memory
+            - test_disk_errors: the entries that can not be written to the disk
+            are not kept, without failing the requests
+            - test_fetch: the files of the object store are downloaded once by
+            version
+    """
+
+    def test_tiers(self):
+        """
+        test_tiers: the entries evicted from memory are demoted to the disk,
+        compressed, and promoted back when they are used
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TieredCache("test", 1000, 10_000, directory)
+            for key, value in ENTRIES.items():
+                cache.set(key, value)
+            stats = cache.stats()
+            assert (stats["memory"]["entries"], stats["memory"]["bytes"]) == (2, 800)
+            assert stats["memory"]["evictions"] == 1
+            assert stats["disk"]["entries"] == 1
+            assert stats["disk"]["bytes"] < stats["disk"]["raw_bytes"] == 400
+
+            # file0 is promoted, and file1 (the least recently used) is demoted
+            assert cache.get("file0") == ENTRIES["file0"]
+            assert cache.get("file1") == ENTRIES["file1"]
+            assert cache.load("file3", lambda: b"new") == b"new"
+            assert cache.get("unknown") is None
+            stats = cache.stats()
+            assert stats["disk"]["hits"] == 2
+            assert stats["disk"]["misses"] == 2
+            assert stats["origin"]["loads"] == 1
+            # the promoted entries are kept on the disk
+            assert stats["memory"]["bytes"] == 803
+            assert (stats["disk"]["entries"], stats["disk"]["raw_bytes"]) == (3, 1200)
+
+    def test_disk_restart(self):
+        """
+        test_disk_restart: the disk tier finds its entries again, and the damaged
+        entries are removed
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            cache = TieredCache("test", 0, 10_000, directory)
+            for key, value in ENTRIES.items():
+                cache.set(key, value)
+            assert len(os.listdir(directory)) == 3
+
+            cache = TieredCache("test", 0, 10_000, directory)
+            assert cache.stats()["disk"]["entries"] == 3
+            assert cache.get("file2") == ENTRIES["file2"]
+            name = next(name for name in os.listdir(directory))
+            with open(os.path.join(directory, name), "wb") as file:
+                file.write(b"damaged")
+            assert [cache.get(key) for key in ENTRIES].count(None) == 1
+            assert cache.stats()["disk"]["entries"] == 2
+
+    def test_shared_folder(self):
+        """
+        test_shared_folder: the processes that share the folder use the entries
+        of the others, keep one budget and do not remove the temporary files
+        that are being written
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            for name, age in (("old.tmp", 7200), ("new.tmp", 0)):
+                path = os.path.join(directory, name)
+                with open(path, "wb") as file:
+                    file.write(b"partial")
+                os.utime(path, (time.time() - age,) * 2)
+            disk = tiered_cache.DiskTier(directory, 0)
+            size = len(disk._compress(ENTRIES["file0"]))  # pylint: disable=W0212
+            first = TieredCache("test", 0, 2 * size, directory)
+            second = TieredCache("test", 0, 2 * size, directory)
+            assert sorted(os.listdir(directory)) == ["new.tmp"]
+
+            first.set("file0", ENTRIES["file0"])
+            assert second.get("file0") == ENTRIES["file0"]
+            first.set("file1", ENTRIES["file1"])
+            with mock.patch.object(tiered_cache, "SCAN_SECONDS", 0):
+                second.set("file2", ENTRIES["file2"])
+            names = [name for name in os.listdir(directory) if name != "new.tmp"]
+            assert len(names) == 2
+            assert second.stats()["disk"]["bytes"] <= 2 * size
+
+    def test_inclusive_tiers(self):
+        """
+        test_inclusive_tiers: the entries promoted to memory by a process are kept
+        on the shared folder for the others, and they are not written again when
+        they are evicted from memory
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            first = TieredCache("test", 0, 10_000, directory)
+            second = TieredCache("test", 1000, 10_000, directory)
+            first.set("file0", ENTRIES["file0"])
+            (name,) = os.listdir(directory)
+            inode = os.stat(os.path.join(directory, name)).st_ino
+
+            assert second.get("file0") == ENTRIES["file0"]
+            assert second.stats()["memory"]["entries"] == 1
+            assert first.get("file0") == ENTRIES["file0"]
+            third = TieredCache("test", 0, 10_000, directory)
+            assert third.get("file0") == ENTRIES["file0"]
+
+            # file0 is evicted from the memory of the second process
+            second.set("file1", ENTRIES["file1"])
+            second.set("file2", ENTRIES["file2"])
+            assert second.stats()["memory"]["evictions"] == 1
+            assert os.stat(os.path.join(directory, name)).st_ino == inode
+            assert third.stats()["origin"]["loads"] == 0
+
+    def test_disk_errors(self):
+        """
+        test_disk_errors: the entries that can not be written to the disk are not
+        kept, without failing the requests
+        """
+        with tempfile.TemporaryDirectory() as base_dir:
+            directory = os.path.join(base_dir, "cache")
+            cache = TieredCache("test", 0, 10_000, directory)
+            shutil.rmtree(directory)
+            assert cache.load("file0", lambda: ENTRIES["file0"]) == ENTRIES["file0"]
+            assert cache.get("file0") is None
+            stats = cache.stats()["disk"]
+            assert (stats["errors"], stats["entries"]) == (1, 0)
+
+    def test_fetch(self):
+        """
+        test_fetch: the files of the object store are downloaded once by version
+        """
+        with tempfile.TemporaryDirectory() as base_dir, LocalObjectStore(
+            base_dir
+        ) as server, mock.patch.object(
+            get_bucket, "datasets", DatasetStore(max_entries=0)
+        ), mock.patch.object(
+            get_bucket,
+            "file_cache",
+            TieredCache("file", directory=os.path.join(base_dir, "cache")),
+        ), mock.patch.object(
+            get_bucket, "read_url", wraps=get_bucket.read_url
+        ) as read_url:
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=30)})
+            for _ in range(3):
+                data = GetBucket(base_url=server.url)
+                data.get_csv(filenames=["layers:survey.csv"])
+                assert len(data.df) == 30
+            assert read_url.call_count == 1
+            stats = get_bucket.file_cache.stats()
+            assert stats["memory"]["hits"] == 2
+            assert stats["origin"]["bytes"] == stats["memory"]["bytes"]
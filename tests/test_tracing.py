@@ -0,0 +1,102 @@
+"""
+Pytest codes for the tracing of the stages of the requests, using a local folder
+instead of the object store. To run the tests, you need to run make test
+"""
+
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from api.v1 import calc
+from tests.synthetic import synthetic_survey, write_bucket
+from use_cases_calc import get_bucket
+from use_cases_calc.calc_pool import CalcPool
+from use_cases_calc.dataset_store import DatasetStore
+from use_cases_calc.get_bucket import GetBucket
+from use_cases_calc.result_cache import ResultCache
+from use_cases_calc.tracing import NULL_SPAN, Trace, current_trace, span
+
+
+class TryTesting(TestCase):
+    """
+    Class TryTesting: class to perform the tests.
+
+    The following test are being performed:
+            - test_disabled: the spans do nothing if the request is not traced
+            - test_stages: fetch, parse, merge, clip and the calc types are timed,
+            also on the processes of the pool
+            - test_server_timing: the traced responses have a Server-Timing header
+    """
+
+    def test_disabled(self):
+        """
+        test_disabled: the spans do nothing if the request is not traced
+        """
+        assert current_trace.get() is None
+        assert span("fetch") is NULL_SPAN
+
+    def test_stages(self):
+        """
+        test_stages: fetch, parse, merge, clip and the calc types are timed,
+        also on the processes of the pool
+        """
+        survey = synthetic_survey(rows=50)
+        with tempfile.TemporaryDirectory() as base_dir:
+            write_bucket(
+                base_dir,
+                {"layers:a": survey.iloc[:25], "layers:b": survey.iloc[25:]},
+            )
+            trace = Trace()
+            token = current_trace.set(trace)
+            try:
+                data = GetBucket()
+                data.get(
+                    filenames="layers:a,layers:b",
+                    extension="csv",
+                    columns=None,
+                    drop_columns=["Unnamed: 0"],
+                    bbox="-180,-90,180,90",
+                    crs="EPSG:4326",
+                    lat_lon_columns=["latitude", "longitude"],
+                )
+                for processes in (0, 1):
+                    pool = CalcPool(processes=processes)
+                    pool.run(data.df, "count,biodiversity3", ["habitat"])
+                    pool.shutdown()
+            finally:
+                current_trace.reset(token)
+
+        timings = trace.timings()
+        assert timings["fetch"]["count"] == 2
+        assert timings["parse"]["count"] == 2
+        assert timings["merge"]["count"] == 1
+        assert timings["clip"]["count"] == 1
+        assert timings["calc.count"]["count"] == 2
+        assert timings["calc.biodiversity3"]["count"] == 2
+        assert timings["calc.load_frame"]["count"] == 1
+
+    def test_server_timing(self):
+        """
+        test_server_timing: the traced responses have a Server-Timing header
+        """
+        route = next(route for route in calc.router.routes if route.path == "/")
+        with tempfile.TemporaryDirectory() as base_dir, mock.patch.object(
+            calc, "calc_cache", ResultCache(max_entries=0)
+        ), mock.patch.object(
+            calc, "calc_pool", CalcPool(processes=0)
+        ), mock.patch.object(
+            get_bucket, "datasets", DatasetStore(max_entries=0)
+        ):
+            write_bucket(base_dir, {"layers:survey": synthetic_survey(rows=20)})
+            params = {"filenames": "layers:survey", "calc_columns": "habitat"}
+            response = route.endpoint(**params)
+            assert "Server-Timing" not in response.headers
+
+            with mock.patch.dict(os.environ, {"TRACING": "true"}):
+                response = route.endpoint(**params)
+        stages = [
+            stage.split(";")[0]
+            for stage in response.headers["Server-Timing"].split(", ")
+        ]
+        assert {"versions", "fetch", "parse", "calc-count", "serialize"} <= set(stages)
+        assert current_trace.get() is None
@@ -0,0 +1,234 @@
+"""
+  AdmissionControl Class: limit the memory used by the heavy requests of the
+  API, estimated from the size of their files, to a budget
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class AdmissionRejected(Exception):
+    """
+    AdmissionRejected: the request could not be admitted before its deadline
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """
+    AdmissionControl class for limit the memory used by the heavy requests
+
+    The cost of a request is the memory that its files use when they are
+    loaded, estimated from their size on the object store (that is known
+    before the files are downloaded) times an expansion factor. The requests
+    that cost less than cheap_bytes are admitted at once. The other requests
+    run while their costs fit in the memory budget, and wait in order, up to
+    timeout seconds, for the running requests to finish. A request that costs
+    more than the budget runs alone. The requests that can not wait (the queue
+    is full, or the deadline passed) are rejected.
+
+    This class has the following methods:
+        * estimate: memory used by the files of a request
+        * acquire: wait until a request fits in the budget
+        * release: return the memory of a finished request to the budget
+        * admit: run a request inside the budget (context manager)
+        * retry_after: time that a rejected request should wait
+        * stats: memory in use, requests running, waiting and rejected
+    """
+
+    def __init__(
+        self,
+        budget: int = None,
+        cheap_bytes: int = None,
+        expansion: float = None,
+        timeout: float = None,
+        queue_size: int = None,
+    ):
+        """
+        AdmissionControl class constructor. The default values can be set by
+        the ENV variables:
+        - ADMISSION_MEMORY_BYTES: memory budget of the heavy requests. With 0,
+          all the requests are admitted (2147483648)
+        - ADMISSION_CHEAP_BYTES: requests that cost less are admitted at once
+          (67108864)
+        - ADMISSION_EXPANSION: memory used by each byte of the files (4)
+        - ADMISSION_TIMEOUT: maximum time, in seconds, that a request waits for
+          the budget (10)
+        - ADMISSION_QUEUE_SIZE: maximum number of requests waiting (16)
+
+        Args:
+        budget (int, optional): memory budget in bytes. Defaults to None.
+        cheap_bytes (int, optional): cost of the cheap requests. Defaults to None.
+        expansion (float, optional): memory used by each byte of the files.
+            Defaults to None.
+        timeout (float, optional): maximum time that a request waits.
+            Defaults to None.
+        queue_size (int, optional): maximum number of requests waiting.
+            Defaults to None.
+        """
+        if budget is None:
+            budget = int(os.environ.get("ADMISSION_MEMORY_BYTES", 2 << 30))
+        if cheap_bytes is None:
+            cheap_bytes = int(os.environ.get("ADMISSION_CHEAP_BYTES", 64 << 20))
+        if expansion is None:
+            expansion = float(os.environ.get("ADMISSION_EXPANSION", 4))
+        if timeout is None:
+            timeout = float(os.environ.get("ADMISSION_TIMEOUT", 10))
+        if queue_size is None:
+            queue_size = int(os.environ.get("ADMISSION_QUEUE_SIZE", 16))
+        self.budget = budget
+        self.cheap_bytes = cheap_bytes
+        self.expansion = expansion
+        self.timeout = timeout
+        self.queue_size = queue_size
+
+        self._condition = threading.Condition()
+        self._waiting = deque()
+        self.in_use = 0
+        self.running = 0
+        self.admitted = 0
+        self.cheap = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def estimate(self, versions: dict):
+        """
+        estimate: memory used by the files of a request, when they are loaded
+
+        Args:
+            versions (dict): version and size of each file, created by
+                GetBucket.get_versions. The files of unknown size are not counted.
+
+        Returns:
+            int: the cost of the request, in bytes
+        """
+        size = sum(version.get("size") or 0 for version in versions.values())
+        return int(size * self.expansion)
+
+    def _fits(self, cost: int):
+        return self.running == 0 or self.in_use + cost <= self.budget
+
+    def acquire(self, cost: int):
+        """
+        acquire: wait until a request fits in the budget, in the order of arrival
+
+        Args:
+            cost (int): the cost of the request, in bytes
+
+        Raises:
+            AdmissionRejected: if the queue is full or the request waited for
+                timeout seconds
+
+        Returns:
+            int: the memory taken from the budget, that should be released when
+            the request finishes (0 for the cheap requests)
+        """
+        if self.budget <= 0 or cost <= 0 or cost < self.cheap_bytes:
+            with self._condition:
+                self.cheap += 1
+            return 0
+        with self._condition:
+            if not self._waiting and self._fits(cost):
+                return self._take(cost)
+            if len(self._waiting) >= self.queue_size:
+                self.rejected += 1
+                raise AdmissionRejected(
+                    "Too many heavy requests waiting", self.retry_after()
+                )
+            ticket = object()
+            self._waiting.append(ticket)
+            self.queued += 1
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self._waiting[0] is not ticket or not self._fits(cost):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        raise AdmissionRejected(
+                            "The server has no memory for the request",
+                            self.retry_after(),
+                        )
+                    self._condition.wait(remaining)
+                return self._take(cost)
+            finally:
+                self._waiting.remove(ticket)
+                self._condition.notify_all()
+
+    def _take(self, cost: int):
+        self.in_use += cost
+        self.running += 1
+        self.admitted += 1
+        return cost
+
+    def release(self, cost: int):
+        """
+        release: return the memory of a finished request to the budget
+
+        Args:
+            cost (int): the memory returned by acquire
+        """
+        if not cost:
+            return
+        with self._condition:
+            self.in_use -= cost
+            self.running -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self, cost: int):
+        """
+        admit: run a request inside the budget
+
+        Args:
+            cost (int): the cost of the request, in bytes
+
+        Raises:
+            AdmissionRejected: if the request could not be admitted
+        """
+        taken = self.acquire(cost)
+        try:
+            yield
+        finally:
+            self.release(taken)
+
+    def retry_after(self):
+        """
+        retry_after: time, in seconds, that a rejected request should wait
+        before it is sent again
+
+        Returns:
+            int: the time for the Retry-After header
+        """
+        return max(1, round(self.timeout))
+
+    def stats(self):
+        """
+        stats: memory in use, requests running, waiting and rejected
+
+        Returns:
+            dict: the statistics of the admission control
+        """
+        with self._condition:
+            return {
+                "budget": self.budget,
+                "in_use": self.in_use,
+                "running": self.running,
+                "waiting": len(self._waiting),
+                "admitted": self.admitted,
+                "cheap": self.cheap,
+                "queued": self.queued,
+                "rejected": self.rejected,
+            }
+
+
+# admission control of the process, shared by the routers
+admission = AdmissionControl()
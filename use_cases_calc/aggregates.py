@@ -0,0 +1,414 @@
+# pylint: disable=too-many-return-statements
+
+"""
+  MaterializedAggregates Class: class for keep small aggregate tables of the
+  datasets, used to answer the calculations without loading the files
+"""
+import copy
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from use_cases_calc.calc_planner import CalcPlanner, format_density, parse_agg_columns
+from use_cases_calc.taxonomy import taxonomy
+
+load_dotenv()
+
+# calculations that can be answered by the aggregate tables
+AGGREGATE_CALCS = ("agg", "organism", "biodiversity1", "biodiversity2")
+
+# agg functions that can be answered by the aggregate tables
+AGGREGATE_FUNCTIONS = ("sum", "count", "mean")
+
+
+def fingerprint(df: pd.DataFrame, rows: int):
+    """
+    fingerprint: hash of the first rows of the data. It is used to check if new
+    data only appended rows to the data that was aggregated, so all the rows
+    that were aggregated are hashed: a row changed in place creates the tables
+    again.
+
+    Args:
+        df (pd.DataFrame): the data
+        rows (int): number of rows of the data that were aggregated
+
+    Returns:
+        int: the hash of the columns and of the rows
+    """
+    hashed = pd.util.hash_pandas_object(df.iloc[:rows], index=False)
+    # the hashes of the rows are combined by position, so swapped rows differ
+    weights = np.arange(1, len(hashed) + 1, dtype=np.uint64)
+    return hash((tuple(df.columns), rows, int((hashed.to_numpy() * weights).sum())))
+
+
+class AggregateTable:
+    """
+    AggregateTable class for the aggregates of one version of a dataset
+
+    For each group column (and for the whole dataset) it keeps the sums, sums of
+    squares, sums of positive values and counts of the organism and area columns,
+    and the count, sum and sum of squares of the density of organisms by row.
+
+    This class has the following methods:
+        * summarize: aggregate rows of the data by a group column
+        * fold: aggregate new rows of the data into the tables
+        * add_group: add the tables of a new group column
+    """
+
+    def __init__(self, df: pd.DataFrame, group_columns: list):
+        """
+        AggregateTable class constructor
+
+        Args:
+            df (pd.DataFrame): the data
+            group_columns (list): columns that will be used to group the data
+        """
+        try:
+            self.organisms = taxonomy.resolve(df.columns).columns
+        except KeyError:
+            self.organisms = []
+        self.value_columns = [
+            column
+            for column in df.columns
+            if (column in self.organisms or "area" in column.lower())
+            and pd.api.types.is_numeric_dtype(df[column])
+        ]
+        self.rows = len(df)
+        self.fingerprint = fingerprint(df, self.rows)
+        self.totals = self.summarize(df, None)
+        self.groups = {}
+        for column in group_columns:
+            self.add_group(df, column)
+
+    def summarize(self, df: pd.DataFrame, column: str):
+        """
+        summarize: aggregate rows of the data by a group column
+
+        Args:
+            df (pd.DataFrame): rows of the data
+            column (str): group column, or None for the whole data
+
+        Returns:
+            dict: the tables of the aggregates, indexed by the group values
+        """
+        keys = df[column] if column else np.zeros(len(df), dtype=int)
+        values = df[self.value_columns]
+        tables = {
+            "sum": values.groupby(keys).sum(),
+            "sumsq": (values * values).groupby(keys).sum(),
+            "psum": values.clip(lower=0).groupby(keys).sum(),
+            "positive": (values > 0).groupby(keys).sum(),
+            "count": df.groupby(keys).count(),
+        }
+        if self.organisms and "Area_m2" in df.columns:
+            density = pd.Series(CalcPlanner(df).get("row_density"), index=df.index)
+            valid = density.notna()
+            tables["density"] = pd.DataFrame(
+                {
+                    "count": valid.groupby(keys).sum(),
+                    "sum": density.where(valid, 0).groupby(keys).sum(),
+                    "sumsq": (density * density).where(valid, 0).groupby(keys).sum(),
+                }
+            )
+        if column:
+            for table in tables.values():
+                table.index.name = column
+        return tables
+
+    def fold(self, df: pd.DataFrame):
+        """
+        fold: aggregate new rows of the data into the tables. Only the rows after
+        the rows that were already aggregated are used.
+
+        Args:
+            df (pd.DataFrame): the data, with the new rows at the end
+
+        Returns:
+            AggregateTable: new tables with the new rows. The tables of this
+            object are not changed, because they can be in use.
+        """
+        new_rows = df.tail(len(df) - self.rows)
+        folded = copy.copy(self)
+        folded.totals = self._fold_tables(self.totals, new_rows, None)
+        folded.groups = {
+            column: self._fold_tables(tables, new_rows, column)
+            for column, tables in self.groups.items()
+        }
+        folded.rows = len(df)
+        folded.fingerprint = fingerprint(df, folded.rows)
+        return folded
+
+    def _fold_tables(self, tables: dict, new_rows: pd.DataFrame, column: str):
+        new_tables = self.summarize(new_rows, column)
+        folded = {}
+        for name, table in tables.items():
+            folded[name] = (
+                table.add(new_tables[name], fill_value=0)
+                .sort_index()
+                .astype(table.dtypes.to_dict(), errors="ignore")
+            )
+        return folded
+
+    def add_group(self, df: pd.DataFrame, column: str):
+        """
+        add_group: add the tables of a new group column
+
+        Args:
+            df (pd.DataFrame): the data
+            column (str): group column
+        """
+        if column in df.columns and column not in self.groups:
+            self.groups[column] = self.summarize(df, column)
+
+
+class MaterializedAggregates:
+    """
+    MaterializedAggregates class for keep the aggregate tables of the datasets
+
+    The tables are kept for the last version of each dataset. When a new version
+    of a dataset only appends rows to the old version, the new rows are folded
+    into the tables, otherwise the tables are created again.
+
+    This class has the following methods:
+        * refresh: create or update the tables of a dataset
+        * answer: answer a calculation using the tables
+        * agg_calculation: agg calculation from the tables
+        * organism_calculation: organism calculation from the tables
+        * biodiversity1: diversity by substrate from the tables
+        * biodiversity2: diversity across survey from the tables
+    """
+
+    def __init__(self, max_datasets: int = None, max_groups: int = None):
+        """
+        MaterializedAggregates class constructor. The default values can be set by
+        the ENV variables:
+        - AGG_MAX_DATASETS: maximum number of datasets with tables (32)
+        - AGG_MAX_GROUPS: maximum number of groups of the columns that are
+          aggregated when the tables are created (1000)
+
+        Args:
+        max_datasets (int, optional): maximum number of datasets. A value of 0
+            disables the tables. Defaults to None.
+        max_groups (int, optional): maximum number of groups. Defaults to None.
+        """
+        if max_datasets is None:
+            max_datasets = int(os.environ.get("AGG_MAX_DATASETS", 32))
+        if max_groups is None:
+            max_groups = int(os.environ.get("AGG_MAX_GROUPS", 1000))
+        self.max_datasets = max_datasets
+        self.max_groups = max_groups
+        self._tables = OrderedDict()
+        self._lock = threading.Lock()
+
+    def refresh(
+        self, dataset: str, version: str, df: pd.DataFrame, group_columns: list = ()
+    ):
+        """
+        refresh: create or update the tables of a dataset
+
+        Args:
+            dataset (str): key of the dataset
+            version (str): version of the dataset
+            df (pd.DataFrame): data of the dataset, in this version
+            group_columns (list, optional): columns that should have tables,
+                besides the text columns with few groups. Defaults to ().
+        """
+        if self.max_datasets <= 0:
+            return
+        with self._lock:
+            entry = self._tables.get(dataset)
+        if entry is None or entry[0] != version:
+            table = entry[1] if entry else None
+            if (
+                table is not None
+                and len(df) >= table.rows
+                and fingerprint(df, table.rows) == table.fingerprint
+            ):
+                table = table.fold(df)
+            else:
+                columns = [
+                    column
+                    for column in df.columns
+                    if not pd.api.types.is_numeric_dtype(df[column])
+                    and df[column].nunique() <= self.max_groups
+                ]
+                table = AggregateTable(df, columns)
+        else:
+            table = entry[1]
+        for column in group_columns:
+            table.add_group(df, column)
+        with self._lock:
+            self._tables[dataset] = (version, table)
+            self._tables.move_to_end(dataset)
+            while len(self._tables) > self.max_datasets:
+                self._tables.popitem(last=False)
+
+    def answer(
+        self,
+        dataset: str,
+        version: str,
+        calc: str,
+        calc_columns: list,
+        agg_columns: str = None,
+    ):
+        """
+        answer: answer a calculation using the tables
+
+        Args:
+            dataset (str): key of the dataset
+            version (str): version of the dataset
+            calc (str): types of calculation, separated by comma
+            calc_columns (list): name of the columns that you want to apply calculation
+            agg_columns (str, optional): agg calculations, like 'sum:test'
+
+        Returns:
+            dict: results by calc column, or None if the calculation can not be
+            answered by the tables
+        """
+        with self._lock:
+            entry = self._tables.get(dataset)
+        if entry is None or entry[0] != version:
+            return None
+        table = entry[1]
+
+        result = {}
+        for calc_column in calc_columns:
+            result[calc_column] = {}
+            for calc_type in calc.split(","):
+                if calc_type not in AGGREGATE_CALCS:
+                    return None
+                if calc_type in ("agg", "organism"):
+                    method = getattr(self, f"{calc_type}_calculation")
+                    value = method(table, agg_columns, calc_column)
+                else:
+                    value = getattr(self, calc_type)(table, calc_column)
+                if value is None:
+                    return None
+                result[calc_column].update(value)
+        return result
+
+    def agg_calculation(self, table: AggregateTable, agg_columns: str, calc_column):
+        """
+        agg_calculation: agg calculation from the tables, if only sum, count and
+        mean are requested
+
+        Args:
+            table (AggregateTable): tables of the dataset
+            agg_columns (str): agg calculations, like 'sum:test'
+            calc_column (str): name of the column that you want to apply the
+        calculation
+        """
+        if not agg_columns or calc_column not in table.groups:
+            return None
+        agg_calcs, new_columns, get_first, _ = parse_agg_columns(
+            agg_columns, table.organisms
+        )
+        tables = table.groups[calc_column]
+        if get_first:
+            return None
+        columns = {}
+        for column, function in agg_calcs.items():
+            if function not in AGGREGATE_FUNCTIONS:
+                return None
+            if function == "count":
+                if column not in tables["count"]:
+                    return None
+                columns[column] = tables["count"][column]
+            elif column not in table.value_columns:
+                return None
+            elif function == "sum":
+                columns[column] = tables["sum"][column]
+            else:
+                columns[column] = tables["sum"][column] / tables["count"][column]
+        result = pd.DataFrame(columns)
+        result.columns = new_columns
+        result = result.round()
+        return {"Types": result.reset_index().to_dict(orient="records")}
+
+    def organism_calculation(
+        self, table: AggregateTable, agg_columns: str, calc_column
+    ):
+        """
+        organism_calculation: organism calculation from the tables, if only sum
+        and count of the calc column and density are requested
+
+        Args:
+            table (AggregateTable): tables of the dataset
+            agg_columns (str): agg calculations, like 'sum:test'
+            calc_column (str): name of the column that you want to apply the
+        calculation
+        """
+        if not agg_columns or calc_column not in table.value_columns:
+            return None
+        result_values = {}
+        agg_calcs = {}
+        get_density = None
+        for agg in agg_columns.split(","):
+            agg = agg.split(":")
+            if agg[0] == "density":
+                get_density = agg[1]
+            elif agg[1] != calc_column or agg[0] not in ("sum", "count"):
+                return None
+            else:
+                agg_calcs[agg[1]] = agg[0]
+        totals = table.totals
+        if get_density:
+            if get_density not in table.value_columns:
+                return None
+            sum_organism = totals["sum"][calc_column].iloc[0]
+            area = totals["sum"][get_density].iloc[0]
+            result_values["Density (individuals ha-1)"] = sum_organism / area * 10000
+        for key, function in agg_calcs.items():
+            # native numbers, like the results of the planner
+            if function == "sum":
+                value = totals["psum"][key].iloc[0].item()
+            else:
+                value = totals["positive"][key].iloc[0].item()
+            if get_density:
+                result_values["Number of Specimens"] = str(round(value))
+            else:
+                result_values["Number"] = value
+        return {"Information": [result_values]}
+
+    def biodiversity1(self, table: AggregateTable, calc_column: str):
+        """
+        biodiversity1: diversity by substrate from the tables
+
+        Args:
+            table (AggregateTable): tables of the dataset
+            calc_column (str): name of the column that you want to apply the
+        calculation
+        """
+        if (
+            calc_column not in table.groups
+            or "density" not in table.groups[calc_column]
+        ):
+            return None
+        density = table.groups[calc_column]["density"]
+        count = density["count"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = density["sum"] / count
+            variance = (density["sumsq"] - density["sum"] * mean) / (count - 1)
+        df = pd.DataFrame({"mean": mean, "std": np.sqrt(variance.clip(lower=0))})
+        df.loc[count < 2, "std"] = np.nan
+        return {"Types": format_density(df)}
+
+    def biodiversity2(self, table: AggregateTable, calc_column: str):
+        """
+        biodiversity2: diversity across survey from the tables
+
+        Args:
+            table (AggregateTable): tables of the dataset
+            calc_column (str): name of the column that you want to apply the
+        calculation
+        """
+        if not table.organisms or not set(table.organisms).issubset(
+            table.value_columns
+        ):
+            return None
+        totals = table.totals["sum"][table.organisms].iloc[0]
+        return {"Number of morphotypes": [int((totals > 0).sum())]}
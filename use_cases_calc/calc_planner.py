@@ -0,0 +1,555 @@
+# pylint: disable=invalid-name
+# pylint: disable=too-many-locals
+
+"""
+  CalcPlanner Class: class for plan and run the calculations of
+  GetBucket.do_calc sharing the intermediate results between them
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from use_cases_calc.organism_matrix import OrganismMatrix
+from use_cases_calc.taxonomy import taxonomy
+from use_cases_calc.tracing import span
+
+CalcStep = namedtuple("CalcStep", ["calc_type", "calc_column", "requires"])
+
+# intermediates needed by each calc type. The column argument of the
+# intermediates that depends on the calc column is filled by the plan.
+# The agg calculation also needs the group sums if density is requested
+STEP_REQUIRES = {
+    "count": (("group_keys", True),),
+    "unique": (),
+    "agg": (("sorted_group_keys", True),),
+    "organism": (("numeric", True),),
+    "biodiversity1": (("row_density", False),),
+    "biodiversity2": (("column_totals", False),),
+    "biodiversity3": (("group_keys", True), ("row_richness", False)),
+    "biodiversity4": (("group_keys", True), ("row_shannon", False)),
+    "biodiversity5": (("group_keys", True), ("row_simpson", False)),
+}
+
+# intermediates that each intermediate depends on, with the same format
+INTERMEDIATE_REQUIRES = {
+    "group_keys": (),
+    "sorted_group_keys": (("group_keys", True),),
+    "numeric": (),
+    "organism_matrix": (),
+    "row_totals": (("organism_matrix", False),),
+    "column_totals": (("organism_matrix", False),),
+    "row_density": (("row_totals", False),),
+    "row_richness": (("organism_matrix", False),),
+    "row_shannon": (("organism_matrix", False), ("row_totals", False)),
+    "row_simpson": (("organism_matrix", False), ("row_totals", False)),
+    "group_sums": (("sorted_group_keys", True), ("organism_matrix", False)),
+}
+
+
+def parse_agg_columns(agg_columns: str, organisms=None):
+    """
+    parse_agg_columns: parse the agg_columns of the agg calculation
+
+    Args:
+        agg_columns (str): agg calculations, like 'first:test,unique:test1'
+        organisms (list, optional): organism columns, used by density.
+            Defaults to None.
+
+    Returns:
+        tuple: the calculation of each column, the names of the result columns,
+        the column used to sort the data (first) and if density was requested
+    """
+    agg_calcs = {}
+    new_columns = []
+    organism_sums = False
+    get_first = None
+    for agg in agg_columns.split(","):
+        agg = agg.split(":")
+        if agg[0] == "first":
+            get_first = agg[1]
+        if agg[0] in "density":
+            organism_sums = True
+            for i in organisms or []:
+                agg_calcs[i] = "sum"
+                new_columns.append(i)
+        else:
+            agg_calcs[agg[1]] = agg[0]
+            if agg[0] in "count":
+                new_columns.append("Number")
+            else:
+                new_columns.append(agg[1])
+    return agg_calcs, new_columns, get_first, organism_sums
+
+
+def format_density(df: pd.DataFrame):
+    """
+    format_density: format the mean and standard deviation of the density
+    by group, as the result of the biodiversity1 calculation
+
+    Args:
+        df (pd.DataFrame): frame indexed by group, with mean and std columns
+
+    Returns:
+        list: the records of the result
+    """
+    df = df.round(3)
+    df["Density (individuals m-2)"] = (
+        df["mean"].astype(str) + " +/- st dev " + df["std"].astype(str)
+    )
+    df = df.drop(columns=["mean", "std"])
+    return df.reset_index().to_dict(orient="records")
+
+
+def format_mean_std(mean, std, decimals: int):
+    """
+    format_mean_std: format a mean and a standard deviation as the result
+    strings of the biodiversity calculations
+
+    Args:
+        mean (float): mean value
+        std (float): standard deviation value
+        decimals (int): number of decimals of the result
+
+    Returns:
+        str: a string like '1.2 +/- st dev 0.3'
+    """
+    mean = str(np.float64(mean).round(decimals))
+    std = str(np.float64(std).round(decimals))
+    return mean + " +/- st dev " + std
+
+
+def group_mean_std(values, codes, n_groups: int, mask=None):
+    """
+    group_mean_std: population mean and standard deviation of values by group
+
+    Args:
+        values (np.ndarray): values of each row
+        codes (np.ndarray): group code of each row
+        n_groups (int): number of groups
+        mask (np.ndarray, optional): rows that should be used. Defaults to None.
+
+    Returns:
+        tuple: mean and standard deviation arrays, with nan for empty groups
+    """
+    if mask is not None:
+        values = values[mask]
+        codes = codes[mask]
+    values = values.astype(np.float64)
+    counts = np.bincount(codes, minlength=n_groups).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(codes, weights=values, minlength=n_groups) / counts
+        deviation = (values - mean[codes]) ** 2
+        std = np.sqrt(
+            np.bincount(codes, weights=deviation, minlength=n_groups) / counts
+        )
+    return mean, std
+
+
+class CalcPlanner:
+    """
+    CalcPlanner class for plan and run the calculations of do_calc over an immutable frame
+
+    The request is parsed into steps (one for each calc column and calc type) and
+    each step declares the intermediates that it needs (factorized group keys,
+    organism matrix, per row indexes, per group sums...). The intermediates form a
+    small DAG that is resolved once and shared between all the steps. The base frame
+    is never changed, so the order of the calculations does not affect the results.
+
+    This class has the following methods:
+        * plan: parse the request into a list of steps
+        * intermediates: list the intermediates needed by the steps, in order
+        * run: run the steps and return the results
+        * get: compute (only once) an intermediate of the plan
+        * count_calculation: calculation of the number of unique values
+        * unique_calculation: calculation of the unique values
+        * agg_calculation: apply some calculation based on agg values
+        * organism_calculation: apply some calculation on the organisms columns
+        * biodiversity1: calculation of diversity by substrate
+        * biodiversity2: calculation of diversity across survey
+        * biodiversity3: calculation of number of morphotypes
+        * biodiversity4: calculation of shannon index
+        * biodiversity5: calculation of simpson index
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        """
+        CalcPlanner class constructor
+
+        Args:
+            df (pd.DataFrame): base frame of the calculations. It is never changed.
+        """
+        self.df = df
+        self._intermediates = {}
+
+    def plan(self, calc: str, calc_columns: list, agg_columns: str = None):
+        """
+        plan: parse the request into a list of steps
+
+        Args:
+            calc (str): types of calculation, separated by comma
+            calc_columns (list): name of the columns that you want to apply calculation
+            agg_columns (str, optional): agg calculations, like 'first:test,unique:test1'
+
+        Returns:
+            list: the steps of the plan, in the order of the request
+        """
+        steps = []
+        for calc_column in calc_columns:
+            for calc_type in calc.split(","):
+                if calc_type not in STEP_REQUIRES:
+                    continue
+                requires = STEP_REQUIRES[calc_type]
+                if (
+                    calc_type == "agg"
+                    and agg_columns
+                    and any(
+                        agg.split(":")[0] in "density" for agg in agg_columns.split(",")
+                    )
+                ):
+                    requires += (("group_sums", True),)
+                requires = tuple(
+                    (name, calc_column if by_column else None)
+                    for name, by_column in requires
+                )
+                steps.append(CalcStep(calc_type, calc_column, requires))
+        return steps
+
+    def intermediates(self, steps: list):
+        """
+        intermediates: list the intermediates needed by the steps, with their
+        dependencies first and without repetitions
+
+        Args:
+            steps (list): steps of the plan
+
+        Returns:
+            list: (name, column) of the intermediates in the order they are computed
+        """
+        ordered = []
+
+        def visit(node):
+            name, column = node
+            for dependency, by_column in INTERMEDIATE_REQUIRES[name]:
+                visit((dependency, column if by_column else None))
+            if node not in ordered:
+                ordered.append(node)
+
+        for step in steps:
+            for node in step.requires:
+                visit(node)
+        return ordered
+
+    def run(
+        self,
+        steps: list,
+        agg_columns: str = None,
+        all_columns: bool = False,
+    ):
+        """
+        run: run the steps and return the results
+
+        Args:
+        steps (list): steps of the plan
+        agg_columns (str): agg calculations, like 'first:test,unique:test1'
+        all_columns (bool): return all columns from the file on unique calculation
+
+        Returns:
+            dict: results by calc column
+        """
+        with span("calc.intermediates"):
+            for name, column in self.intermediates(steps):
+                self.get(name, column)
+
+        result = {}
+        listings = {}
+        for step in steps:
+            column_result = result.setdefault(step.calc_column, {})
+            with span(f"calc.{step.calc_type}"):
+                if step.calc_type == "count":
+                    column_result.update(self.count_calculation(step.calc_column))
+                elif step.calc_type == "unique":
+                    if all_columns:
+                        listings.update(self.unique_calculation(step.calc_column, True))
+                    else:
+                        column_result.update(self.unique_calculation(step.calc_column))
+                elif step.calc_type in ("agg", "organism"):
+                    method = getattr(self, f"{step.calc_type}_calculation")
+                    column_result.update(method(agg_columns, step.calc_column))
+                else:
+                    column_result.update(
+                        getattr(self, step.calc_type)(step.calc_column)
+                    )
+        for calc_column in result:
+            if result[calc_column]:
+                listings.pop(calc_column, None)
+        result.update(listings)
+        return result
+
+    def get(self, name: str, column: str = None):
+        """
+        get: compute (only once) an intermediate of the plan
+
+        Args:
+            name (str): name of the intermediate
+            column (str, optional): column of the intermediate, if it depends on one
+
+        Returns:
+            the intermediate value
+        """
+        key = (name, column)
+        if key not in self._intermediates:
+            maker = getattr(self, f"_make_{name}")
+            self._intermediates[key] = maker(column) if column else maker()
+        return self._intermediates[key]
+
+    def _make_group_keys(self, column: str):
+        codes, uniques = pd.factorize(self.df[column], use_na_sentinel=False)
+        return codes, uniques
+
+    def _make_sorted_group_keys(self, column: str):
+        codes, uniques = self.get("group_keys", column)
+        index = pd.Index(uniques)
+        valid = ~index.isna()
+        order = np.flatnonzero(valid)[index[valid].argsort()]
+        remap = np.full(len(uniques), -1, dtype=np.intp)
+        remap[order] = np.arange(len(order))
+        return remap[codes], index[order]
+
+    def _make_numeric(self, column: str):
+        return pd.to_numeric(self.df[column], downcast="integer", errors="coerce")
+
+    def _make_organism_matrix(self):
+        block = self.df.iloc[:, taxonomy.resolve(self.df.columns).positions]
+        return OrganismMatrix.from_frame(block)
+
+    def _make_row_totals(self):
+        return self.get("organism_matrix").row_sums()
+
+    def _make_row_density(self):
+        area = pd.to_numeric(self.df["Area_m2"], errors="coerce").to_numpy()
+        return self.get("row_totals") / area
+
+    def _make_column_totals(self):
+        return self.get("organism_matrix").column_sums()
+
+    def _make_row_richness(self):
+        return self.get("organism_matrix").row_positive()
+
+    def _make_row_shannon(self):
+        return self.get("organism_matrix").row_shannon(self.get("row_totals"))
+
+    def _make_row_simpson(self):
+        return self.get("organism_matrix").row_simpson(self.get("row_totals"))
+
+    def _make_group_sums(self, column: str):
+        codes, uniques = self.get("sorted_group_keys", column)
+        sums = self.get("organism_matrix").group_sums(codes, len(uniques))
+        return pd.DataFrame(
+            sums, index=uniques, columns=taxonomy.resolve(self.df.columns).columns
+        )
+
+    def count_calculation(self, calc_column: str):
+        """
+        count_calculation: calculation of the number of unique values
+
+        Args:
+            calc_column (str): name of the column that you want to apply the
+        calculation
+        """
+        _, uniques = self.get("group_keys", calc_column)
+        return {"Number": [len(uniques)]}
+
+    def unique_calculation(self, calc_column: str, all_columns: bool = False):
+        """
+        unique_calculation: calculation of the unique values
+
+        Args:
+            calc_column (str): name of the column that you want to apply the
+        calculation
+            all_columns (bool): return the unique values of all columns from the file
+        """
+        df = self.df.groupby(calc_column).first().reset_index()
+        if not all_columns:
+            return {"Types": df[[calc_column, "filename"]].values.tolist()}
+
+        result = {}
+        for column in self.df.columns:
+            if column == "Start date":
+                new_df = pd.to_datetime(df[column], format="%d/%m/%Y")
+                result[column] = [new_df.min(), new_df.max()]
+            else:
+                values = pd.Index(df[column].dropna().unique()).sort_values()
+                result[column] = [
+                    {"value": value, "label": value} for value in values.tolist()
+                ]
+        return result
+
+    def agg_calculation(self, agg_columns: str, calc_column: str):
+        """
+        agg_calculation: apply some calculation based on agg values
+
+        Args:
+        agg_columns (str): You define the name of calculation and
+            the column that you want to apply it. For example, if you want to get
+            the first data of column test and get unique values of column test2,
+            you should pass 'first:test,unique:test1'
+
+        calc_column (str): name of the column that you want to apply the
+            calculation
+        """
+
+        agg_calcs, new_columns, get_first, organism_sums = parse_agg_columns(
+            agg_columns
+        )
+        if organism_sums:
+            agg_calcs, new_columns, get_first, organism_sums = parse_agg_columns(
+                agg_columns, taxonomy.resolve(self.df.columns).columns
+            )
+
+        if organism_sums:
+            sums = self.get("group_sums", calc_column)
+            other_calcs = {
+                key: value
+                for key, value in agg_calcs.items()
+                if key not in sums.columns or value != "sum"
+            }
+        else:
+            sums = None
+            other_calcs = agg_calcs
+
+        df = self.df
+        if get_first:
+            df = df.sort_values(get_first, ascending=False)
+        if other_calcs:
+            result = df.groupby(calc_column).agg(other_calcs)
+            if sums is not None:
+                result = result.join(
+                    sums.drop(columns=list(other_calcs), errors="ignore")
+                )
+        else:
+            result = sums.rename_axis(calc_column)
+        result = result[list(agg_calcs)]
+        result.columns = new_columns
+        result = result.round()
+        return {"Types": result.reset_index().to_dict(orient="records")}
+
+    def organism_calculation(self, agg_columns: str, calc_column: str):
+        """
+        organism_calculation: apply some calculation on the organisms columns
+
+        Args:
+        agg_columns (str): You define the name of calculation and
+            the column that you want to apply it. For example, if you want to get
+            the first data of column test and get unique values of column test2,
+            you should pass 'first:test,unique:test1'
+
+        calc_column (str): name of the column that you want to apply the
+            calculation
+        """
+
+        numeric = self.get("numeric", calc_column)
+        mask = numeric > 0
+        new_df = self.df[mask].assign(**{calc_column: numeric[mask]})
+        agg_calcs = {}
+        get_first = []
+        get_density = None
+        for agg in agg_columns.split(","):
+            agg = agg.split(":")
+            if agg[0] == "first":
+                get_first.append(agg)
+            elif agg[0] == "density":
+                get_density = agg[1]
+            else:
+                agg_calcs[agg[1]] = agg[0]
+        result_values = {}
+        for first in get_first:
+            result_values[first[1]] = new_df.iloc[0][first[1]]
+        if get_density:
+            sum_organism = numeric.sum()
+            area = pd.to_numeric(
+                self.df[get_density], downcast="integer", errors="coerce"
+            ).sum()
+            result_values["Density (individuals ha-1)"] = sum_organism / area * 10000
+        if agg_calcs:
+            dict_temp = new_df.agg(agg_calcs).to_dict()
+            for key, value in dict_temp.items():
+                if key == calc_column:
+                    if get_density:
+                        key = "Number of Specimens"
+                        value = str(round(value))
+                    else:
+                        key = "Number"
+                result_values[key] = value
+        return {"Information": [result_values]}
+
+    def biodiversity1(self, calc_column: str):
+        """
+        biodiversity1: calculation of diversity by substrate
+
+        Args:
+            calc_column (str): name of the column that you want to apply the
+        calculation
+        """
+        df = pd.DataFrame(
+            {
+                "relation_seabed_organism": self.get("row_density"),
+                calc_column: self.df[calc_column].to_numpy(),
+            }
+        )
+        df = df.groupby(calc_column)["relation_seabed_organism"].agg(["mean", "std"])
+        return {"Types": format_density(df)}
+
+    def biodiversity2(self, calc_column: str):
+        """
+        biodiversity2: calculation of diversity across survey
+
+        Args:
+            calc_column (str): name of the column that you want to apply the
+        calculation
+        """
+        totals = self.get("column_totals")
+        return {"Number of morphotypes": [int((totals > 0).sum())]}
+
+    def _group_result(self, calc_column, values, key, decimals, mask=None):
+        codes, uniques = self.get("group_keys", calc_column)
+        mean, std = group_mean_std(values, codes, len(uniques), mask)
+        return {
+            "Types": [
+                {calc_column: unique_c, key: format_mean_std(mean[i], std[i], decimals)}
+                for i, unique_c in enumerate(uniques)
+            ]
+        }
+
+    def biodiversity3(self, calc_column: str):
+        """
+        biodiversity3: calculation of number of morphotypes
+
+        Args:
+            calc_column (str): name of the column that you want to apply the
+        calculation
+        """
+        return self._group_result(calc_column, self.get("row_richness"), "Number", 1)
+
+    def biodiversity4(self, calc_column: str):
+        """
+        biodiversity4: calculation of shannon index
+
+        Args:
+            calc_column (str): name of the column that you want to apply the
+        calculation
+        """
+        return self._group_result(calc_column, self.get("row_shannon"), "Result", 2)
+
+    def biodiversity5(self, calc_column: str):
+        """
+        biodiversity5: calculation of simpson index
+
+        Args:
+            calc_column (str): name of the column that you want to apply the
+        calculation
+        """
+        simpson = self.get("row_simpson")
+        return self._group_result(
+            calc_column, simpson, "Result", 2, mask=~np.isnan(simpson)
+        )
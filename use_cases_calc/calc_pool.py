@@ -0,0 +1,336 @@
+"""
+  CalcPool Class: class for run the calculations on a pool of processes,
+  sharing the frames with the processes by shared memory
+"""
+import ctypes
+import multiprocessing
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+from dotenv import load_dotenv
+
+from use_cases_calc.calc_planner import CalcPlanner
+from use_cases_calc.profiling import current_profile
+from use_cases_calc.serializers import numeric_gaps
+from use_cases_calc.tracing import Trace, current_trace, span
+
+load_dotenv()
+
+# metadata of the Arrow stream with the numeric columns that have gaps
+GAPS_METADATA = b"calc_pool.gaps"
+
+
+class PoolBusy(Exception):
+    """
+    PoolBusy: all the slots of the pool are in use
+    """
+
+
+def share_frame(df: pd.DataFrame):
+    """
+    share_frame: write a frame to shared memory, as an Arrow IPC stream. The gaps
+    of the numeric columns are written as nulls, and the names of these columns
+    are kept in the metadata of the stream, so load_frame restores the gaps.
+    Frames that can not be converted to Arrow (like object columns with numbers
+    and text) are pickled.
+
+    Args:
+        df (pd.DataFrame): the frame
+
+    Returns:
+        tuple: the shared memory, the format ('arrow' or 'pickle') and the size
+    """
+    frame, gaps = numeric_gaps(pd.DataFrame(df))
+    try:
+        table = pa.Table.from_pandas(frame, preserve_index=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        table = None
+
+    if table is not None:
+        table = table.replace_schema_metadata(
+            {**table.schema.metadata, GAPS_METADATA: orjson.dumps(gaps)}
+        )
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        payload, kind = sink.getvalue(), "arrow"
+    else:
+        payload = pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL)
+        kind = "pickle"
+
+    size = len(payload)
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    shm.buf[:size] = memoryview(payload).cast("B")
+    return shm, kind, size
+
+
+def load_frame(name: str, kind: str, size: int):
+    """
+    load_frame: read a frame written by share_frame, with the gaps of the numeric
+    columns as empty strings, like the frames of GetBucket.load_csv. The Arrow
+    stream is read from the shared memory without copying it, and the shared
+    memory is closed when the frame is released.
+
+    Args:
+        name (str): name of the shared memory
+        kind (str): format of the frame ('arrow' or 'pickle')
+        size (int): size of the frame, in bytes
+
+    Returns:
+        pd.DataFrame: the frame
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    if kind == "pickle":
+        try:
+            with shm.buf[:size] as view:
+                return pickle.loads(view)
+        finally:
+            shm.close()
+    # the buffer keeps the shared memory open, without holding its memoryview
+    address = ctypes.addressof(ctypes.c_char.from_buffer(shm.buf))
+    buffer = pa.foreign_buffer(address, size, base=shm)
+    table = pa.ipc.open_stream(buffer).read_all()
+    df = table.to_pandas()
+    for column in orjson.loads(table.schema.metadata.get(GAPS_METADATA, b"[]")):
+        values = df[column].astype(object)
+        df[column] = values.where(values.notna(), "")
+    return df
+
+
+def run_calc(
+    name: str,
+    kind: str,
+    size: int,
+    calc: str,
+    calc_columns: list,
+    agg_columns: str = None,
+    all_columns: bool = False,
+    trace: bool = False,
+):
+    """
+    run_calc: run the calculations of a frame written by share_frame. It runs on
+    the processes of the pool.
+
+    Args:
+        name (str): name of the shared memory
+        kind (str): format of the frame ('arrow' or 'pickle')
+        size (int): size of the frame, in bytes
+        calc (str): types of calculation, separated by comma
+        calc_columns (list): name of the columns that you want to apply calculation
+        agg_columns (str, optional): agg calculations, like 'first:test,unique:test1'
+        all_columns (bool, optional): return all columns from the file
+        trace (bool, optional): time the stages of the calculations
+
+    Returns:
+        tuple: the results of the calculations, and the stages of the trace
+    """
+    calc_trace = Trace() if trace else None
+    token = current_trace.set(calc_trace)
+    try:
+        with span("calc.load_frame"):
+            planner = CalcPlanner(load_frame(name, kind, size))
+        steps = planner.plan(calc, calc_columns, agg_columns)
+        result = planner.run(steps, agg_columns=agg_columns, all_columns=all_columns)
+    finally:
+        current_trace.reset(token)
+    return result, calc_trace.stages if calc_trace else {}
+
+
+class CalcPool:
+    """
+    CalcPool class for run the calculations on a pool of processes
+
+    The calculations hold the GIL, so they run on other processes and the
+    threads of the API keep answering the other requests. The frames are shared
+    with the processes by shared memory. The number of calculations running or
+    waiting is limited, and new calculations raise PoolBusy when the pool is full.
+
+    This class has the following methods:
+        * run: run the calculations of a frame
+        * run_many: run the calculations of several specs on the same frame
+        * stats: number of processes and of calculations running or waiting
+        * shutdown: stop the processes
+    """
+
+    def __init__(self, processes: int = None, queue_depth: int = None):
+        """
+        CalcPool class constructor. The size of the pool can be set by the ENV
+        variables:
+        - CALC_PROCESSES: number of processes (default min(4, number of cpus)).
+          With 0, the calculations run on the thread of the request.
+        - CALC_QUEUE_DEPTH: number of calculations waiting for a process (8)
+
+        Args:
+            processes (int, optional): number of processes. Defaults to None.
+            queue_depth (int, optional): number of calculations waiting for a
+                process. Defaults to None.
+        """
+        if processes is None:
+            processes = int(
+                os.environ.get("CALC_PROCESSES", min(4, os.cpu_count() or 1))
+            )
+        if queue_depth is None:
+            queue_depth = int(os.environ.get("CALC_QUEUE_DEPTH", 8))
+        self.processes = processes
+        self.queue_depth = queue_depth
+        self._slots = threading.BoundedSemaphore(max(processes + queue_depth, 1))
+        self._in_use = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def run(
+        self,
+        df: pd.DataFrame,
+        calc: str,
+        calc_columns: list,
+        agg_columns: str = None,
+        all_columns: bool = False,
+    ):
+        """
+        run: run the calculations of a frame on a process of the pool
+
+        Args:
+            df (pd.DataFrame): the frame
+            calc (str): types of calculation, separated by comma
+            calc_columns (list): name of the columns that you want to apply calculation
+            agg_columns (str, optional): agg calculations, like 'first:test,unique:test1'
+            all_columns (bool, optional): return all columns from the file
+
+        Raises:
+            PoolBusy: if all the slots of the pool are in use
+
+        Returns:
+            dict: the results of the calculations
+        """
+        return self.run_many(
+            df,
+            [
+                {
+                    "calc": calc,
+                    "calc_columns": calc_columns,
+                    "agg_columns": agg_columns,
+                    "all_columns": all_columns,
+                }
+            ],
+        )[0]
+
+    def run_many(self, df: pd.DataFrame, specs: list):
+        """
+        run_many: run the calculations of several specs on the same frame. The
+        frame is shared with the processes once, and the specs run in parallel
+        on the processes of the pool, using one slot of the pool.
+
+        Args:
+            df (pd.DataFrame): the frame
+            specs (list): the calculations, as dicts with the calc, calc_columns,
+                agg_columns and all_columns arguments of run
+
+        Raises:
+            PoolBusy: if all the slots of the pool are in use
+
+        Returns:
+            list: the results of the calculations of each spec
+        """
+        # the profiled requests run on their thread, so the profile has the calculations
+        if not self.processes or current_profile.get() is not None:
+            results = []
+            for spec in specs:
+                planner = CalcPlanner(df)
+                steps = planner.plan(
+                    spec["calc"], spec["calc_columns"], spec.get("agg_columns")
+                )
+                results.append(
+                    planner.run(
+                        steps,
+                        agg_columns=spec.get("agg_columns"),
+                        all_columns=spec.get("all_columns", False),
+                    )
+                )
+            return results
+
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy(
+                f"{self.processes + self.queue_depth} calculations already running"
+            )
+        with self._lock:
+            self._in_use += 1
+        trace = current_trace.get()
+        try:
+            with span("calc.share_frame"):
+                shm, kind, size = share_frame(df)
+            futures = []
+            try:
+                executor = self._get_executor()
+                for spec in specs:
+                    futures.append(
+                        executor.submit(
+                            run_calc,
+                            shm.name,
+                            kind,
+                            size,
+                            spec["calc"],
+                            spec["calc_columns"],
+                            spec.get("agg_columns"),
+                            spec.get("all_columns", False),
+                            trace is not None,
+                        )
+                    )
+                results = []
+                for future in futures:
+                    result, stages = future.result()
+                    if trace is not None:
+                        trace.merge(stages)
+                    results.append(result)
+                return results
+            except BrokenProcessPool:
+                with self._lock:
+                    self._executor = None
+                raise
+            finally:
+                # the frame is in use until every calculation finishes
+                wait(futures)
+                shm.close()
+                shm.unlink()
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def stats(self):
+        """
+        stats: number of processes and of calculations running or waiting
+
+        Returns:
+            dict: the statistics of the pool
+        """
+        with self._lock:
+            return {
+                "processes": self.processes,
+                "queue_depth": self.queue_depth,
+                "in_use": self._in_use,
+            }
+
+    def shutdown(self):
+        """
+        shutdown: stop the processes. The pool is started again by the next run.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
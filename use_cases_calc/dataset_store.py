@@ -0,0 +1,416 @@
+"""
+  DatasetStore Class: process-wide store of the datasets loaded from the object
+  store, by key and version, shared by the requests
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from use_cases_calc.single_flight import SingleFlight
+from use_cases_calc.tracing import logger
+
+load_dotenv()
+
+
+def read_only_view(df: pd.DataFrame):
+    """
+    read_only_view: view of a stored frame for a request. It is a shallow copy,
+    so it shares the data of the frame without copying it, and the columns
+    added, removed or replaced on the view do not change the stored frame. With
+    Copy-on-Write (the default since pandas 3), the values changed on the view
+    are copied too.
+
+    Args:
+        df (pd.DataFrame): the stored frame
+
+    Returns:
+        pd.DataFrame: the view
+    """
+    return df.copy(deep=False)
+
+
+class _Dataset:
+    """
+    _Dataset: a loaded dataset, with its files and the function that reloads it
+    """
+
+    __slots__ = ("version", "df", "loaded_at", "hits", "files", "reload")
+
+    def __init__(self, version: str, df: pd.DataFrame, previous=None):
+        self.version = version
+        self.df = df
+        self.loaded_at = time.monotonic()
+        self.hits = 0
+        self.files = previous.files if previous else {}
+        self.reload = previous.reload if previous else None
+
+
+class DatasetStore:
+    """
+    DatasetStore class for keep the datasets loaded from the object store, so
+    the requests of the same files share them instead of loading them again
+
+    A dataset is identified by a key (the files and the options used to load
+    them) and a version (the versions of the files). The store keeps only the
+    last version of each key, and when it is full, the least recently used
+    dataset is removed. The concurrent loads of the same key and version share
+    one load. The frames are handed out as read only views, and they should
+    not be changed in place.
+
+    The versions of the files of the object store are kept too, with
+    stale-while-revalidate: a version checked less than fresh_ttl seconds ago
+    is used as it is, and a version checked less than stale_ttl seconds ago is
+    used while one revalidation of the file runs on the background. When a file
+    changed, the datasets of the file are loaded again on the background and
+    swapped with the new version of the file at once, so the requests never
+    wait for the load. The files of the datasets used since the last refresh
+    (the hot datasets) are revalidated every refresh_interval seconds.
+
+    This class has the following methods:
+        * get: get a view of a dataset, if it is loaded
+        * set: add a dataset to the store
+        * load: get a view of a dataset, loading it if it is not in the store
+        * watch: set the files of a dataset and the function that reloads it
+        * file_version: version of a file of the object store
+        * revalidate: check the version of a file and reload its datasets
+        * refresh_hot: revalidate the files of the hot datasets
+        * clear: remove all the datasets from the store
+        * stats: hits, misses, loads and size of the store
+    """
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        fresh_ttl: float = None,
+        stale_ttl: float = None,
+        refresh_interval: float = None,
+    ):
+        """
+        DatasetStore class constructor. The default values can be set by the
+        ENV variables:
+        - DATASET_STORE_SIZE: maximum number of datasets (8)
+        - DATASET_FRESH_TTL: time, in seconds, that the version of a file is
+          used without checking it (30)
+        - DATASET_STALE_TTL: time, in seconds, that the version of a file is
+          used while it is revalidated on the background. Older versions are
+          checked by the request (3600)
+        - DATASET_REFRESH_INTERVAL: time, in seconds, between the revalidations
+          of the hot datasets. With 0, they are not revalidated (60)
+
+        Args:
+        max_entries (int, optional): maximum number of datasets. A value of 0
+            disables the store. Defaults to None.
+        fresh_ttl (float, optional): time that the version of a file is used
+            without checking it. Defaults to None.
+        stale_ttl (float, optional): time that the version of a file is used
+            while it is revalidated. Defaults to None.
+        refresh_interval (float, optional): time between the revalidations of
+            the hot datasets. Defaults to None.
+        """
+        if max_entries is None:
+            max_entries = int(os.environ.get("DATASET_STORE_SIZE", 8))
+        if fresh_ttl is None:
+            fresh_ttl = float(os.environ.get("DATASET_FRESH_TTL", 30))
+        if stale_ttl is None:
+            stale_ttl = float(os.environ.get("DATASET_STALE_TTL", 3600))
+        if refresh_interval is None:
+            refresh_interval = float(os.environ.get("DATASET_REFRESH_INTERVAL", 60))
+        self.max_entries = max_entries
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = max(stale_ttl, fresh_ttl)
+        self.refresh_interval = refresh_interval
+
+        self._entries = OrderedDict()
+        # version, time of the check and check function of each file
+        self._files = {}
+        self._revalidating = set()
+        self._lock = threading.Lock()
+        self._flights = SingleFlight()
+        self._executor = None
+        self._refresher = None
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+        self.revalidations = 0
+        self.swaps = 0
+
+    def get(self, key: str, version: str):
+        """
+        get: get a view of a dataset, if it is loaded
+
+        Args:
+            key (str): key of the dataset
+            version (str): version of the dataset
+
+        Returns:
+            pd.DataFrame: a read only view of the dataset, or None if this version
+            of the dataset is not loaded
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            entry.hits += 1
+            return read_only_view(entry.df)
+
+    def set(self, key: str, version: str, df: pd.DataFrame, since: float = None):
+        """
+        set: add a dataset to the store, replacing the other versions of the key
+
+        Args:
+            key (str): key of the dataset
+            version (str): version of the dataset
+            df (pd.DataFrame): the dataset. It should not be changed after it is
+                added to the store.
+            since (float, optional): time (time.monotonic) when the load of the
+                dataset started. The dataset is not added if the key was loaded
+                after it, by a revalidation. Defaults to None.
+        """
+        if self.max_entries <= 0 or version is None:
+            return
+        with self._lock:
+            previous = self._entries.get(key)
+            if since is not None and previous and previous.loaded_at > since:
+                return
+            self._entries[key] = _Dataset(version, df, previous)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def load(self, key: str, version: str, loader, *args, **kwargs):
+        """
+        load: get a view of a dataset, loading it if it is not in the store. If
+        the version is not known, the dataset is loaded and not stored.
+
+        Args:
+            key (str): key of the dataset
+            version (str): version of the dataset, or None if it is not known
+            loader (callable): function that loads the dataset
+            *args: arguments of the loader
+            **kwargs: keyword arguments of the loader
+
+        Returns:
+            pd.DataFrame: a read only view of the dataset
+        """
+        if version is None:
+            return loader(*args, **kwargs)
+        df = self.get(key, version)
+        if df is None:
+            df = read_only_view(
+                self._flights.do(
+                    (key, version), self._load, key, version, loader, *args, **kwargs
+                )
+            )
+        return df
+
+    def _load(self, key: str, version: str, loader, *args, **kwargs):
+        # a concurrent load may have finished before this one started
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry.version == version:
+            return entry.df
+        started = time.monotonic()
+        df = loader(*args, **kwargs)
+        self.set(key, version, df, since=started)
+        with self._lock:
+            self.loads += 1
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.hits += 1
+        return df
+
+    def watch(self, key: str, files: dict, reload):
+        """
+        watch: set the files of a dataset and the function that reloads it, used
+        when a file of the dataset changes
+
+        Args:
+            key (str): key of the dataset
+            files (dict): names of the files of the dataset, by url
+            reload (callable): function that receives the new versions of the
+                files that changed, by name, and returns the new version of the
+                dataset and the dataset
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.files = files
+                entry.reload = reload
+
+    def file_version(self, url: str, check):
+        """
+        file_version: version of a file of the object store, with
+        stale-while-revalidate. A stale version starts a revalidation of the
+        file on the background.
+
+        Args:
+            url (str): url of the file
+            check (callable): function that gets the version of a file from the
+                object store, like {"version": ETag, "size": size}
+
+        Returns:
+            dict: the version of the file
+        """
+        with self._lock:
+            known = self._files.get(url)
+        if known is not None:
+            version, checked_at, _ = known
+            age = time.monotonic() - checked_at
+            if age < self.fresh_ttl:
+                return version
+            if age < self.stale_ttl:
+                self._submit(url, check)
+                return version
+        version = check(url)
+        if version["version"]:
+            with self._lock:
+                self._files[url] = (version, time.monotonic(), check)
+            self._start_refresher()
+        return version
+
+    def _submit(self, url: str, check):
+        with self._lock:
+            if url in self._revalidating:
+                return
+            self._revalidating.add(url)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="dataset-revalidate"
+                )
+            executor = self._executor
+        executor.submit(self._revalidate, url, check)
+
+    def revalidate(self, url: str, check):
+        """
+        revalidate: check the version of a file on the object store, and if it
+        changed, load again the datasets of the file and swap them with the new
+        version of the file at once
+
+        Args:
+            url (str): url of the file
+            check (callable): function that gets the version of a file
+
+        Returns:
+            bool: if the file changed
+        """
+        with self._lock:
+            if url in self._revalidating:
+                return False
+            self._revalidating.add(url)
+        return self._revalidate(url, check)
+
+    def _revalidate(self, url: str, check):
+        try:
+            version = check(url)
+            if not version["version"]:
+                return False
+            with self._lock:
+                self.revalidations += 1
+                known = self._files.get(url)
+                changed = known is None or known[0]["version"] != version["version"]
+                entries = [
+                    (key, entry)
+                    for key, entry in self._entries.items()
+                    if changed and url in entry.files and entry.reload
+                ]
+
+            reloaded = []
+            for key, entry in entries:
+                new_version, df = entry.reload({entry.files[url]: version})
+                if new_version is not None:
+                    reloaded.append((key, new_version, df))
+
+            with self._lock:
+                for key, new_version, df in reloaded:
+                    self._entries[key] = _Dataset(
+                        new_version, df, self._entries.get(key)
+                    )
+                    self.swaps += 1
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+                self._files[url] = (version, time.monotonic(), check)
+            return changed
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning("revalidation of %s failed: %s", url, error)
+            return False
+        finally:
+            with self._lock:
+                self._revalidating.discard(url)
+
+    def refresh_hot(self):
+        """
+        refresh_hot: revalidate the files of the datasets used since the last
+        refresh
+
+        Returns:
+            list: the urls of the files that changed
+        """
+        with self._lock:
+            urls = set()
+            for entry in self._entries.values():
+                if entry.hits:
+                    urls.update(url for url in entry.files if url in self._files)
+                    entry.hits = 0
+            checks = {url: self._files[url][2] for url in urls}
+        return [url for url, check in checks.items() if self.revalidate(url, check)]
+
+    def _start_refresher(self):
+        if self.refresh_interval <= 0 or self._refresher is not None:
+            return
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name="dataset-refresh", daemon=True
+            )
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            self.refresh_hot()
+
+    def clear(self):
+        """
+        clear: remove all the datasets and the versions of the files from the store
+        """
+        with self._lock:
+            self._entries.clear()
+            self._files.clear()
+
+    def stats(self):
+        """
+        stats: hits, misses, loads and size of the store
+
+        Returns:
+            dict: the statistics of the store
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "files": len(self._files),
+                "revalidations": self.revalidations,
+                "swaps": self.swaps,
+            }
+
+
+# datasets of the process, shared by the requests
+datasets = DatasetStore()
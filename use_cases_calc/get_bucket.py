@@ -13,37 +13,138 @@
   GetBucket Class: class for get data and manage some calculations
   on csv, geojson and parquet data
 """
-import math
+import functools
+import io
 import os
 
 import geopandas as gpd
-import numpy as np
 import pandas as pd
+import requests
 from dotenv import load_dotenv
 
-from use_cases_calc.organisms import all_organisms, all_organisms2
+from use_cases_calc.calc_planner import CalcPlanner
+from use_cases_calc.dataset_store import datasets
+from use_cases_calc.metrics import bytes_fetched
+from use_cases_calc.request_key import request_hash
+from use_cases_calc.single_flight import SingleFlight
+from use_cases_calc.tiered_cache import TieredCache
+from use_cases_calc.tracing import span
 
 load_dotenv()
 
+# files being downloaded, shared by the concurrent fetches of the same url
+fetch_flights = SingleFlight()
+
+# files of the object store by version, in memory and on the local disk
+file_cache = TieredCache("file")
+
+
+def head_version(url: str):
+    """
+    head_version: get the version of a file on the object store, without
+    downloading it. The version is the ETag (or Last-Modified) of the object,
+    or the modification time if the url is a local path.
+
+    Args:
+        url (str): the url or the path of the file
+
+    Return:
+        dict: version and size of the file. The version is None if it could
+        not be found.
+    """
+    version = {"version": None, "size": None}
+    try:
+        if url.startswith(("http://", "https://")):
+            response = requests.head(url, timeout=10, allow_redirects=True)
+            if response.ok:
+                version["version"] = response.headers.get(
+                    "ETag", response.headers.get("Last-Modified")
+                )
+                version["size"] = int(response.headers.get("Content-Length", 0))
+        else:
+            stat = os.stat(url)
+            version["version"] = f"{stat.st_mtime_ns}-{stat.st_size}"
+            version["size"] = stat.st_size
+    except (OSError, requests.RequestException):
+        pass
+    return version
+
+
+def reload_csv(
+    bucket: str,
+    root_url: str,
+    filenames: list,
+    columns: str,
+    drop_columns: list,
+    convert_geom: bool,
+    versions: dict,
+):
+    """
+    reload_csv: load again the csv files of a dataset of the dataset store,
+    after a file changed
+
+    Args:
+        bucket (str): bucket name
+        root_url (str): url of the object store
+        filenames (list): the arguments of GetBucket.load_csv
+        columns (str): the arguments of GetBucket.load_csv
+        drop_columns (list): the arguments of GetBucket.load_csv
+        convert_geom (bool): the arguments of GetBucket.load_csv
+        versions (dict): the new versions of the files that changed, by name
+
+    Return:
+        tuple: the version of the dataset and the merged files, or None and None
+        if the versions of the files are not known
+    """
+    data = GetBucket(bucket, root_url)
+    data.versions.update(versions)
+    versions = data.get_versions(filenames)
+    if not all(version["version"] for version in versions.values()):
+        return None, None
+    return request_hash(None, versions), data.load_csv(
+        filenames, columns, drop_columns, convert_geom
+    )
+
+
+def read_url(url: str):
+    """
+    read_url: download a file, or read it if the url is a local path
+
+    Args:
+        url (str): the url or the path of the file
+
+    Return:
+        bytes: the content of the file
+    """
+    if url.startswith(("http://", "https://")):
+        response = requests.get(url, timeout=60)
+        response.raise_for_status()
+        content = response.content
+    else:
+        with open(url, "rb") as file:
+            content = file.read()
+    bytes_fetched.inc(len(content))
+    return content
+
 
 class GetBucket:
     """
     GetBucket class for get data and manage some calculations on csv, geojson and parquet data
 
+    It is a query object of a request: the loaded files are kept by the dataset
+    store of the process, and GetBucket holds the view of the request (df), the
+    results of the calculations and the versions of the files.
+
     This class has the following methods:
         * get: get data from the files
-        * do_calc: apply some calculations on the data
-        * biodiversity5: calculation of simpson index
-        * biodiversity4: calculation of shannon index
-        * biodiversity3: calculation of number of morphotypes
-        * biodiversity2: calculation of diversity across survey
-        * biodiversity1: calculation of diversity by substrate
-        * organism_calculation: apply some calculation on the organisms columns
-        * agg_calculation: apply some calculation based on agg values
+        * do_calc: apply some calculations on the data, using CalcPlanner
         * clip_data: clip data based on a bbox
         * get_geojson: function for open geojson data on the object store
         * get_parquet: function for open parquet data on the object store
-        * get_csv: function for open and merge csv files on the object store
+        * get_versions: get the version of the files on the object store
+        * fetch: download a file from the object store
+        * get_csv: open and merge csv files, using the dataset store
+        * load_csv: function for open and merge csv files on the object store
         * get_stac: function for open stac catalog and create a single json
     """
 
@@ -72,11 +173,13 @@ class GetBucket:
         # self.__jasmin_secret = os.environ.get("JASMIN_SECRET")
         if not base_url:
             base_url = os.environ.get("JASMIN_API_URL")
+        self.root_url = base_url
         self.base_url = f"{base_url}{self.bucket}/"
 
         self.result = {}
         self.df = None
         self.client = None
+        self.versions = {}
 
     def get(
         self,
@@ -149,316 +252,18 @@ class GetBucket:
 
         all_columns (Optional(bool)): return all columns from the file
 
+        The calculations are planned by CalcPlanner, which computes the
+        intermediates shared by them only once and never changes self.df.
+
         Returns:
             json_data: a json structure with the calculation results
         """
-        print(exclude_index)
-
-        calc = calc.split(",")
-
-        for calc_column in calc_columns:
-            self.result[calc_column] = {}
-            for calc_type in calc:
-                if calc_type == "count":
-                    self.result[calc_column]["Number"] = [
-                        len(self.df[calc_column].unique())
-                    ]
-                if calc_type == "unique":
-                    if not all_columns:
-                        self.result[calc_column]["Types"] = (
-                            self.df.groupby(calc_column)
-                            .first()
-                            .reset_index()[[calc_column, "filename"]]
-                            .values.tolist()
-                        )
-                    else:
-                        df = self.df.groupby(calc_column).first().reset_index()
-                        for column in self.df.columns:
-                            if column == "Start date":
-                                new_df = pd.to_datetime(df[column], format="%d/%m/%Y")
-                                self.result[column] = [new_df.min(), new_df.max()]
-                            else:
-                                new_df = (
-                                    df.groupby(column).first().reset_index()[[column]]
-                                )
-                                self.result[column] = []
-                                for idx, row in new_df.iterrows():
-                                    # print(idx)
-                                    self.result[column].append(
-                                        {"value": row[column], "label": row[column]}
-                                    )
-                    if not all_columns:
-                        self.result = self.result[[calc_column, "filename"]]
-                    print(self.result)
-                    self.result.values()
-                if calc_type == "agg":
-                    self.agg_calculation(agg_columns, calc_column)
-                if calc_type == "organism":
-                    self.organism_calculation(agg_columns, calc_column)
-
-                if calc_type == "biodiversity1":
-                    self.biodiversity1(calc_column)
-
-                if calc_type == "biodiversity2":
-                    self.biodiversity2(calc_column)
-
-                if calc_type == "biodiversity3":
-                    self.biodiversity3(calc_column)
-
-                if calc_type == "biodiversity4":
-                    self.biodiversity4(calc_column)
-
-                if calc_type == "biodiversity5":
-                    self.biodiversity5(calc_column)
-
-    def biodiversity5(self, calc_column: str):
-        """
-        biodiversity5: calculation of simpson index
-
-        Args:
-            calc_column (str): name of the column that you want to apply the
-        calculation
-        """
-
-        self.result[calc_column]["Types"] = []
-        list_unique = self.df[calc_column].unique()
-        for unique_c in list_unique:
-            new_result = {}
-            column_result = []
-            new_df = self.df[self.df[calc_column] == unique_c]
-            try:
-                new_df = new_df[all_organisms]
-            except KeyError:
-                new_df = new_df[all_organisms2]
-            for idx, row in new_df.iterrows():
-                total = 0
-                sum_values = np.sum(row.values)
-                if sum_values:
-                    for val in row.values:
-                        total += (val / sum_values) * (val / sum_values)
-                    column_result.append(1 / total)
-                print(idx)
-            new_result[calc_column] = unique_c
-            new_result["Result"] = (
-                str(np.mean(column_result).round(2))
-                + " +/- st dev "
-                + str(np.std(column_result).round(2))
-            )
-            self.result[calc_column]["Types"].append(new_result)
-
-    def biodiversity4(self, calc_column: str):
-        """
-        biodiversity4: calculation of shannon index
-
-        Args:
-            calc_column (str): name of the column that you want to apply the
-        calculation
-        """
-
-        self.result[calc_column]["Types"] = []
-        list_unique = self.df[calc_column].unique()
-        for unique_c in list_unique:
-            new_result = {}
-            column_result = []
-            new_df = self.df[self.df[calc_column] == unique_c]
-            try:
-                new_df = new_df[all_organisms]
-            except KeyError:
-                new_df = new_df[all_organisms2]
-            for idx, row in new_df.iterrows():
-                print(idx)
-                total = 0
-                sum_values = np.sum(row.values)
-                for val in row.values:
-                    if val != 0:
-                        total += (val / sum_values) * math.log(val / sum_values)
-                column_result.append(math.exp(-total))
-
-            new_result[calc_column] = unique_c
-            new_result["Result"] = (
-                str(np.mean(column_result).round(2))
-                + " +/- st dev "
-                + str(np.std(column_result).round(2))
-            )
-            self.result[calc_column]["Types"].append(new_result)
-
-    def biodiversity3(self, calc_column: str):
-        """
-        biodiversity3: calculation of number of morphotypes
-
-        Args:
-            calc_column (str): name of the column that you want to apply the
-        calculation
-        """
-        self.result[calc_column]["Types"] = []
-        list_unique = self.df[calc_column].unique()
-        for unique_c in list_unique:
-            new_result = {}
-            column_result = []
-            new_df = self.df[self.df[calc_column] == unique_c]
-            try:
-                new_df = new_df[all_organisms]
-            except KeyError:
-                new_df = new_df[all_organisms2]
-            for idx, row in new_df.iterrows():
-                print(idx)
-                column_result.append(len(row[row > 0]))
-            new_result[calc_column] = unique_c
-            new_result["Number"] = (
-                str(np.mean(column_result).round(1))
-                + " +/- st dev "
-                + str(np.std(column_result).round(1))
-            )
-            self.result[calc_column]["Types"].append(new_result)
-
-    def biodiversity2(self, calc_column: str):
-        """
-        biodiversity2: calculation of diversity across survey
-
-        Args:
-            calc_column (str): name of the column that you want to apply the
-        calculation
-        """
-
-        self.df = self.df.sum()
-        try:
-            self.df = self.df[all_organisms]
-        except KeyError:
-            self.df = self.df[all_organisms2]
-        self.df = self.df[self.df > 0]
-        self.result[calc_column]["Number of morphotypes"] = [len(self.df)]
-
-    def biodiversity1(self, calc_column: str):
-        """
-        biodiversity1: calculation of diversity by substrate
-
-        Args:
-            calc_column (str): name of the column that you want to apply the
-        calculation
-        """
-        try:
-            self.df["sum_organisms"] = (self.df[all_organisms]).sum(axis=1)
-        except KeyError:
-            self.df["sum_organisms"] = (self.df[all_organisms2]).sum(axis=1)
-
-        self.df["relation_seabed_organism"] = (
-            self.df["sum_organisms"] / self.df["Area_m2"]
-        )
-        self.df = self.df[["relation_seabed_organism", calc_column]]
-        self.df = self.df.groupby(calc_column).agg([np.mean, np.std])
-        self.df = self.df.round(3)
-        self.df.columns = ["mean", "std"]
-        self.df["Density (individuals m-2)"] = (
-            self.df["mean"].astype(str) + " +/- st dev " + self.df["std"].astype(str)
-        )
-        self.df.drop(columns=["mean", "std"], inplace=True)
-        self.result = {}
-        self.result[calc_column] = {}
-        self.result[calc_column]["Types"] = self.df.reset_index().to_dict(
-            orient="records"
-        )
-
-    def organism_calculation(self, agg_columns: str, calc_column: str):
-        """
-        organism_calculation: apply some calculation on the organisms columns
-
-        Args:
-        agg_columns (str): You define the name of calculation and
-            the column that you want to apply it. For example, if you want to get
-            the first data of column test and get unique values of column test2,
-            you should pass 'first:test,unique:test1'
-
-        calc_column (str): name of the column that you want to apply the
-            calculation
-        """
-
-        self.df[calc_column] = pd.to_numeric(
-            self.df[calc_column], downcast="integer", errors="coerce"
-        )
-        new_df = self.df[self.df[calc_column] > 0]
-        agg_columns = agg_columns.split(",")
-        agg_calcs = {}
-        get_first = []
-        get_density = None
-        for agg in agg_columns:
-            agg = agg.split(":")
-            if agg[0] == "first":
-                get_first.append(agg)
-            elif agg[0] == "density":
-                get_density = agg[1]
-            else:
-                agg_calcs[agg[1]] = agg[0]
-        self.result[calc_column]["Information"] = []
-        result_values = {}
-        if len(get_first) > 0:
-            for first in get_first:
-                result_values[first[1]] = new_df.iloc[0][first[1]]
-        if get_density:
-            sum_organism = self.df[calc_column].sum()
-            area = pd.to_numeric(
-                self.df[get_density], downcast="integer", errors="coerce"
-            ).sum()
-            result_values["Density (individuals ha-1)"] = sum_organism / area * 10000
-        if agg_calcs:
-            dict_temp = new_df.agg(agg_calcs).to_dict()
-            for key, value in dict_temp.items():
-                if key == calc_column:
-                    if get_density:
-                        key = "Number of Specimens"
-                        value = str(round(value))
-
-                    else:
-                        key = "Number"
-                result_values[key] = value
-        self.result[calc_column]["Information"].append(result_values)
-
-    def agg_calculation(self, agg_columns, calc_column):
-        """
-        agg_calculation: apply some calculation based on agg values
-
-        Args:
-        agg_columns (str): You define the name of calculation and
-            the column that you want to apply it. For example, if you want to get
-            the first data of column test and get unique values of column test2,
-            you should pass 'first:test,unique:test1'
-
-        calc_column (str): name of the column that you want to apply the
-            calculation
-        """
-
-        agg_columns = agg_columns.split(",")
-        agg_calcs = {}
-        new_columns = []
-        get_first = None
-        for agg in agg_columns:
-            agg = agg.split(":")
-            if agg[0] == "first":
-                get_first = agg[1]
-            if agg[0] in "density":
-                agg[0] = "sum"
-                for i in all_organisms:
-                    agg_calcs[i] = agg[0]
-                    new_columns.append(i)
-            else:
-                agg_calcs[agg[1]] = agg[0]
-                if agg[0] in "count":
-                    new_columns.append("Number")
-                else:
-                    new_columns.append(agg[1])
-
-        if get_first:
-            result = (
-                self.df.sort_values(get_first, ascending=False)
-                .groupby(calc_column)
-                .agg(agg_calcs)
-            )
-        else:
-            result = self.df.groupby(calc_column).agg(agg_calcs)
-        result.columns = new_columns
-        result = result.round()
-        self.result[calc_column]["Types"] = result.reset_index().to_dict(
-            orient="records"
+        planner = CalcPlanner(self.df)
+        steps = planner.plan(calc, calc_columns, agg_columns)
+        self.result.update(
+            planner.run(steps, agg_columns=agg_columns, all_columns=all_columns)
         )
+        return self.result
 
     def clip_data(self, bbox: str, crs: str, lat_lon_columns: str):
         """
@@ -497,8 +302,9 @@ class GetBucket:
 
         final_bbox = [float(xmin), float(ymin), float(xmax), float(ymax)]
 
-        self.df = gpd.clip(gdf=self.df, mask=final_bbox, keep_geom_type=False)
-        self.df.drop(columns="geometry", inplace=True)
+        with span("clip"):
+            self.df = gpd.clip(gdf=self.df, mask=final_bbox, keep_geom_type=False)
+            self.df.drop(columns="geometry", inplace=True)
 
     # def get_geojson(self, filename: str):
     #     """
@@ -534,6 +340,63 @@ class GetBucket:
     #     ) as remote_file:
     #         self.df = gpq.read_geoparquet(remote_file)
 
+    def get_versions(self, filenames: list):
+        """
+        get_versions: get the version of the files on the object store, without
+        downloading them. The version is the ETag (or Last-Modified) of the object,
+        or the modification time if the base url is a local folder.
+
+        Args:
+        filenames (list): the names of the files, with the pathname separated by ':'
+
+        The versions of the object store are kept by the dataset store, so the
+        object store is not checked by every request (stale-while-revalidate).
+
+        Return:
+            dict: version and size of each file. The version is None if it could
+            not be found. The versions are kept in self.versions, so they are
+            found only once by request.
+        """
+        versions = {}
+        with span("versions"):
+            for filename in filenames:
+                if filename in self.versions:
+                    versions[filename] = self.versions[filename]
+                    continue
+                url = f"{self.base_url}{filename.replace(':', '/')}"
+                if url.startswith(("http://", "https://")):
+                    version = datasets.file_version(url, head_version)
+                else:
+                    version = head_version(url)
+                versions[filename] = version
+                if version["version"]:
+                    self.versions[filename] = version
+        return versions
+
+    def fetch(self, filename: str):
+        """
+        fetch: download a file from the object store, or read it if the base url
+        is a local folder. If the version of the file is known, the file is kept
+        by the file cache (memory, then local disk), so it is downloaded again
+        only when it changes.
+
+        Args:
+        filename (str): the name of the file, with the pathname separated by '/'
+
+        Return:
+            bytes: the content of the file
+        """
+        url = f"{self.base_url}{filename}"
+        version = self.versions.get(filename.replace("/", ":"), {}).get("version")
+        with span("fetch"):
+            if version and url.startswith(("http://", "https://")):
+                # the versioned files of the object store are kept by the file cache
+                return file_cache.load(
+                    f"{url}#{version}", fetch_flights.do, url, read_url, url
+                )
+            # the concurrent downloads of the same file share one request
+            return fetch_flights.do(url, read_url, url)
+
     def get_csv(
         self,
         filenames: str,
@@ -542,7 +405,57 @@ class GetBucket:
         convert_geom=False,
     ):
         """
-        get_csv: function for open and merge csv files on the object store
+        get_csv: open and merge csv files, using the dataset store. If the
+        versions of the files are known, the merged files are loaded once by
+        version and shared by the requests, and self.df is a read only view of
+        them. The arguments are the arguments of load_csv.
+
+        Return:
+            None
+        """
+        key = request_hash(
+            {
+                "base_url": self.base_url,
+                "filenames": list(filenames),
+                "columns": columns,
+                "drop_columns": list(drop_columns),
+                "convert_geom": convert_geom,
+            }
+        )
+        versions = self.get_versions(filenames)
+        version = None
+        if all(version["version"] for version in versions.values()):
+            version = request_hash(None, versions)
+        self.df = datasets.load(
+            key, version, self.load_csv, filenames, columns, drop_columns, convert_geom
+        )
+        if version:
+            datasets.watch(
+                key,
+                {
+                    f"{self.base_url}{filename.replace(':', '/')}": filename
+                    for filename in filenames
+                },
+                functools.partial(
+                    reload_csv,
+                    self.bucket,
+                    self.root_url,
+                    list(filenames),
+                    columns,
+                    list(drop_columns),
+                    convert_geom,
+                ),
+            )
+
+    def load_csv(
+        self,
+        filenames: str,
+        columns: str = None,
+        drop_columns=["Unnamed: 0"],
+        convert_geom=False,
+    ):
+        """
+        load_csv: function for open and merge csv files on the object store
 
         Args:
         filenames (str): the names of the files, separated by comma.
@@ -560,24 +473,26 @@ class GetBucket:
             be converted to geometry
 
         Return:
-            None
+            pd.DataFrame: the merged files
         """
 
-        self.df = pd.DataFrame()
+        df = pd.DataFrame()
         for filename in filenames:
             filename = filename.replace(":", "/")
-            url = f"{self.base_url}{filename}"
+            content = self.fetch(filename)
 
-            data = pd.read_csv(url)
+            with span("parse"):
+                data = pd.read_csv(io.BytesIO(content))
 
             for column in drop_columns:
                 if column in data.columns:
                     data.drop(columns=column, inplace=True)
-            if len(self.df) == 0:
-                self.df = data
+            if len(df) == 0:
+                df = data
             else:
-                merge_columns = list(set(self.df.columns) & set(data.columns))
-                self.df = self.df.merge(data, how="outer", on=merge_columns)
+                with span("merge"):
+                    merge_columns = list(set(df.columns) & set(data.columns))
+                    df = df.merge(data, how="outer", on=merge_columns)
         if columns:
             columns = columns.split(",")
             for column in columns:
@@ -586,16 +501,17 @@ class GetBucket:
                     value = False
                 elif value.lower() == "true":
                     value = True
-                self.df[key] = value
+                df[key] = value
 
-        self.df = self.df.fillna("")
+        df = df.fillna("")
         if convert_geom:
-            self.df = gpd.GeoDataFrame(
-                self.df,
+            df = gpd.GeoDataFrame(
+                df,
                 geometry=gpd.points_from_xy(
-                    self.df["longitude"],
-                    self.df["latitude"],
+                    df["longitude"],
+                    df["latitude"],
                     crs="EPSG:4326",
                 ),
             )
-            self.df.drop(columns=["latitude", "longitude"], inplace=True)
+            df.drop(columns=["latitude", "longitude"], inplace=True)
+        return df
@@ -0,0 +1,236 @@
+"""
+  JobStore Class: class for run long calculations on background workers and
+  keep their status and results for some time
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class JobStoreFull(Exception):
+    """
+    JobStoreFull: the store has no room for new jobs
+    """
+
+
+class Job:
+    """
+    Job class for keep the status, progress and result of a job
+
+    This class has the following methods:
+        * update: change the progress of the job
+        * info: status and progress of the job, without the result
+    """
+
+    def __init__(self, key: str):
+        """
+        Job class constructor
+
+        Args:
+            key (str): key of the job, equal for identical jobs
+        """
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "queued"
+        self.stage = "queued"
+        self.progress = 0.0
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def update(self, progress: float, stage: str):
+        """
+        update: change the progress of the job
+
+        Args:
+            progress (float): fraction of the job that is done, from 0 to 1
+            stage (str): description of the current stage
+        """
+        self.progress = progress
+        self.stage = stage
+
+    def info(self):
+        """
+        info: status and progress of the job, without the result
+
+        Returns:
+            dict: the information of the job
+        """
+        return {
+            "id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "created": self.created,
+            "finished": self.finished,
+            "error": self.error,
+        }
+
+
+class JobStore:
+    """
+    JobStore class for run long calculations on background workers
+
+    The jobs run on a pool of threads. A job submitted while an identical job
+    (same key) is queued or running is not run again, the running job is
+    returned. Finished jobs are kept until they expire, and the number of jobs
+    in the store is limited.
+
+    This class has the following methods:
+        * submit: add a job to the store
+        * get: get a job by id
+        * wait: wait some time for a job to finish
+        * stats: number of jobs by status
+        * shutdown: stop the workers
+    """
+
+    def __init__(self, max_workers: int = None, max_jobs: int = None, ttl=None):
+        """
+        JobStore class constructor. The size of the store can be set by the ENV
+        variables:
+        - CALC_JOB_WORKERS: number of jobs running at the same time (2)
+        - CALC_JOB_MAX: maximum number of jobs in the store (256)
+        - CALC_JOB_TTL: time, in seconds, that finished jobs are kept (3600)
+
+        Args:
+            max_workers (int, optional): number of workers. Defaults to None.
+            max_jobs (int, optional): maximum number of jobs. Defaults to None.
+            ttl (float, optional): time, in seconds, that finished jobs are kept.
+                Defaults to None.
+        """
+        if max_workers is None:
+            max_workers = int(os.environ.get("CALC_JOB_WORKERS", 2))
+        if max_jobs is None:
+            max_jobs = int(os.environ.get("CALC_JOB_MAX", 256))
+        if ttl is None:
+            ttl = float(os.environ.get("CALC_JOB_TTL", 3600))
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        self._running = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _purge(self, now: float):
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and now - job.finished >= self.ttl:
+                del self._jobs[job_id]
+
+    def submit(self, key: str, function, *args, **kwargs):
+        """
+        submit: add a job to the store. The function receives the argument
+        progress, a function to change the progress of the job.
+
+        Args:
+            key (str): key of the job, equal for identical jobs
+            function (callable): function that runs the job
+
+        Raises:
+            JobStoreFull: if the store has no room for new jobs
+
+        Returns:
+            Job: the new job, or the identical job that is queued or running
+        """
+        with self._lock:
+            job = self._running.get(key)
+            if job is not None:
+                return job
+
+            self._purge(time.time())
+            if len(self._jobs) >= self.max_jobs:
+                for job_id, old_job in list(self._jobs.items()):
+                    if old_job.finished is not None:
+                        del self._jobs[job_id]
+                        break
+                else:
+                    raise JobStoreFull(f"{self.max_jobs} jobs are queued or running")
+
+            job = Job(key)
+            self._jobs[job.id] = job
+            self._running[key] = job
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="calc-job"
+                )
+            self._executor.submit(self._run, job, function, args, kwargs)
+        return job
+
+    def _run(self, job: Job, function, args: tuple, kwargs: dict):
+        job.status = "running"
+        job.update(0.0, "running")
+        try:
+            job.result = function(*args, progress=job.update, **kwargs)
+            job.status = "done"
+            job.update(1.0, "done")
+        except Exception as error:  # pylint: disable=broad-except
+            job.status = "failed"
+            job.error = getattr(error, "detail", None) or str(error)
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._running.pop(job.key, None)
+            job.done.set()
+
+    def get(self, job_id: str):
+        """
+        get: get a job by id
+
+        Args:
+            job_id (str): id of the job
+
+        Returns:
+            Job: the job, or None if it does not exist or it expired
+        """
+        with self._lock:
+            self._purge(time.time())
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float):
+        """
+        wait: wait some time for a job to finish
+
+        Args:
+            job_id (str): id of the job
+            timeout (float): maximum time to wait, in seconds
+
+        Returns:
+            Job: the job, or None if it does not exist or it expired
+        """
+        job = self.get(job_id)
+        if job is not None and timeout > 0:
+            job.done.wait(timeout)
+        return job
+
+    def stats(self):
+        """
+        stats: number of jobs by status
+
+        Returns:
+            dict: the statistics of the store
+        """
+        with self._lock:
+            self._purge(time.time())
+            stats = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+            for job in self._jobs.values():
+                stats[job.status] += 1
+            stats.update(jobs=len(self._jobs), max_jobs=self.max_jobs, ttl=self.ttl)
+            return stats
+
+    def shutdown(self):
+        """
+        shutdown: stop the workers, after the running jobs finish
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
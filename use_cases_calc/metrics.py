@@ -0,0 +1,456 @@
+"""
+  Metrics module: counters and histograms of the API, written in the
+  Prometheus text format
+"""
+import bisect
+import os
+import resource
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# buckets of the latency histograms, in seconds
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def metrics_enabled():
+    """
+    metrics_enabled: if the metrics are recorded, by the ENV variable METRICS
+
+    Returns:
+        bool: True if the metrics are recorded
+    """
+    return os.environ.get("METRICS", "true").lower() in ("1", "true", "yes")
+
+
+def format_labels(labelnames: tuple, labels: tuple):
+    """
+    format_labels: labels of a sample in the Prometheus text format
+
+    Args:
+        labelnames (tuple): names of the labels
+        labels (tuple): values of the labels
+
+    Returns:
+        str: the labels, like {route="/v1/calc/",status="200"}
+    """
+    if not labelnames:
+        return ""
+    values = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for value in labels
+    )
+    return (
+        "{"
+        + ",".join(f'{name}="{value}"' for name, value in zip(labelnames, values))
+        + "}"
+    )
+
+
+class Counter:
+    """
+    Counter class for a value that only increases, by labels
+
+    This class has the following methods:
+        * inc: increase the value of the labels
+        * samples: lines of the counter in the Prometheus text format
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        """
+        Counter class constructor
+
+        Args:
+            name (str): name of the metric
+            documentation (str): help of the metric
+            labelnames (tuple, optional): names of the labels. Defaults to ().
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, labels: tuple = ()):
+        """
+        inc: increase the value of the labels
+
+        Args:
+            amount (float, optional): the increase. Defaults to 1.
+            labels (tuple, optional): values of the labels. Defaults to ().
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        """
+        samples: lines of the counter in the Prometheus text format
+
+        Returns:
+            list: the lines
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(
+                    f"{self.name}{format_labels(self.labelnames, labels)} {value}"
+                )
+        return lines
+
+
+class Histogram:
+    """
+    Histogram class for the distribution of a value, like the latency, by labels
+
+    This class has the following methods:
+        * observe: add a value to the histogram of the labels
+        * samples: lines of the histogram in the Prometheus text format
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        """
+        Histogram class constructor
+
+        Args:
+            name (str): name of the metric
+            documentation (str): help of the metric
+            labelnames (tuple, optional): names of the labels. Defaults to ().
+            buckets (tuple, optional): upper bounds of the buckets, sorted.
+                Defaults to LATENCY_BUCKETS.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple = ()):
+        """
+        observe: add a value to the histogram of the labels
+
+        Args:
+            value (float): the value
+            labels (tuple, optional): values of the labels. Defaults to ().
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # counts of each bucket, then the count and the sum of the values
+                counts = self._values[labels] = [0] * (len(self.buckets) + 2) + [0.0]
+            counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        """
+        samples: lines of the histogram in the Prometheus text format
+
+        Returns:
+            list: the lines
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        labelnames = self.labelnames + ("le",)
+        with self._lock:
+            values = sorted(
+                (labels, list(counts)) for labels, counts in self._values.items()
+            )
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{format_labels(labelnames, labels + (bound,))} "
+                    f"{cumulative}"
+                )
+            suffix = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_count{suffix} {counts[-2]}")
+            lines.append(f"{self.name}_sum{suffix} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    MetricsRegistry class for keep the metrics of the API and write them in the
+    Prometheus text format. The values that are known by other objects, like the
+    statistics of the caches, are read by collectors when the metrics are written.
+
+    This class has the following methods:
+        * counter: create a counter
+        * histogram: create a histogram
+        * add_collector: add a function that returns gauges
+        * render: write the metrics in the Prometheus text format
+    """
+
+    def __init__(self):
+        """
+        MetricsRegistry class constructor
+        """
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()):
+        """
+        counter: create a counter
+
+        Args:
+            name (str): name of the metric
+            documentation (str): help of the metric
+            labelnames (tuple, optional): names of the labels. Defaults to ().
+
+        Returns:
+            Counter: the counter
+        """
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = LATENCY_BUCKETS,
+    ):
+        """
+        histogram: create a histogram
+
+        Args:
+            name (str): name of the metric
+            documentation (str): help of the metric
+            labelnames (tuple, optional): names of the labels. Defaults to ().
+            buckets (tuple, optional): upper bounds of the buckets.
+                Defaults to LATENCY_BUCKETS.
+
+        Returns:
+            Histogram: the histogram
+        """
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple,
+        collect,
+        metric_type: str = "gauge",
+    ):
+        """
+        add_collector: add a function that returns gauges, or the values of
+        counters kept outside of the registry
+
+        Args:
+            name (str): name of the metric
+            documentation (str): help of the metric
+            labelnames (tuple): names of the labels
+            collect (callable): function that returns the value of each labels,
+                like {("calc",): 0.5}
+            metric_type (str, optional): type of the metric, gauge or counter.
+                Defaults to "gauge".
+        """
+        self._collectors.append((name, documentation, labelnames, collect, metric_type))
+
+    def render(self):
+        """
+        render: write the metrics in the Prometheus text format
+
+        Returns:
+            str: the metrics
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.samples())
+        for name, documentation, labelnames, collect, metric_type in self._collectors:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(collect().items()):
+                lines.append(f"{name}{format_labels(labelnames, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def resident_memory():
+    """
+    resident_memory: resident memory of the process, in bytes
+
+    Returns:
+        dict: current and peak resident memory
+    """
+    memory = {}
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as statm:
+            memory[("current",)] = int(statm.read().split()[1]) * os.sysconf(
+                "SC_PAGE_SIZE"
+            )
+    except (OSError, ValueError):
+        pass
+    # ru_maxrss is in kilobytes on linux
+    memory[("peak",)] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return memory
+
+
+registry = MetricsRegistry()
+
+request_latency = registry.histogram(
+    "http_request_duration_seconds",
+    "Latency of the requests, by route",
+    ("method", "route", "status"),
+)
+calc_latency = registry.histogram(
+    "calc_request_duration_seconds",
+    "Latency of the /v1/calc requests, by calc types",
+    ("calc",),
+)
+stage_latency = registry.histogram(
+    "request_stage_duration_seconds",
+    "Time spent on each stage of the requests, like fetch, parse, merge, clip, "
+    "calc.<type> and serialize",
+    ("stage",),
+)
+bytes_fetched = registry.counter(
+    "object_store_fetched_bytes_total",
+    "Bytes downloaded from the object store",
+)
+registry.add_collector(
+    "process_memory_bytes",
+    "Resident memory of the process",
+    ("kind",),
+    resident_memory,
+)
+registry.add_collector(
+    "process_cpu_seconds_total",
+    "Cpu time of the process",
+    (),
+    lambda: {(): time.process_time()},
+    "counter",
+)
+
+
+def add_cache_collectors(caches: dict):
+    """
+    add_cache_collectors: add the hits, misses, hit ratio and entries of caches
+    to the metrics
+
+    Args:
+        caches (dict): objects with a stats method (like ResultCache), by name
+    """
+    for stat in ("hits", "misses", "hit_ratio", "entries"):
+        registry.add_collector(
+            f"cache_{stat}",
+            f"{stat.replace('_', ' ').capitalize()} of the caches",
+            ("cache",),
+            lambda stat=stat: {
+                (name,): cache.stats()[stat] for name, cache in caches.items()
+            },
+        )
+
+
+def add_flight_collectors(flights: dict):
+    """
+    add_flight_collectors: add the runs, shared calls and keys in flight of
+    SingleFlight objects to the metrics
+
+    Args:
+        flights (dict): objects with a stats method (like SingleFlight), by name
+    """
+    for stat, help_text in (
+        ("leaders", "Computations run by the single flights"),
+        ("shared", "Calls that shared the computation of another call"),
+        ("in_flight", "Computations running on the single flights"),
+    ):
+        registry.add_collector(
+            f"single_flight_{stat}",
+            help_text,
+            ("flight",),
+            lambda stat=stat: {
+                (name,): flight.stats()[stat] for name, flight in flights.items()
+            },
+        )
+
+
+def add_tier_collectors(caches: dict):
+    """
+    add_tier_collectors: add the hits, misses, evictions, entries and bytes of
+    each tier of tiered caches, and the loads and bytes of their origin, to the
+    metrics
+
+    Args:
+        caches (dict): objects with a stats method (like TieredCache), by name
+    """
+    for stat in ("hits", "misses", "evictions", "entries", "bytes"):
+        registry.add_collector(
+            f"cache_tier_{stat}",
+            f"{stat.capitalize()} of the tiers of the caches",
+            ("cache", "tier"),
+            lambda stat=stat: {
+                (name, tier): tier_stats[stat]
+                for name, cache in caches.items()
+                for tier, tier_stats in cache.stats().items()
+                if tier != "origin"
+            },
+        )
+    for stat in ("loads", "bytes"):
+        registry.add_collector(
+            f"cache_origin_{stat}",
+            f"{stat.capitalize()} loaded from the origin of the caches",
+            ("cache",),
+            lambda stat=stat: {
+                (name,): cache.stats()["origin"][stat] for name, cache in caches.items()
+            },
+        )
+
+
+def add_admission_collectors(admission):
+    """
+    add_admission_collectors: add the memory in use and the heavy requests
+    running, waiting and rejected by the admission control to the metrics
+
+    Args:
+        admission (AdmissionControl): the admission control
+    """
+    for stat, help_text in (
+        ("in_use", "Memory, in bytes, of the heavy requests running"),
+        ("running", "Heavy requests running"),
+        ("waiting", "Heavy requests waiting for the memory budget"),
+        ("admitted", "Heavy requests admitted"),
+        ("cheap", "Cheap requests admitted without waiting"),
+        ("rejected", "Heavy requests rejected"),
+    ):
+        registry.add_collector(
+            f"admission_{stat}",
+            help_text,
+            (),
+            lambda stat=stat: {(): admission.stats()[stat]},
+        )
@@ -0,0 +1,267 @@
+"""
+  OrganismMatrix Class: class for keep the organism counts of a survey as a
+  dense or a sparse (CSR) matrix, with the operations of the calculations
+"""
+import os
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class OrganismMatrix:
+    """
+    OrganismMatrix class for keep the organism counts as a dense or sparse matrix
+
+    Most organism counts of an image or transect are zero, so the sparse
+    representation keeps only the nonzero values (CSR: values, column indices
+    and the first value of each row). All the operations run on both
+    representations and give the same results.
+
+    This class has the following methods:
+        * from_frame: create the matrix from the organism columns of a frame
+        * row_sums: sum of the organisms of each row
+        * column_sums: sum of each organism
+        * row_positive: number of organisms with positive counts in each row
+        * row_shannon: shannon diversity (exp of the entropy) of each row
+        * row_simpson: inverse simpson index of each row
+        * group_sums: sum of each organism by group of rows
+        * to_dense: the matrix as a dense array
+        * memory_report: memory used by the matrix and by a dense matrix
+    """
+
+    def __init__(self, shape: tuple, dtype, dense=None, sparse=None):
+        """
+        OrganismMatrix class constructor. Use from_frame to create a matrix.
+
+        Args:
+            shape (tuple): number of rows and columns
+            dtype (np.dtype): type of the values
+            dense (np.ndarray, optional): dense matrix. Defaults to None.
+            sparse (tuple, optional): values, column indices and row pointers
+                of a CSR matrix. Defaults to None.
+        """
+        self.shape = shape
+        self.dtype = np.dtype(dtype)
+        self.dense = dense
+        self.sparse = sparse
+        self._rows = None
+
+    @classmethod
+    def from_frame(cls, block: pd.DataFrame, mode: str = None):
+        """
+        from_frame: create the matrix from the organism columns of a frame. The
+        mode can be set by the ENV variables:
+        - ORGANISM_MATRIX: dense, sparse or auto (auto)
+        - ORGANISM_SPARSE_DENSITY: maximum fraction of nonzero values to use the
+          sparse matrix on auto mode (0.25)
+
+        Args:
+            block (pd.DataFrame): the organism columns
+            mode (str, optional): dense, sparse or auto. Defaults to None.
+
+        Returns:
+            OrganismMatrix: the matrix
+        """
+        if mode is None:
+            mode = os.environ.get("ORGANISM_MATRIX", "auto")
+        columns = []
+        for column in block.columns:
+            values = block[column]
+            if not pd.api.types.is_numeric_dtype(values):
+                values = pd.to_numeric(values, errors="coerce").fillna(0)
+            columns.append(values.to_numpy())
+        dtype = np.result_type(*columns) if columns else np.float64
+        shape = (len(block), len(columns))
+
+        nonzero = [np.flatnonzero(values) for values in columns]
+        nnz = sum(len(rows) for rows in nonzero)
+        if mode == "auto":
+            max_density = float(os.environ.get("ORGANISM_SPARSE_DENSITY", 0.25))
+            size = shape[0] * shape[1]
+            mode = "sparse" if size and nnz / size <= max_density else "dense"
+
+        if mode != "sparse":
+            dense = np.empty(shape, dtype=dtype)
+            for i, values in enumerate(columns):
+                dense[:, i] = values
+            return cls(shape, dtype, dense=dense)
+
+        rows = np.concatenate(nonzero) if nonzero else np.empty(0, dtype=np.intp)
+        indices = np.repeat(
+            np.arange(shape[1], dtype=np.int32), [len(r) for r in nonzero]
+        )
+        data = np.concatenate(
+            [values[r] for values, r in zip(columns, nonzero)]
+        ).astype(dtype)
+        order = np.argsort(rows, kind="stable")
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        matrix = cls(shape, dtype, sparse=(data[order], indices[order], indptr))
+        matrix._rows = rows[order].astype(np.int32)
+        return matrix
+
+    @property
+    def is_sparse(self):
+        """
+        is_sparse: if the matrix uses the sparse representation
+        """
+        return self.sparse is not None
+
+    @property
+    def nnz(self):
+        """
+        nnz: number of nonzero values
+        """
+        if self.is_sparse:
+            return len(self.sparse[0])
+        return int(np.count_nonzero(self.dense))
+
+    def _row_ids(self):
+        if self._rows is None:
+            indptr = self.sparse[2]
+            self._rows = np.repeat(
+                np.arange(self.shape[0], dtype=np.int32), np.diff(indptr)
+            )
+        return self._rows
+
+    def _bincount(self, ids, weights, length):
+        result = np.bincount(ids, weights=weights, minlength=length)
+        if np.issubdtype(self.dtype, np.integer) and weights is not None:
+            return result.astype(self.dtype)
+        return result
+
+    def row_sums(self):
+        """
+        row_sums: sum of the organisms of each row
+
+        Returns:
+            np.ndarray: the sums
+        """
+        if not self.is_sparse:
+            return self.dense.sum(axis=1)
+        return self._bincount(self._row_ids(), self.sparse[0], self.shape[0])
+
+    def column_sums(self):
+        """
+        column_sums: sum of each organism
+
+        Returns:
+            np.ndarray: the sums
+        """
+        if not self.is_sparse:
+            return self.dense.sum(axis=0)
+        return self._bincount(self.sparse[1], self.sparse[0], self.shape[1])
+
+    def row_positive(self):
+        """
+        row_positive: number of organisms with positive counts in each row
+
+        Returns:
+            np.ndarray: the number of organisms
+        """
+        if not self.is_sparse:
+            return (self.dense > 0).sum(axis=1)
+        positive = self.sparse[0] > 0
+        return np.bincount(self._row_ids()[positive], minlength=self.shape[0])
+
+    def _row_proportion_sums(self, totals, function):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if not self.is_sparse:
+                proportion = self.dense / totals[:, None]
+                values = np.where(self.dense != 0, function(proportion), 0.0)
+                return values.sum(axis=1)
+            rows = self._row_ids()
+            proportion = self.sparse[0] / totals[rows]
+            return np.bincount(
+                rows, weights=function(proportion), minlength=self.shape[0]
+            )
+
+    def row_shannon(self, totals):
+        """
+        row_shannon: shannon diversity (exp of the entropy) of each row. Only the
+        nonzero values are used. Rows without organisms have diversity 1.
+
+        Args:
+            totals (np.ndarray): sum of the organisms of each row
+
+        Returns:
+            np.ndarray: the diversity of each row
+        """
+        entropy = self._row_proportion_sums(totals, lambda p: p * np.log(p))
+        return np.exp(-entropy)
+
+    def row_simpson(self, totals):
+        """
+        row_simpson: inverse simpson index of each row. Rows without organisms
+        are nan.
+
+        Args:
+            totals (np.ndarray): sum of the organisms of each row
+
+        Returns:
+            np.ndarray: the index of each row
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            simpson = 1 / self._row_proportion_sums(totals, lambda p: p * p)
+        return np.where(totals != 0, simpson, np.nan)
+
+    def group_sums(self, codes, n_groups: int):
+        """
+        group_sums: sum of each organism by group of rows
+
+        Args:
+            codes (np.ndarray): group of each row, negative for rows without group
+            n_groups (int): number of groups
+
+        Returns:
+            np.ndarray: the sums, with one row by group
+        """
+        sums = np.zeros((n_groups, self.shape[1]), dtype=self.dtype)
+        if not self.is_sparse:
+            valid = codes >= 0
+            np.add.at(sums, codes[valid], self.dense[valid])
+            return sums
+        groups = codes[self._row_ids()]
+        valid = groups >= 0
+        np.add.at(sums, (groups[valid], self.sparse[1][valid]), self.sparse[0][valid])
+        return sums
+
+    def to_dense(self):
+        """
+        to_dense: the matrix as a dense array
+
+        Returns:
+            np.ndarray: the dense matrix
+        """
+        if not self.is_sparse:
+            return self.dense
+        dense = np.zeros(self.shape, dtype=self.dtype)
+        dense[self._row_ids(), self.sparse[1]] = self.sparse[0]
+        return dense
+
+    def memory_report(self):
+        """
+        memory_report: memory used by the matrix and by a dense matrix
+
+        Returns:
+            dict: shape, density and bytes of the representations
+        """
+        size = self.shape[0] * self.shape[1]
+        dense_bytes = size * self.dtype.itemsize
+        if self.is_sparse:
+            data, indices, indptr = self.sparse
+            nbytes = data.nbytes + indices.nbytes + indptr.nbytes
+        else:
+            nbytes = self.dense.nbytes
+        return {
+            "representation": "sparse" if self.is_sparse else "dense",
+            "rows": self.shape[0],
+            "columns": self.shape[1],
+            "density": self.nnz / size if size else 0.0,
+            "bytes": nbytes,
+            "dense_bytes": dense_bytes,
+            "saved_bytes": dense_bytes - nbytes,
+        }
@@ -0,0 +1,135 @@
+"""
+  Profiling module: profile of a request, with the time of its functions
+  (cProfile) and its memory allocations (tracemalloc)
+"""
+import cProfile
+import io
+import marshal
+import pstats
+import time
+import tracemalloc
+import uuid
+from contextvars import ContextVar
+
+# profile of the current request, None if the request is not profiled
+current_profile = ContextVar("current_profile", default=None)
+
+
+class RequestProfile:
+    """
+    RequestProfile class for profile a request. The functions are profiled on
+    the thread that starts the profile, and the memory allocations of the whole
+    process are traced while the profile runs. It can be used as a context
+    manager, that starts and stops the profile.
+
+    This class has the following methods:
+        * start: start the profile
+        * stop: stop the profile and take the memory snapshot
+        * report: functions with the largest cumulative time and memory usage
+        * text: call tree of the profile, written by pstats
+        * dump: the profile in the pstats format, for tools like snakeviz
+    """
+
+    def __init__(self, top: int = 25):
+        """
+        RequestProfile class constructor
+
+        Args:
+            top (int, optional): number of functions and allocations of the
+                report. Defaults to 25.
+        """
+        self.id = uuid.uuid4().hex
+        self.top = top
+        self.seconds = None
+        self.memory = None
+        self._profiler = cProfile.Profile()
+        self._start = None
+        self._stop_tracemalloc = False
+
+    def start(self):
+        """
+        start: start the profile
+        """
+        self._stop_tracemalloc = not tracemalloc.is_tracing()
+        if self._stop_tracemalloc:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+        self._profiler.enable()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stop(self):
+        """
+        stop: stop the profile and take the memory snapshot
+        """
+        self._profiler.disable()
+        self.seconds = time.perf_counter() - self._start
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        if self._stop_tracemalloc:
+            tracemalloc.stop()
+        self.memory = {
+            "peak_bytes": peak,
+            "top_allocations": [
+                {
+                    "line": str(stat.traceback[0]),
+                    "bytes": stat.size,
+                    "count": stat.count,
+                }
+                for stat in snapshot.statistics("lineno")[: self.top]
+            ],
+        }
+
+    def report(self):
+        """
+        report: functions with the largest cumulative time and memory usage
+
+        Returns:
+            dict: time of the request, functions and memory
+        """
+        stats = pstats.Stats(self._profiler).stats
+        functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        return {
+            "id": self.id,
+            "seconds": self.seconds,
+            "functions": [
+                {
+                    "function": pstats.func_std_string(function),
+                    "calls": calls,
+                    "total_ms": round(total * 1000, 3),
+                    "cumulative_ms": round(cumulative * 1000, 3),
+                }
+                for function, (_, calls, total, cumulative, _) in functions[: self.top]
+            ],
+            "memory": self.memory,
+        }
+
+    def text(self):
+        """
+        text: call tree of the profile, written by pstats
+
+        Returns:
+            str: the functions sorted by cumulative time, and their callees
+        """
+        stream = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=stream).sort_stats("cumulative")
+        stats.print_stats(self.top)
+        stats.print_callees(self.top)
+        return stream.getvalue()
+
+    def dump(self):
+        """
+        dump: the profile in the pstats format, for tools like snakeviz
+
+        Returns:
+            bytes: the profile, like the files of pstats.Stats.dump_stats
+        """
+        return marshal.dumps(pstats.Stats(self._profiler).stats)
@@ -0,0 +1,115 @@
+"""
+  Functions for create the keys of the requests, used by the caches of the API.
+
+  This module contains the following functions:
+    * normalize_params: canonical version of the parameters of a request
+    * request_hash: hash of the normalized parameters and the versions of the files
+    * encode_cursor: opaque cursor of a page of a dataset
+    * decode_cursor: dataset, version and offset of a cursor
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+# parameters that are lists separated by comma, and if their order matters
+LIST_PARAMS = {
+    "filenames": False,
+    "drop_columns": False,
+    "columns": False,
+    "calc": True,
+    "calc_columns": True,
+    "agg_columns": True,
+    "lat_lon_columns": True,
+}
+
+
+def normalize_params(**params):
+    """
+    normalize_params: canonical version of the parameters of a request. The
+    file lists are sorted, the bbox values are converted to float and the
+    empty values are converted to None, so equivalent requests have the same
+    parameters.
+
+    Args:
+        **params: the parameters of the request, with the default values filled
+
+    Returns:
+        dict: the normalized parameters
+    """
+    normalized = {}
+    for key, value in params.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value in ("", None):
+            value = None
+        elif key in LIST_PARAMS and isinstance(value, str):
+            value = [item.strip() for item in value.split(",") if item.strip()]
+            if not LIST_PARAMS[key]:
+                value = sorted(set(value))
+        elif key == "bbox":
+            value = [float(limit) for limit in value.split(",")]
+        elif key == "crs":
+            value = value.lower()
+        normalized[key] = value
+    return normalized
+
+
+def request_hash(params: dict, versions: dict = None):
+    """
+    request_hash: hash of the normalized parameters and the versions of the files
+
+    Args:
+        params (dict): normalized parameters, created by normalize_params
+        versions (dict, optional): versions of the files, created by
+            GetBucket.get_versions. Defaults to None.
+
+    Returns:
+        str: a sha256 hex digest that represents the request
+    """
+    if versions:
+        versions = {
+            filename: version["version"] for filename, version in versions.items()
+        }
+    content = json.dumps(
+        {"params": params, "versions": versions}, sort_keys=True, default=str
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def encode_cursor(dataset: str, version: str, offset: int):
+    """
+    encode_cursor: opaque cursor of a page of a dataset
+
+    Args:
+        dataset (str): hash of the parameters that define the dataset
+        version (str): hash of the versions of the files of the dataset
+        offset (int): first row of the page
+
+    Returns:
+        str: the cursor, safe to be used on urls
+    """
+    content = json.dumps([dataset, version, offset], separators=(",", ":"))
+    return base64.urlsafe_b64encode(content.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str):
+    """
+    decode_cursor: dataset, version and offset of a cursor
+
+    Args:
+        cursor (str): cursor created by encode_cursor
+
+    Raises:
+        ValueError: if the cursor is not valid
+
+    Returns:
+        tuple: the dataset, the version and the offset
+    """
+    try:
+        dataset, version, offset = json.loads(base64.urlsafe_b64decode(cursor))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return dataset, version, offset
@@ -0,0 +1,118 @@
+"""
+  ResultCache Class: in memory cache for the results of the API, with
+  time to live and a maximum number of entries (least recently used)
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class ResultCache:
+    """
+    ResultCache class for cache the results of the API
+
+    The entries expire after ttl seconds. When the cache is full, the least
+    recently used entry is removed. The values are shared between the requests,
+    so they should not be changed after they are added to the cache.
+
+    This class has the following methods:
+        * get: get a value from the cache
+        * set: add a value to the cache
+        * clear: remove all the values from the cache
+        * stats: hits, misses and size of the cache
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        """
+        ResultCache class constructor. The default values can be set by the
+        ENV variables:
+        - CALC_CACHE_SIZE: maximum number of entries (128)
+        - CALC_CACHE_TTL: time to live of the entries in seconds (600)
+
+        Args:
+        max_entries (int, optional): maximum number of entries. A value of 0
+            disables the cache. Defaults to None.
+        ttl (float, optional): time to live of the entries in seconds. Defaults to None.
+        """
+        if max_entries is None:
+            max_entries = int(os.environ.get("CALC_CACHE_SIZE", 128))
+        if ttl is None:
+            ttl = float(os.environ.get("CALC_CACHE_TTL", 600))
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        """
+        get: get a value from the cache
+
+        Args:
+            key (str): key of the value
+
+        Returns:
+            the value, or None if it is not in the cache or it is expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value):
+        """
+        set: add a value to the cache
+
+        Args:
+            key (str): key of the value
+            value: value that will be saved
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        clear: remove all the values from the cache
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        stats: hits, misses and size of the cache
+
+        Returns:
+            dict: the statistics of the cache
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
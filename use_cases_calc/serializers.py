@@ -0,0 +1,263 @@
+"""
+  Functions for serialize the responses of the data and calc endpoints to json
+  bytes, the frames of the data endpoints in batches of rows, so the responses
+  can be streamed, and the frames to binary formats (Arrow, Parquet) and csv
+"""
+import datetime
+import decimal
+import io
+import os
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# media type of each stream format
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+# media type of each frame format
+FRAME_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+    "csv": "text/csv",
+}
+
+# kinds of the values (by pandas infer_dtype) of the numeric columns
+NUMERIC_KINDS = ("integer", "floating", "mixed-integer-float")
+
+# numpy arrays and scalars, dataclasses, datetimes and non string keys are
+# serialized by orjson. NaN and infinity are serialized as null.
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def default(value):
+    """
+    default: convert the values that orjson can not serialize
+
+    Args:
+        value (object): the value
+
+    Raises:
+        TypeError: if the value can not be converted
+
+    Returns:
+        object: a value that orjson can serialize
+    """
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, (pd.Timedelta, datetime.timedelta)):
+        return value.total_seconds()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def native_keys(content):
+    """
+    native_keys: convert the numpy keys of the dicts of a response to python values
+
+    Args:
+        content (object): the response
+
+    Returns:
+        object: the response with python keys
+    """
+    if isinstance(content, dict):
+        return {
+            key.item() if isinstance(key, np.generic) else key: native_keys(value)
+            for key, value in content.items()
+        }
+    if isinstance(content, (list, tuple)):
+        return [native_keys(value) for value in content]
+    return content
+
+
+def dumps(content):
+    """
+    dumps: serialize a response to json bytes with orjson, without walking the
+    values in python. The keys of responses with numpy keys are converted first.
+
+    Args:
+        content (object): the response
+
+    Returns:
+        bytes: the json
+    """
+    try:
+        return orjson.dumps(content, default=default, option=ORJSON_OPTIONS)
+    except TypeError:
+        return orjson.dumps(
+            native_keys(content), default=default, option=ORJSON_OPTIONS
+        )
+
+
+def iter_batches(df: pd.DataFrame, batch_rows: int = None):
+    """
+    iter_batches: split a frame in batches of rows. The size of the batches can
+    be set by the ENV variable STREAM_BATCH_ROWS (10000).
+
+    Args:
+        df (pd.DataFrame): the frame
+        batch_rows (int, optional): number of rows of each batch. Defaults to None.
+
+    Yields:
+        pd.DataFrame: the batches, without copy of the data
+    """
+    if batch_rows is None:
+        batch_rows = int(os.environ.get("STREAM_BATCH_ROWS", 10000))
+    batch_rows = max(batch_rows, 1)
+    for start in range(0, len(df), batch_rows):
+        stop = start + batch_rows
+        yield df.iloc[start:stop]
+
+
+def iter_json(df: pd.DataFrame, stream: str = "ndjson", batch_rows: int = None):
+    """
+    iter_json: serialize a frame as json records, one batch of rows at a time.
+    With stream 'ndjson' each record is a line, and with stream 'json' the
+    records are the items of a json array. Missing values are null.
+
+    Args:
+        df (pd.DataFrame): the frame
+        stream (str, optional): 'ndjson' or 'json'. Defaults to 'ndjson'.
+        batch_rows (int, optional): number of rows of each batch. Defaults to None.
+
+    Yields:
+        bytes: the json of each batch
+    """
+    first = True
+    if stream == "json":
+        yield b"["
+    for batch in iter_batches(df, batch_rows):
+        if stream == "json":
+            records = batch.to_json(orient="records", double_precision=15)[1:-1]
+            if records:
+                yield (records if first else "," + records).encode()
+                first = False
+        else:
+            yield batch.to_json(
+                orient="records", lines=True, double_precision=15
+            ).rstrip("\n").encode() + b"\n"
+    if stream == "json":
+        yield b"]"
+
+
+def frame_format(file_format: str = None, accept: str = None):
+    """
+    frame_format: format of a frame response, by the format parameter or, if it is
+    not defined, by the media types of the Accept header
+
+    Args:
+        file_format (str, optional): arrow, parquet, csv or json. Defaults to None.
+        accept (str, optional): Accept header of the request. Defaults to None.
+
+    Raises:
+        ValueError: if the format is not valid
+
+    Returns:
+        str: the format, or None for json
+    """
+    if file_format:
+        if file_format == "json":
+            return None
+        if file_format not in FRAME_MEDIA_TYPES:
+            raise ValueError(
+                f"format should be one of {list(FRAME_MEDIA_TYPES) + ['json']}"
+            )
+        return file_format
+    media_types = [media.split(";")[0].strip() for media in (accept or "").split(",")]
+    for name, media_type in FRAME_MEDIA_TYPES.items():
+        if media_type in media_types:
+            return name
+    return None
+
+
+def numeric_gaps(df: pd.DataFrame):
+    """
+    numeric_gaps: convert the object columns that have numbers and empty strings,
+    like the numeric columns of the merged files after fillna(""), to float
+    columns, with NaN in the gaps
+
+    Args:
+        df (pd.DataFrame): the frame
+
+    Returns:
+        tuple: the frame and the names of the converted columns
+    """
+    converted = {}
+    for column in df.columns[(df.dtypes == object).to_numpy()].unique():
+        values = df[column]
+        if not isinstance(values, pd.Series):
+            continue
+        gaps = values.eq("")
+        if gaps.any() and not gaps.all():
+            kind = pd.api.types.infer_dtype(values[~gaps], skipna=True)
+            if kind in NUMERIC_KINDS:
+                converted[column] = pd.to_numeric(values.mask(gaps))
+    if converted:
+        df = df.copy(deep=False)
+        for column, values in converted.items():
+            df[column] = values
+    return df, list(converted)
+
+
+def arrow_table(df: pd.DataFrame):
+    """
+    arrow_table: convert a frame to an Arrow table, without the index. The gaps
+    of the numeric columns are nulls, and the other object columns with mixed
+    types (like numbers and text) are converted to text.
+
+    Args:
+        df (pd.DataFrame): the frame
+
+    Returns:
+        pa.Table: the table
+    """
+    df, _ = numeric_gaps(pd.DataFrame(df))
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        mixed = df.select_dtypes(include="object").columns
+        df = df.astype({column: "string" for column in mixed})
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def frame_bytes(df: pd.DataFrame, file_format: str):
+    """
+    frame_bytes: serialize a frame as an Arrow IPC stream, Parquet or csv
+
+    Args:
+        df (pd.DataFrame): the frame
+        file_format (str): arrow, parquet or csv
+
+    Returns:
+        bytes: the serialized frame
+    """
+    if file_format == "csv":
+        return df.to_csv(index=False).encode()
+    table = arrow_table(df)
+    if file_format == "parquet":
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer)
+        return buffer.getvalue()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,303 @@
+"""
+  SharedResultCache Class: cache of the results of the API on a database
+  (Postgres, or SQLite for local tests), shared by all the instances of the API
+  and kept when they restart
+"""
+import datetime
+import os
+import sys
+import threading
+import time
+import zlib
+
+import orjson
+import sqlalchemy
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from use_cases_calc.serializers import dumps
+from use_cases_calc.tracing import logger
+
+load_dotenv()
+
+# time, in seconds, that the number of results on the database is kept by stats
+ENTRIES_TTL = 60
+
+# the table is created by the alembic migrations, like the tables of db.db, and
+# by the cache when it connects to a database without it. It has its own
+# metadata, so it is defined without connecting to DATABASE_URL
+metadata = sqlalchemy.MetaData()
+
+calc_results = sqlalchemy.Table(
+    "calc_results",
+    metadata,
+    sqlalchemy.Column("request", sqlalchemy.String(64), primary_key=True),
+    sqlalchemy.Column("version", sqlalchemy.String(64), primary_key=True),
+    sqlalchemy.Column("result", sqlalchemy.LargeBinary, nullable=False),
+    sqlalchemy.Column("size", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("created_at", sqlalchemy.DateTime(timezone=True), nullable=False),
+    sqlalchemy.Column(
+        "expires_at", sqlalchemy.DateTime(timezone=True), nullable=False, index=True
+    ),
+)
+
+
+def utc_now():
+    """
+    utc_now: current time, in UTC
+
+    Returns:
+        datetime.datetime: the current time
+    """
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class SharedResultCache:
+    """
+    SharedResultCache class for cache the results of the API on a database
+
+    A result is identified by the hash of the normalized request and the
+    version of the files of the request (like request_hash of the versions).
+    The results are saved as compressed json, and only the last version of
+    each request is kept. The entries expire after ttl seconds, and the expired
+    entries are purged at most every purge_interval seconds by the instance
+    that saves a result. The cache is disabled when the url of the database is
+    not set, and the database is only connected when it is first used. The
+    table is created when it connects, if it does not exist, so the cache can
+    use a database that is not migrated by alembic. When the
+    database fails, the cache is skipped for retry_after seconds, so the
+    requests are calculated instead of waiting for the database.
+
+    This class has the following methods:
+        * get: get a result from the cache
+        * set: save a result in the cache
+        * purge: remove the expired results, or all the results, from the cache
+        * stats: hits, misses, writes and errors of the cache
+    """
+
+    def __init__(
+        self,
+        url: str = None,
+        ttl: float = None,
+        level: int = None,
+        purge_interval: float = None,
+        retry_after: float = 30,
+    ):
+        """
+        SharedResultCache class constructor. The default values can be set by
+        the ENV variables:
+        - RESULTS_CACHE_URL: url of the database, like DATABASE_URL. The cache
+          is disabled when it is not set
+        - RESULTS_CACHE_TTL: time to live of the results in seconds (86400)
+        - RESULTS_CACHE_LEVEL: zlib compression level of the results (6)
+        - RESULTS_CACHE_PURGE_INTERVAL: time, in seconds, between the purges of
+          the expired results (3600)
+
+        Args:
+        url (str, optional): url of the database. Defaults to None.
+        ttl (float, optional): time to live of the results in seconds.
+            Defaults to None.
+        level (int, optional): compression level of the results. Defaults to None.
+        purge_interval (float, optional): time between the purges of the
+            expired results. Defaults to None.
+        retry_after (float, optional): time that the cache is skipped after an
+            error of the database. Defaults to 30.
+        """
+        if url is None:
+            url = os.environ.get("RESULTS_CACHE_URL", "")
+        if ttl is None:
+            ttl = float(os.environ.get("RESULTS_CACHE_TTL", 86400))
+        if level is None:
+            level = int(os.environ.get("RESULTS_CACHE_LEVEL", 6))
+        if purge_interval is None:
+            purge_interval = float(os.environ.get("RESULTS_CACHE_PURGE_INTERVAL", 3600))
+        self.url = url
+        self.ttl = ttl
+        self.level = level
+        self.purge_interval = purge_interval
+        self.retry_after = retry_after
+
+        self._engine = None
+        self._lock = threading.Lock()
+        self._last_purge = time.monotonic()
+        self._failed_at = None
+        self._entries = (0, None)
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self.purged = 0
+
+    @property
+    def enabled(self):
+        """
+        enabled: if the cache has a database and it is not failing
+
+        Returns:
+            bool: if the cache is used
+        """
+        if not self.url:
+            return False
+        failed_at = self._failed_at
+        return failed_at is None or time.monotonic() - failed_at > self.retry_after
+
+    def _connect(self):
+        with self._lock:
+            if self._engine is None:
+                engine = sqlalchemy.create_engine(self.url, pool_pre_ping=True)
+                # the table of the migrations is kept, and created if it is missing
+                metadata.create_all(engine, checkfirst=True)
+                self._engine = engine
+            return self._engine
+
+    def _failed(self, action: str, error: Exception):
+        with self._lock:
+            self.errors += 1
+            self._failed_at = time.monotonic()
+        logger.warning("shared result cache %s failed: %s", action, error)
+
+    def get(self, request: str, version: str):
+        """
+        get: get a result from the cache
+
+        Args:
+            request (str): hash of the normalized request
+            version (str): hash of the versions of the files of the request
+
+        Returns:
+            the result, or None if it is not in the cache, it is expired or the
+            cache is disabled
+        """
+        if not self.enabled or not version:
+            return None
+        query = sqlalchemy.select(calc_results.c.result).where(
+            calc_results.c.request == request,
+            calc_results.c.version == version,
+            calc_results.c.expires_at > utc_now(),
+        )
+        try:
+            with self._connect().connect() as connection:
+                content = connection.execute(query).scalar()
+            result = None
+            if content is not None:
+                result = orjson.loads(zlib.decompress(content))
+        except (SQLAlchemyError, zlib.error, orjson.JSONDecodeError) as error:
+            self._failed("get", error)
+            return None
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def set(self, request: str, version: str, result):
+        """
+        set: save a result in the cache, replacing the other versions of the
+        request
+
+        Args:
+            request (str): hash of the normalized request
+            version (str): hash of the versions of the files of the request
+            result: the result, that can be serialized to json
+        """
+        if not self.enabled or not version:
+            return
+        content = dumps(result)
+        now = utc_now()
+        try:
+            with self._connect().begin() as connection:
+                connection.execute(
+                    calc_results.delete().where(calc_results.c.request == request)
+                )
+                connection.execute(
+                    calc_results.insert().values(
+                        request=request,
+                        version=version,
+                        result=zlib.compress(content, self.level),
+                        size=len(content),
+                        created_at=now,
+                        expires_at=now + datetime.timedelta(seconds=self.ttl),
+                    )
+                )
+        except IntegrityError:
+            # another instance saved the same result first
+            return
+        except SQLAlchemyError as error:
+            self._failed("set", error)
+            return
+        with self._lock:
+            self.writes += 1
+            purge = time.monotonic() - self._last_purge > self.purge_interval
+            if purge:
+                self._last_purge = time.monotonic()
+        if purge:
+            self.purge()
+
+    def purge(self, expired_only: bool = True):
+        """
+        purge: remove the expired results, or all the results, from the cache
+        with one statement
+
+        Args:
+            expired_only (bool, optional): remove only the expired results.
+                Defaults to True.
+
+        Returns:
+            int: number of results removed
+        """
+        if not self.url:
+            return 0
+        statement = calc_results.delete()
+        if expired_only:
+            statement = statement.where(calc_results.c.expires_at <= utc_now())
+        try:
+            with self._connect().begin() as connection:
+                removed = connection.execute(statement).rowcount
+        except SQLAlchemyError as error:
+            self._failed("purge", error)
+            return 0
+        with self._lock:
+            self.purged += removed
+            self._entries = (0, None)
+        return removed
+
+    def stats(self):
+        """
+        stats: hits, misses, writes and errors of the cache, and the number of
+        results on the database. The number of results is counted at most every
+        ENTRIES_TTL seconds, so the metrics do not count the table every time.
+
+        Returns:
+            dict: the statistics of the cache
+        """
+        entries, counted_at = self._entries
+        if self.enabled and (
+            counted_at is None or time.monotonic() - counted_at > ENTRIES_TTL
+        ):
+            query = sqlalchemy.select(sqlalchemy.func.count()).select_from(calc_results)
+            try:
+                with self._connect().connect() as connection:
+                    entries = connection.execute(query).scalar()
+                self._entries = (entries, time.monotonic())
+            except SQLAlchemyError as error:
+                self._failed("stats", error)
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "enabled": bool(self.url),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / requests if requests else 0.0,
+                "writes": self.writes,
+                "errors": self.errors,
+                "purged": self.purged,
+                "entries": entries,
+                "ttl": self.ttl,
+            }
+
+
+if __name__ == "__main__":
+    # purge the expired results, for example from a scheduled job:
+    # python -m use_cases_calc.shared_cache [--all]
+    print(SharedResultCache().purge(expired_only="--all" not in sys.argv))
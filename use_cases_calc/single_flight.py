@@ -0,0 +1,94 @@
+"""
+  SingleFlight Class: class for share one in-flight computation between the
+  concurrent calls with the same key
+"""
+import threading
+
+
+class _Call:
+    """
+    _Call: in-flight computation of a key
+    """
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    SingleFlight class for share one in-flight computation between the
+    concurrent calls with the same key. The first call (the leader) runs the
+    function, and the calls that arrive while it runs wait for it and receive
+    its result, or its exception. Nothing is kept after the computation ends, so
+    it does not replace the caches.
+
+    This class has the following methods:
+        * do: run a function, or wait for the in-flight run of the same key
+        * stats: number of runs, shared calls and keys in flight
+    """
+
+    def __init__(self):
+        """
+        SingleFlight class constructor
+        """
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        do: run a function, or wait for the in-flight run of the same key
+
+        Args:
+            key (hashable): key of the computation
+            function (callable): the computation
+            *args: arguments of the function
+            **kwargs: keyword arguments of the function
+
+        Returns:
+            the result of the function
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """
+        stats: number of runs, shared calls and keys in flight
+
+        Returns:
+            dict: the statistics
+        """
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "shared": self.shared,
+                "in_flight": len(self._calls),
+            }
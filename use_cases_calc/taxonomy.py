@@ -0,0 +1,127 @@
+"""
+  TaxonomyRegistry Class: class for detect the organism columns of the
+  surveys, with a cache of the columns of each schema
+"""
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from use_cases_calc.organisms import all_organisms, all_organisms2
+
+load_dotenv()
+
+TaxonSchema = namedtuple("TaxonSchema", ["name", "columns", "positions"])
+
+
+class TaxonomyRegistry:
+    """
+    TaxonomyRegistry class for detect the organism columns of the surveys
+
+    The registry has a list of taxa for each survey naming scheme. The organism
+    columns of a schema (the columns of a dataset) are detected once, and the
+    result is cached with the integer positions of the columns, so the
+    calculations can slice the organism matrix directly.
+
+    This class has the following methods:
+        * register: add a list of taxa to the registry
+        * resolve: get the organism columns of a schema
+    """
+
+    def __init__(self, taxa: dict = None, max_schemas: int = 256):
+        """
+        TaxonomyRegistry class constructor
+
+        Args:
+            taxa (dict, optional): lists of taxa by name, in order of priority.
+                Defaults to None.
+            max_schemas (int, optional): maximum number of schemas in the cache.
+                Defaults to 256.
+        """
+        self._taxa = OrderedDict()
+        self._schemas = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_schemas = max_schemas
+        for name, organisms in (taxa or {}).items():
+            self.register(name, organisms)
+
+    def register(self, name: str, organisms: list):
+        """
+        register: add a list of taxa to the registry. The lists are tried in the
+        order they were registered.
+
+        Args:
+            name (str): name of the list
+            organisms (list): names of the organism columns
+        """
+        with self._lock:
+            self._taxa[name] = list(organisms)
+            self._schemas.clear()
+
+    def resolve(self, columns):
+        """
+        resolve: get the organism columns of a schema. The first list of taxa with
+        all the columns in the schema is used. If the names do not match, the names
+        are compared without case.
+
+        Args:
+            columns (list): columns of the dataset
+
+        Raises:
+            KeyError: if none of the lists of taxa are in the columns
+
+        Returns:
+            TaxonSchema: name of the list of taxa, names and positions of the columns
+        """
+        schema = tuple(columns)
+        with self._lock:
+            taxon_schema = self._schemas.get(schema)
+            if taxon_schema is not None:
+                self._schemas.move_to_end(schema)
+                return taxon_schema
+            taxa = list(self._taxa.items())
+
+        taxon_schema = self._detect(schema, taxa)
+        with self._lock:
+            self._schemas[schema] = taxon_schema
+            while len(self._schemas) > self.max_schemas:
+                self._schemas.popitem(last=False)
+        return taxon_schema
+
+    @staticmethod
+    def _detect(schema: tuple, taxa: list):
+        positions = {column: i for i, column in enumerate(schema)}
+        lower_positions = {}
+        for i, column in enumerate(schema):
+            lower_positions.setdefault(str(column).lower(), i)
+
+        for lookup, normalize in ((positions, str), (lower_positions, str.lower)):
+            for name, organisms in taxa:
+                keys = [normalize(organism) for organism in organisms]
+                if all(key in lookup for key in keys):
+                    found = np.array([lookup[key] for key in keys], dtype=np.intp)
+                    return TaxonSchema(name, [schema[i] for i in found], found)
+        raise KeyError(f"None of the lists of taxa are in the columns: {list(schema)}")
+
+
+def load_taxa():
+    """
+    load_taxa: lists of taxa of the registry. Besides the lists of organisms.py,
+    other lists can be added by a json file, defined by the ENV variable
+    TAXONOMY_FILE, with the format {"name": ["organism1", "organism2"]}
+
+    Returns:
+        dict: lists of taxa by name
+    """
+    taxa = {"all_organisms": all_organisms, "all_organisms2": all_organisms2}
+    taxonomy_file = os.environ.get("TAXONOMY_FILE")
+    if taxonomy_file:
+        with open(taxonomy_file, encoding="utf-8") as taxa_file:
+            taxa.update(json.load(taxa_file))
+    return taxa
+
+
+taxonomy = TaxonomyRegistry(load_taxa())
@@ -0,0 +1,578 @@
+"""
+  Tiered cache: cache of bytes in memory, with a byte budget, and in a local
+  folder, compressed, in front of an origin (like the object store). The
+  entries evicted from memory are demoted to the disk, and the entries found on
+  the disk are promoted to memory, and kept on the disk.
+
+  This module contains the following classes:
+    * MemoryTier: tier of the entries in memory, with a byte budget
+    * DiskTier: tier of the compressed entries in a local folder
+    * TieredCache: cache of bytes with a memory and a disk tier
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from use_cases_calc.tracing import logger
+
+load_dotenv()
+
+# errors of a file of the disk tier that can not be read
+READ_ERRORS = (OSError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ())
+
+# codecs of the files of the disk tier
+CODECS = ("zst", "zz")
+
+# age, in seconds, of the temporary files left by the processes that stopped
+# while they were writing. The younger ones are being written by other processes.
+STALE_TEMPORARY_SECONDS = 3600
+
+# time, in seconds, between the scans of the folder of the disk tier, that find
+# the entries written and removed by the other processes
+SCAN_SECONDS = 30
+
+
+class MemoryTier:
+    """
+    MemoryTier class for keep entries of bytes in memory, up to a number of
+    bytes. When it is full, the least recently used entries are removed and
+    returned, so they can be demoted to the next tier.
+
+    This class has the following methods:
+        * get: get an entry
+        * put: add an entry, and return the entries removed
+        * pop: remove an entry
+        * stats: hits, misses, evictions and size of the tier
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        MemoryTier class constructor
+
+        Args:
+            max_bytes (int): maximum number of bytes of the entries. A value of
+                0 disables the tier.
+        """
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        """
+        get: get an entry
+
+        Args:
+            key (str): key of the entry
+
+        Returns:
+            bytes: the entry, or None if it is not in the tier
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: bytes):
+        """
+        put: add an entry. An entry larger than the tier is not added.
+
+        Args:
+            key (str): key of the entry
+            value (bytes): the entry
+
+        Returns:
+            list: the entries removed to make room, as (key, value), and the
+            entry itself if it is larger than the tier
+        """
+        if len(value) > self.max_bytes:
+            return [(key, value)]
+        removed = []
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= len(previous)
+            self._entries[key] = value
+            self.bytes += len(value)
+            while self.bytes > self.max_bytes:
+                old_key, old_value = self._entries.popitem(last=False)
+                self.bytes -= len(old_value)
+                self.evictions += 1
+                removed.append((old_key, old_value))
+        return removed
+
+    def pop(self, key: str):
+        """
+        pop: remove an entry
+
+        Args:
+            key (str): key of the entry
+        """
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                self.bytes -= len(value)
+
+    def stats(self):
+        """
+        stats: hits, misses, evictions and size of the tier
+
+        Returns:
+            dict: the statistics of the tier
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class DiskTier:
+    """
+    DiskTier class for keep compressed entries of bytes in a local folder, up
+    to a number of bytes on the disk. The entries are compressed with zstd, if
+    zstandard is installed, or with zlib. When it is full, the least recently
+    used entries are deleted. The entries of the folder are found again when
+    the API restarts.
+
+    The folder can be shared by the processes of the API (the workers): the
+    entries written by a process are used by the others, and the budget is of
+    the whole folder. The folder is scanned again every SCAN_SECONDS, so the
+    budget is kept with the entries of all the processes. The entries that can
+    not be written (like when the disk is full) are not kept.
+
+    This class has the following methods:
+        * get: get an entry
+        * put: add an entry
+        * contains: if an entry is in the tier
+        * pop: remove an entry
+        * stats: hits, misses, evictions and size of the tier
+    """
+
+    def __init__(self, directory: str, max_bytes: int, level: int = 3):
+        """
+        DiskTier class constructor
+
+        Args:
+            directory (str): folder of the entries
+            max_bytes (int): maximum number of bytes of the compressed entries.
+                A value of 0 disables the tier.
+            level (int, optional): compression level. Defaults to 3.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.level = level
+        self.codec = "zst" if zstandard is not None else "zz"
+        self.bytes = 0
+        self.raw_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._scanned_at = 0.0
+        if self.max_bytes > 0:
+            try:
+                os.makedirs(directory, exist_ok=True)
+                self._scan()
+            except OSError as error:
+                logger.warning("disk cache %s disabled: %s", directory, error)
+                self.max_bytes = 0
+
+    def _scan(self):
+        # the entries of the folder, from the least recently used (the files
+        # are touched when they are used)
+        files = []
+        now = time.time()
+        with os.scandir(self.directory) as scanned:
+            for item in scanned:
+                stem, _, codec = item.name.rpartition(".")
+                try:
+                    stat = item.stat()
+                except OSError:
+                    # removed by another process
+                    continue
+                if codec == "tmp":
+                    if now - stat.st_mtime > STALE_TEMPORARY_SECONDS:
+                        self._remove(item.name)
+                elif codec in CODECS and (codec == "zz" or zstandard is not None):
+                    files.append((stat.st_mtime, stem, item.name, stat.st_size))
+        with self._lock:
+            entries = OrderedDict()
+            for _, stem, name, size in sorted(files):
+                previous = self._entries.get(stem)
+                raw_size = (
+                    previous[2] if previous and previous[:2] == (name, size) else None
+                )
+                entries[stem] = (name, size, raw_size)
+            self._entries = entries
+            self.bytes = sum(entry[1] for entry in entries.values())
+            self.raw_bytes = sum(entry[2] or 0 for entry in entries.values())
+            self._scanned_at = time.monotonic()
+
+    def _find(self, stem: str):
+        # an entry written by another process since the last scan
+        for codec in CODECS:
+            if codec == "zst" and zstandard is None:
+                continue
+            name = f"{stem}.{codec}"
+            try:
+                size = os.stat(self._path(name)).st_size
+            except OSError:
+                continue
+            with self._lock:
+                if stem not in self._entries:
+                    self._entries[stem] = (name, size, None)
+                    self.bytes += size
+                return self._entries[stem]
+        return None
+
+    def _remove(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def _path(self, name: str):
+        return os.path.join(self.directory, name)
+
+    def _compress(self, value: bytes):
+        if self.codec == "zst":
+            return zstandard.ZstdCompressor(level=self.level).compress(value)
+        return zlib.compress(value, min(self.level, 9))
+
+    @staticmethod
+    def _decompress(name: str, data: bytes):
+        if name.endswith(".zst"):
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    @staticmethod
+    def _stem(key: str):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key: str):
+        """
+        get: get an entry
+
+        Args:
+            key (str): key of the entry
+
+        Returns:
+            bytes: the entry, or None if it is not in the tier
+        """
+        if self.max_bytes <= 0:
+            return None
+        stem = self._stem(key)
+        with self._lock:
+            entry = self._entries.get(stem)
+            if entry is not None:
+                self._entries.move_to_end(stem)
+        if entry is None:
+            entry = self._find(stem)
+        if entry is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with open(self._path(entry[0]), "rb") as file:
+                value = self._decompress(entry[0], file.read())
+        except READ_ERRORS:
+            # a missing or damaged file is removed from the tier
+            self.pop(key)
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            # the order of use is kept by the modification time of the files
+            os.utime(self._path(entry[0]))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: bytes):
+        """
+        put: add an entry, compressed. An entry larger than the tier is not added.
+
+        Args:
+            key (str): key of the entry
+            value (bytes): the entry
+        """
+        if self.max_bytes <= 0:
+            return
+        data = self._compress(value)
+        if len(data) > self.max_bytes:
+            return
+        stem = self._stem(key)
+        name = f"{stem}.{self.codec}"
+        # written on a temporary file, so a partial file is never read
+        temporary = None
+        try:
+            handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            os.replace(temporary, self._path(name))
+        except OSError as error:
+            # the entry is not kept, and it is loaded again from the origin
+            if temporary is not None:
+                self._remove(os.path.basename(temporary))
+            with self._lock:
+                self.errors += 1
+            logger.warning("disk cache write of %s failed: %s", name, error)
+            return
+
+        if time.monotonic() - self._scanned_at > SCAN_SECONDS:
+            try:
+                self._scan()
+            except OSError as error:
+                logger.warning("disk cache scan failed: %s", error)
+        removed = []
+        with self._lock:
+            previous = self._entries.pop(stem, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+                self.raw_bytes -= previous[2] or 0
+            self._entries[stem] = (name, len(data), len(value))
+            self.bytes += len(data)
+            self.raw_bytes += len(value)
+            while self.bytes > self.max_bytes:
+                _, (old_name, size, raw_size) = self._entries.popitem(last=False)
+                self.bytes -= size
+                self.raw_bytes -= raw_size or 0
+                self.evictions += 1
+                removed.append(old_name)
+        for old_name in removed:
+            self._remove(old_name)
+
+    def contains(self, key: str):
+        """
+        contains: if an entry is in the tier, also if it was written by another
+        process
+
+        Args:
+            key (str): key of the entry
+
+        Returns:
+            bool: if the file of the entry exists
+        """
+        if self.max_bytes <= 0:
+            return False
+        stem = self._stem(key)
+        with self._lock:
+            entry = self._entries.get(stem)
+        if entry is not None and os.path.exists(self._path(entry[0])):
+            return True
+        return self._find(stem) is not None
+
+    def pop(self, key: str):
+        """
+        pop: remove an entry
+
+        Args:
+            key (str): key of the entry
+        """
+        with self._lock:
+            entry = self._entries.pop(self._stem(key), None)
+            if entry is not None:
+                self.bytes -= entry[1]
+                self.raw_bytes -= entry[2] or 0
+        if entry is not None:
+            self._remove(entry[0])
+
+    def stats(self):
+        """
+        stats: hits, misses, evictions and size of the tier
+
+        Returns:
+            dict: the statistics of the tier. The uncompressed bytes are only
+            known for the entries added by this process since it started.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "raw_bytes": self.raw_bytes,
+                "max_bytes": self.max_bytes,
+                "codec": self.codec,
+            }
+
+
+class TieredCache:
+    """
+    TieredCache class for cache bytes in memory and on the local disk, in
+    front of an origin
+
+    The entries loaded from the origin are added to memory. The entries evicted
+    from memory are demoted to the disk, compressed, and the entries found on the
+    disk are promoted to memory. The promoted entries are kept on the disk, that
+    can be shared by the processes of the API, and they are not written again
+    when they are evicted from memory. The budgets can be set by the ENV variables, with the name of the
+    cache as prefix (like FILE_CACHE_MEMORY_BYTES for the cache 'file'):
+    - <NAME>_CACHE_MEMORY_BYTES: maximum bytes in memory (256 MB)
+    - <NAME>_CACHE_DISK_BYTES: maximum compressed bytes on the disk (2 GB)
+    - <NAME>_CACHE_DIR: folder of the disk tier (a folder of the temporary folder)
+    - <NAME>_CACHE_LEVEL: compression level of the disk tier (3)
+
+    This class has the following methods:
+        * get: get an entry from the tiers
+        * set: add an entry to the tiers
+        * load: get an entry, loading it from the origin if it is not cached
+        * stats: statistics of each tier and of the origin
+    """
+
+    def __init__(
+        self,
+        name: str,
+        memory_bytes: int = None,
+        disk_bytes: int = None,
+        directory: str = None,
+        level: int = None,
+    ):
+        """
+        TieredCache class constructor
+
+        Args:
+            name (str): name of the cache, used by the ENV variables
+            memory_bytes (int, optional): maximum bytes in memory. Defaults to None.
+            disk_bytes (int, optional): maximum compressed bytes on the disk.
+                Defaults to None.
+            directory (str, optional): folder of the disk tier. Defaults to None.
+            level (int, optional): compression level of the disk tier.
+                Defaults to None.
+        """
+        prefix = f"{name.upper()}_CACHE_"
+        if memory_bytes is None:
+            memory_bytes = int(os.environ.get(f"{prefix}MEMORY_BYTES", 256 * 2**20))
+        if disk_bytes is None:
+            disk_bytes = int(os.environ.get(f"{prefix}DISK_BYTES", 2 * 2**30))
+        if directory is None:
+            directory = os.environ.get(
+                f"{prefix}DIR",
+                os.path.join(tempfile.gettempdir(), f"haig-fras-{name}-cache"),
+            )
+        if level is None:
+            level = int(os.environ.get(f"{prefix}LEVEL", 3))
+        self.name = name
+        self.memory = MemoryTier(memory_bytes)
+        self.disk = DiskTier(directory, disk_bytes, level)
+        self._lock = threading.Lock()
+        # entries in memory that were promoted from the disk
+        self._promoted = set()
+        self.origin_loads = 0
+        self.origin_bytes = 0
+        self.origin_seconds = 0.0
+
+    def get(self, key: str):
+        """
+        get: get an entry from the tiers. An entry found on the disk is promoted
+        to memory, and kept on the disk.
+
+        Args:
+            key (str): key of the entry
+
+        Returns:
+            bytes: the entry, or None if it is not cached
+        """
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        value = self.disk.get(key)
+        if value is not None and len(value) <= self.memory.max_bytes:
+            with self._lock:
+                self._promoted.add(key)
+            self._demote(self.memory.put(key, value))
+        return value
+
+    def set(self, key: str, value: bytes):
+        """
+        set: add an entry to memory, demoting the entries evicted to the disk
+
+        Args:
+            key (str): key of the entry
+            value (bytes): the entry
+        """
+        with self._lock:
+            self._promoted.discard(key)
+        self._demote(self.memory.put(key, value))
+
+    def _demote(self, entries: list):
+        for key, value in entries:
+            with self._lock:
+                promoted = key in self._promoted
+                self._promoted.discard(key)
+            # a promoted entry is written again only if it left the disk
+            if not promoted or not self.disk.contains(key):
+                self.disk.put(key, value)
+
+    def load(self, key: str, loader, *args, **kwargs):
+        """
+        load: get an entry, loading it from the origin if it is not cached
+
+        Args:
+            key (str): key of the entry
+            loader (callable): function that loads the entry from the origin
+            *args: arguments of the loader
+            **kwargs: keyword arguments of the loader
+
+        Returns:
+            bytes: the entry
+        """
+        value = self.get(key)
+        if value is None:
+            start = time.perf_counter()
+            value = loader(*args, **kwargs)
+            with self._lock:
+                self.origin_loads += 1
+                self.origin_bytes += len(value)
+                self.origin_seconds += time.perf_counter() - start
+            self.set(key, value)
+        return value
+
+    def stats(self):
+        """
+        stats: statistics of each tier and of the origin
+
+        Returns:
+            dict: hits, misses, evictions and size of the memory and disk tiers,
+            and loads, bytes and time of the origin
+        """
+        with self._lock:
+            origin = {
+                "loads": self.origin_loads,
+                "bytes": self.origin_bytes,
+                "seconds": self.origin_seconds,
+            }
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats(),
+            "origin": origin,
+        }
@@ -0,0 +1,162 @@
+"""
+  Tracing module: leveled logging and span timers of the stages of the
+  requests (fetch, parse, merge, clip, each calc type and serialization)
+"""
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger("haig_fras")
+logger.setLevel(os.environ.get("LOG_LEVEL", "WARNING").upper())
+
+# trace of the current request, None if the request is not traced
+current_trace = ContextVar("current_trace", default=None)
+
+
+def tracing_enabled():
+    """
+    tracing_enabled: if the requests are traced, by the ENV variable TRACING
+
+    Returns:
+        bool: True if the requests are traced
+    """
+    return os.environ.get("TRACING", "false").lower() in ("1", "true", "yes")
+
+
+def configure_logging():
+    """
+    configure_logging: write the log of the API on stderr, with the level of the
+    ENV variable LOG_LEVEL (WARNING)
+    """
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+        logger.addHandler(handler)
+
+
+class Trace:
+    """
+    Trace class for keep the time spent on each stage of a request
+
+    This class has the following methods:
+        * add: add the time of a stage
+        * merge: add the timings of another trace, like the trace of a process
+        * timings: number of spans and milliseconds of each stage
+        * server_timing: Server-Timing header of the timings
+    """
+
+    def __init__(self):
+        """
+        Trace class constructor
+        """
+        self.stages = {}
+
+    def add(self, name: str, seconds: float, count: int = 1):
+        """
+        add: add the time of a stage
+
+        Args:
+            name (str): name of the stage
+            seconds (float): time spent on the stage, in seconds
+            count (int, optional): number of spans of the time. Defaults to 1.
+        """
+        stage = self.stages.setdefault(name, [0, 0.0])
+        stage[0] += count
+        stage[1] += seconds
+
+    def merge(self, stages: dict):
+        """
+        merge: add the timings of another trace, like the trace of a process
+
+        Args:
+            stages (dict): the stages of the other trace
+        """
+        for name, (count, seconds) in stages.items():
+            self.add(name, seconds, count)
+
+    def timings(self):
+        """
+        timings: number of spans and milliseconds of each stage
+
+        Returns:
+            dict: count and ms of each stage
+        """
+        return {
+            name: {"count": count, "ms": round(seconds * 1000, 3)}
+            for name, (count, seconds) in self.stages.items()
+        }
+
+    def server_timing(self):
+        """
+        server_timing: Server-Timing header of the timings
+
+        Returns:
+            str: the header value, like 'fetch;dur=12.5, parse;dur=3.1'
+        """
+        return ", ".join(
+            f"{name.replace('.', '-')};dur={seconds * 1000:.1f}"
+            for name, (_, seconds) in self.stages.items()
+        )
+
+
+class _Span:
+    """
+    _Span: timer of a stage, added to a trace when it ends
+    """
+
+    __slots__ = ("name", "trace", "start")
+
+    def __init__(self, name: str, trace: Trace):
+        self.name = name
+        self.trace = trace
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        self.trace.add(self.name, seconds)
+        logger.debug("%s took %.1f ms", self.name, seconds * 1000)
+
+
+class _NullSpan:
+    """
+    _NullSpan: span of the requests that are not traced, that does nothing
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+
+NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """
+    span: timer of a stage of the current request. If the request is not
+    traced, it returns a span that does nothing, so the stages are not timed.
+
+    Args:
+        name (str): name of the stage, like fetch or calc.count
+
+    Returns:
+        context manager: the span
+    """
+    trace = current_trace.get()
+    if trace is None:
+        return NULL_SPAN
+    return _Span(name, trace)